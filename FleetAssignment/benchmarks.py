@@ -0,0 +1,209 @@
+"""
+Benchmarks for the fleet assignment model builders. They are not used by the views; run them from a shell, e.g.
+python manage.py shell -c "from FleetAssignment.benchmarks import benchmark_balance_constraints; print(benchmark_balance_constraints())"
+"""
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+from pyomo.environ import ConcreteModel, ConstraintList, Binary, Integers
+from pyomo.repn import generate_standard_repn
+
+from .utils import (ClockToMinutes, NodesGenerator, VariableY, BalanceConstraintBuilder,
+                    spilled_and_captured_variables, FlightInteractionIndex)
+
+
+def synthetic_fleet_problem(flights_number, fleets_number=6, stations_number=30, seed=0):
+    """
+    Builds a random one-day schedule and fleet table with the upload column layout, used for benchmarking.
+
+    Returns:
+    - flights_df with Flight Number, Origin, Departure, Destination, Arrival, Distance, Duration, Optional.
+    - fleets_df with Fleet Type, Number of Aircrafts, Number of Seats, Operating Cost Per Mile, as fleet_data saves it.
+    """
+    rng = np.random.default_rng(seed)
+    stations = [f"S{k:03d}" for k in range(stations_number)]
+    origins = np.arange(flights_number) % stations_number
+    destinations = (origins + rng.integers(1, stations_number, flights_number)) % stations_number
+    departures = rng.integers(5 * 60, 22 * 60, flights_number)
+    durations = rng.integers(45, 240, flights_number)
+    arrivals = (departures + durations) % (24 * 60)
+
+    flights_df = pd.DataFrame({
+        'Flight Number': 1000 + np.arange(flights_number),
+        'Origin': [stations[k] for k in origins],
+        'Departure': [f"{m // 60:02d}:{m % 60:02d}:00" for m in departures],
+        'Destination': [stations[k] for k in destinations],
+        'Arrival': [f"{m // 60:02d}:{m % 60:02d}:00" for m in arrivals],
+        'Distance': np.round(durations * 7.5, 1),
+        'Duration': durations,
+        'Optional': (rng.random(flights_number) < 0.1).astype(int),
+    })
+    fleets_df = pd.DataFrame({
+        'Fleet Type': [f"E{k + 1}" for k in range(fleets_number)],
+        'Number of Aircrafts': rng.integers(20, 80, fleets_number),
+        'Number of Seats': rng.integers(100, 300, fleets_number),
+        'Operating Cost Per Mile': np.round(rng.uniform(5, 15, fleets_number), 2),
+    })
+    return flights_df, fleets_df
+
+
+def synthetic_itineraries(flights_df, itineraries_number, seed=0):
+    """
+    Builds random itineraries of one to three flights of flights_df with the upload column layout
+    (Itinerary, Demand, Fare, Flights, Type), used for benchmarking.
+    """
+    rng = np.random.default_rng(seed)
+    flight_numbers = flights_df.iloc[:, 0].astype(str).to_numpy()
+    legs = rng.choice([1, 2, 3], itineraries_number, p=[0.5, 0.35, 0.15])
+    types = np.array(['non_stop', 'single_stop', 'double_stop'])[legs - 1]
+    types[(legs == 1) & (rng.random(itineraries_number) < 0.2)] = 'direct'
+
+    return pd.DataFrame({
+        'Itinerary': np.arange(1, itineraries_number + 1),
+        'Demand': rng.integers(5, 150, itineraries_number),
+        'Fare': np.round(rng.uniform(80, 600, itineraries_number), 2),
+        'Flights': [', '.join(rng.choice(flight_numbers, leg_number, replace=False)) for leg_number in legs],
+        'Type': types,
+    })
+
+
+def benchmark_balance_constraints(sizes=(250, 500, 1000, 2000), fleets_number=6, string_scan_limit=500):
+    """
+    Times writing the balance constraints with BalanceConstraintBuilder against the ground arc name scan it replaced.
+    The name scan is only timed up to string_scan_limit flights, and its constraints are checked to match.
+
+    Returns:
+    - DataFrame with one row per schedule size.
+    """
+    results = []
+    for size in sizes:
+        flights_df, fleets_df = synthetic_fleet_problem(size, fleets_number)
+        station_list = np.unique(flights_df['Origin'].to_list())
+        flights_list = flights_df['Flight Number'].astype(str).tolist()
+        fleet_list = fleets_df['Fleet Type'].tolist()
+
+        dep_arriv = ClockToMinutes(flights_df, 2, 4)
+        Nodes_df = NodesGenerator(flights_df, station_list, 0, 1, 3, 2, 4, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes()).get_nodes()
+        vars_y = VariableY(Nodes_df, station_list, fleet_list).get_y()
+
+        def build_model():
+            model = ConcreteModel()
+            model.x = pyo.Var(flights_list, fleet_list, within=Binary)
+            model.RON = pyo.Var(station_list, fleet_list, within=Integers, bounds=(0, None))
+            model.y = pyo.Var(vars_y, within=Integers, bounds=(0, None))
+            return model
+
+        model = build_model()
+        start = perf_counter()
+        BalanceConstraintBuilder(Nodes_df, fleet_list).add_balance_constraints(model)
+        indexed_seconds = perf_counter() - start
+
+        scan_seconds = None
+        if size <= string_scan_limit:
+            legacy = build_model()
+            legacy.balance = ConstraintList()
+            start = perf_counter()
+            for fleet in fleet_list:
+                for node in Nodes_df.index:
+                    city = Nodes_df.iloc[node-1]['city']
+                    city_nodes_df = Nodes_df[Nodes_df['city'] == city]
+                    first_node = city_nodes_df.index.values.min()
+                    last_node = city_nodes_df.index.values.max()
+                    y_sum = 0
+                    if first_node != last_node:
+                        y_sum = (sum([legacy.y[var_name] if (var_name.replace(",", "_").split('_')[1] == str(node)) & ((str(fleet)) in var_name) else 0 for var_name in vars_y])) +\
+                            (sum([-1*legacy.y[var_name] if (var_name.replace(",", "_").split('_')[0] == str(node)) & ((str(fleet)) in var_name) else 0 for var_name in vars_y]))
+                    legacy.balance.add(expr=y_sum +
+                                       sum(flight[1] * legacy.x[str(flight[0]), fleet] for flight in Nodes_df.iloc[node-1]['flights'])
+                                       + (legacy.RON[city, fleet] if node == first_node and node != last_node else -1 *
+                                          legacy.RON[city, fleet] if node == last_node and node != first_node else 0)
+                                       == 0)
+            scan_seconds = perf_counter() - start
+
+            def coefficients(constraint):
+                repn = generate_standard_repn(constraint.body)
+                return sorted((var.name, coef) for var, coef in zip(repn.linear_vars, repn.linear_coefs))
+
+            if [coefficients(c) for c in model.balance.values()] != [coefficients(c) for c in legacy.balance.values()]:
+                raise AssertionError(f"Balance constraints differ from the ground arc name scan for {size} flights")
+
+        results.append({'Flights': size, 'Fleets': fleets_number, 'Nodes': len(Nodes_df), 'Ground Arcs': len(vars_y),
+                        'Constraints': len(model.balance), 'Indexed (s)': round(indexed_seconds, 4),
+                        'String Scan (s)': None if scan_seconds is None else round(scan_seconds, 4)})
+
+    return pd.DataFrame(results)
+
+
+def benchmark_flight_interaction(sizes=((50, 300), (500, 7500), (2000, 30000)), fleets_number=6, recapture_ratio=0.9, nested_loop_limit=50):
+    """
+    Times writing the IFAM flight interaction constraints with FlightInteractionIndex against the nested
+    flight x itinerary x spill variable loops it replaced. The loops are only timed up to nested_loop_limit
+    flights, and their constraints are checked to match.
+
+    Parameters:
+    - sizes: list of (flights, itineraries).
+
+    Returns:
+    - DataFrame with one row per size.
+    """
+    results = []
+    for flights_number, itineraries_number in sizes:
+        flights_df, fleets_df = synthetic_fleet_problem(flights_number, fleets_number)
+        itineraries_df = synthetic_itineraries(flights_df, itineraries_number)
+        fleet_list = fleets_df['Fleet Type'].tolist()
+        fleet_capacities = list(zip(fleets_df['Fleet Type'], fleets_df['Number of Seats']))
+
+        spill = spilled_and_captured_variables(flights_df)
+        itineraries_df = spill.Itinraries_df_simplify(itineraries_df, 0, 3, 0, 1, 3, 4)
+        spilled_recaptured_vars = spill.spill_recaptured_variables_list(itineraries_df, 0)
+
+        def build_model():
+            model = ConcreteModel()
+            model.x = pyo.Var(flights_df.iloc[:, 0].astype(str).tolist(), fleet_list, within=Binary)
+            model.spilled_recaptured_vars = pyo.Var(spilled_recaptured_vars, within=Integers, bounds=(0, None))
+            return model
+
+        model = build_model()
+        start = perf_counter()
+        index = FlightInteractionIndex(flights_df, itineraries_df, 0, 0, 3, 1, spilled_recaptured_vars)
+        index_seconds = perf_counter() - start
+        start = perf_counter()
+        index.add_flight_interaction_constraints(model, fleet_capacities, recapture_ratio)
+        constraints_seconds = perf_counter() - start
+
+        loops_seconds = None
+        if flights_number <= nested_loop_limit:
+            legacy = build_model()
+            legacy.flight_interaction = ConstraintList()
+            start = perf_counter()
+            for idx1, flight in flights_df.iterrows():
+                spilled_passengers = sum(
+                    sum(legacy.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itineraries_df.iloc[idx, 0]) else 0 for t_p_r in spilled_recaptured_vars)
+                    if str(flight.iloc[0]) in (str(itineraries_df.iloc[idx, 3]).split(", ")) else 0
+                    for idx, itn in itineraries_df.iterrows())
+                recaptured_passengers = sum(
+                    sum(recapture_ratio * legacy.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[2] == str(itineraries_df.iloc[idx, 0]) else 0 for t_p_r in spilled_recaptured_vars)
+                    if str(flight.iloc[0]) in (str(itineraries_df.iloc[idx, 3]).split(", ")) else 0
+                    for idx, itn in itineraries_df.iterrows())
+                flight_unconstrained_demand = 0
+                for idx, itn in itineraries_df.iterrows():
+                    if str(flight.iloc[0]) in (str(itn.iloc[3]).split(", ")):
+                        flight_unconstrained_demand += itn.iloc[1]
+                flight_seats_available = sum((legacy.x[str(flight.iloc[0]), fleet.iloc[0]]) * fleet.iloc[2] for idx, fleet in fleets_df.iterrows())
+                legacy.flight_interaction.add(expr=spilled_passengers - recaptured_passengers >= flight_unconstrained_demand - flight_seats_available)
+            loops_seconds = perf_counter() - start
+
+            def standard_form(constraint):
+                repn = generate_standard_repn(constraint.body)
+                return (sorted((var.name, round(coef, 9)) for var, coef in zip(repn.linear_vars, repn.linear_coefs)), constraint.lower, constraint.upper)
+
+            if [standard_form(c) for c in model.flight_interaction.values()] != [standard_form(c) for c in legacy.flight_interaction.values()]:
+                raise AssertionError(f"Flight interaction constraints differ from the nested loops for {flights_number} flights")
+
+        results.append({'Flights': flights_number, 'Itineraries': itineraries_number, 'Spill Variables': len(spilled_recaptured_vars),
+                        'Index (s)': round(index_seconds, 4), 'Constraints (s)': round(constraints_seconds, 4),
+                        'Nested Loops (s)': None if loops_seconds is None else round(loops_seconds, 4)})
+
+    return pd.DataFrame(results)
@@ -1,5 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from SkyLinker.solvers import SOLVER_CHOICES, SolverConfig
 
 
 class ExcelUploadForm(forms.Form):
@@ -56,7 +57,85 @@ def create_solver_selection_form():
         label="Select Solver",
         error_messages={'required': 'Please choose Solver).'}
     )
-    
+    SolverSelectionForm.base_fields['mip_solver'] = forms.ChoiceField(
+        choices=SOLVER_CHOICES,
+        initial='gurobi',
+        label="MIP Solver",
+    )
+    SolverSelectionForm.base_fields['threads'] = forms.IntegerField(
+        label='Threads',
+        help_text='Leave empty to let the solver decide.',
+        min_value=1,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['time_limit'] = forms.FloatField(
+        label='Time Limit (seconds)',
+        help_text='Leave empty to solve without a wall-clock limit.',
+        min_value=1,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['mip_gap'] = forms.FloatField(
+        label='Relative MIP Gap Percentage',
+        help_text='Stop once the best solution is within this percentage of the optimum. Leave empty for the solver default.',
+        min_value=0,
+        max_value=100,
+        required=False,
+        widget=forms.NumberInput(attrs={'step': '0.01'})
+    )
+    SolverSelectionForm.base_fields['return_incumbent'] = forms.BooleanField(
+        label='Return the best solution found when the time limit is reached',
+        initial=True,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['persistent'] = forms.BooleanField(
+        label='Solve in memory',
+        help_text='Keep the model inside the solver instead of exchanging LP and solution files (HiGHS and Gurobi; CBC and GLPK always use files).',
+        initial=True,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['incremental'] = forms.BooleanField(
+        label='Re-optimize from the previous run',
+        help_text='FAM and IFAM hand the last solved schedule to the solver as a starting point; the result is still optimal.',
+        initial=False,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['keep_unaffected'] = forms.BooleanField(
+        label='Keep the fleet of the flights the edit did not touch',
+        help_text='Faster re-optimization that is not guaranteed to be optimal: only flights at the stations your edit changed may switch fleet.',
+        initial=False,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['aggregate_ground_arcs'] = forms.BooleanField(
+        label='Aggregate the ground arcs',
+        help_text='Write the aircraft on the ground as running totals of the flights instead of integer variables, keeping only the arcs that can bind.',
+        initial=True,
+        required=False,
+    )
+    SolverSelectionForm.base_fields['decompose'] = forms.BooleanField(
+        label='Solve independent fleet families in parallel',
+        help_text="FAM only, not with re-optimizing: fleets that share no station and no flight (see the optional 'Allowed Fleets' flight column) are solved as separate models.",
+        initial=False,
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = forms.Form.clean(self)
+        if cleaned_data.get('keep_unaffected') and not cleaned_data.get('incremental'):
+            self.add_error('keep_unaffected', ValidationError("This option needs 'Re-optimize from the previous run'."))
+        if cleaned_data.get('decompose') and cleaned_data.get('incremental'):
+            self.add_error('decompose', ValidationError("Fleet families are solved from scratch, please untick either 'Re-optimize from the previous run' or this option."))
+        mip_solver = cleaned_data.get('mip_solver')
+        if mip_solver is None:
+            return cleaned_data
+        label = dict(SOLVER_CHOICES)[mip_solver]
+        if not SolverConfig.is_available(mip_solver):
+            self.add_error('mip_solver', ValidationError(f"{label} is not installed on this server."))
+        elif not SolverConfig(mip_solver, persistent=cleaned_data.get('persistent')).is_runnable():
+            self.add_error('persistent', ValidationError(f"{label} cannot solve in memory on this server. Untick 'Solve in memory' to exchange files instead."))
+        return cleaned_data
+
+    SolverSelectionForm.clean = clean
+
     return SolverSelectionForm
 
 class RecaptureRatioForm(forms.Form):
@@ -95,6 +174,54 @@ class DemandAdjustmentForm(forms.Form):
         widget=forms.NumberInput(attrs={'step': '0.1'})
     )
     
+class ScenarioSweepForm(forms.Form):
+    MAX_SCENARIOS = 64
+    MAX_LOCAL_SCENARIOS = 4  # Solved inside the request when no Celery broker is reachable
+
+    recapture_ratios = forms.CharField(
+        label='Recapture Ratios',
+        help_text='Comma separated values between 0 and 1, e.g. 0.7, 0.8, 0.9.',
+        initial='0.8, 0.9',
+    )
+    decrease_demand_percentages = forms.CharField(
+        label='Decrease in Demand Percentages',
+        help_text='Comma separated percentages between 0 and 100, e.g. 10, 15, 20.',
+        initial='15',
+    )
+    increase_demand_percentages = forms.CharField(
+        label='Increase in Demand Percentages',
+        help_text='Comma separated percentages between 0 and 100, e.g. 15, 20, 25.',
+        initial='20',
+    )
+
+    @staticmethod
+    def parse_values(text, max_value):
+        try:
+            values = [float(value) for value in text.replace(';', ',').split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError('Please enter numbers separated by commas.')
+        if not values:
+            raise ValidationError('Please enter at least one value.')
+        if any(value < 0 or value > max_value for value in values):
+            raise ValidationError(f'Every value must be between 0 and {max_value}.')
+        return list(dict.fromkeys(values))
+
+    def clean_recapture_ratios(self):
+        return self.parse_values(self.cleaned_data['recapture_ratios'], 1)
+
+    def clean_decrease_demand_percentages(self):
+        return self.parse_values(self.cleaned_data['decrease_demand_percentages'], 100)
+
+    def clean_increase_demand_percentages(self):
+        return self.parse_values(self.cleaned_data['increase_demand_percentages'], 100)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        grid = [cleaned_data.get(name) for name in ('recapture_ratios', 'decrease_demand_percentages', 'increase_demand_percentages')]
+        if all(grid) and len(grid[0]) * len(grid[1]) * len(grid[2]) > self.MAX_SCENARIOS:
+            raise ValidationError(f'The grid has more than {self.MAX_SCENARIOS} scenarios, please enter fewer values.')
+        return cleaned_data
+
 def create_optional_flights_form(flights_df, flight_no_col):
     class OptionalFlightsForm(forms.Form):
         has_optional_flights = forms.ChoiceField(
@@ -1,9 +1,9 @@
 import pyomo.environ as pyo
 from pyomo.environ import *
-from pyomo.opt import SolverFactory
 import pandas as pd
 import numpy as np
-from .utils import FlightColumnIndex, ItinColumnIndex, ClockToMinutes, FlightsCategorization, NodesGenerator, VariableY, VariableZ, spilled_and_captured_variables, flights_oeprating_costs, DemandCorrection
+from SkyLinker.solvers import SolverConfig
+from .utils import FlightColumnIndex, ItinColumnIndex, ClockToMinutes, FlightsCategorization, NodesGenerator, VariableY, BalanceConstraintBuilder, VariableZ, spilled_and_captured_variables, ItineraryParameters, FlightInteractionIndex, flights_oeprating_costs, DemandCorrection
 
 
 # ****************** Read Excel **************** #
@@ -173,6 +173,7 @@ itineraries_df=spilled_and_captured_variables.Itinraries_df_simplify(data1,itine
 itineraries_df.iloc[:, itinerary_no_col] = itineraries_df.iloc[:, itinerary_no_col].astype('int64')
 spilled_recaptured_vars=spilled_and_captured_variables.spill_recaptured_variables_list(data1, itineraries_df, itinerary_no_col)
 print(f"Variable t_p_r:\n{spilled_recaptured_vars}")
+itinerary_parameters = ItineraryParameters(itineraries_df, itinerary_no_col, demand_col, fare_col, flights_col, spilled_recaptured_vars)
 
 model.spilled_recaptured_vars = pyo.Var(spilled_recaptured_vars, within=Integers, bounds=(0, None))
 spilled_recaptured_vars = model.spilled_recaptured_vars
@@ -195,6 +196,7 @@ print(f'Itinerary Data Frame:\n{itineraries_df}\n')
 # ****************** Define Demand correction variable Delta Dqp **************** #
 demand_correction = DemandCorrection(itineraries_df, optional_itineraries, optional_flight, itinerary_no_col, flights_col, demand_col)
 demand_correction_factor_df = demand_correction.get_demand_correction_df()
+demand_corrections = demand_correction.get_demand_correction_lookup()
 print(f'Demand Correction Factor:\n{demand_correction_factor_df}\n')
 
 #__C__Operating costs
@@ -208,37 +210,20 @@ print(f'Unconstrained Revenue (R):\n{R_Unconstrained_Revenue}\n')
 
 
 # ****************** Calculate Spill Cost (S) **************** #
-S_Spill_Cost=sum(model.spilled_recaptured_vars[t_p_r] * itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == int(t_p_r.split('_')[1])).values , fare_col].values[0] for t_p_r in spilled_recaptured_vars)
+S_Spill_Cost=itinerary_parameters.spill_cost(model.spilled_recaptured_vars)
 
 print(f'Spill Cost (S):\n{S_Spill_Cost}\n')
 
 
 # ****************** Calculate Recaptured Revenue (M) **************** #
-M_Recaptured_Revenue=sum(model.spilled_recaptured_vars[t_p_r] * recapture_ratio * itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == int(t_p_r.split('_')[2])).values , fare_col].values[0] 
-            if t_p_r.split('_')[1] == str(r) and int(t_p_r.split('_')[2]) != len(itineraries_df)+1  
-            else 0 
-            for t_p_r in spilled_recaptured_vars   
-            for r in model.setp.data())
+M_Recaptured_Revenue=itinerary_parameters.recaptured_revenue(model.spilled_recaptured_vars, recapture_ratio)
 print(f'Recaptured Revenue (M):\n{M_Recaptured_Revenue}\n')
 
 
 # ****************** Calculate Unconstrained Revenue Loss (Delta R) **************** #
 optional_itineraries = np.array(optional_itineraries, dtype='int64')
-DeltaR_Uncontrained_Revenue_Loss = sum(
-    (
-        (itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values , demand_col].iloc[0] *
-         itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values , fare_col].iloc[0])
-        - sum(
-            (demand_correction_factor_df.loc[demand_correction_factor_df['name'] == f'D_{opt_iten}_{iten.iloc[itinerary_no_col]}', 'value'].iloc[0] *
-             itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == iten.iloc[itinerary_no_col]).values , fare_col].iloc[0])
-            if f'D_{opt_iten}_{iten.iloc[itinerary_no_col]}' in demand_correction_factor_df['name'].tolist()
-            else 0
-            for idx, iten in itineraries_df.iterrows()
-        )
-    ) *
-    (1 - model.z[f'z_{opt_iten}'])
-    for opt_iten in optional_itineraries
-)
+revenue_loss = itinerary_parameters.revenue_loss_coefficients(optional_itineraries, demand_corrections)
+DeltaR_Uncontrained_Revenue_Loss = sum(revenue_loss[opt_iten] * (1 - model.z[f'z_{opt_iten}']) for opt_iten in optional_itineraries)
 
 print(f'Unconstrained Revenue Loss (Delta R):\n{DeltaR_Uncontrained_Revenue_Loss}\n')
 
@@ -266,90 +251,13 @@ for e in model.setE:
     
     
 # ****************** Balance Constraint **************** #
-model.balance = ConstraintList()
-for fleet in model.setE:
-    for node in Nodes_df.index:
-
-        city = Nodes_df.iloc[node-1]['city']
-        city_nodes_df = Nodes_df[Nodes_df['city'] == city]
-
-        first_node = city_nodes_df.index.values.min()
-        last_node = city_nodes_df.index.values.max()
-
-        y_sum = 0
-
-# Assuming 'first_node', 'last_node' are defined
-        if first_node != last_node:
-            # Define the constraint using Pyomo syntax
-             y_sum = (sum([model.y[var_name] if (var_name.replace(",", "_").split('_')[1] == str(node)) & ((str(fleet)) in var_name) else 0 for var_name in var_y])) +\
-                (sum([-1*model.y[var_name] if (var_name.replace(",", "_").split('_')[0] == str(node)) &
-                 ((str(fleet)) in var_name) else 0 for var_name in var_y]))
-
-        model.balance.add(expr=y_sum +
-                          sum(flight[1] * model.x[str(flight[0]), fleet]
-                              for flight in Nodes_df.iloc[node-1]['flights'])
-                          + (RON[city, fleet] if node == first_node and node != last_node else -1 *
-                             model.RON[city, fleet] if node == last_node and node != first_node else 0)
-                          == 0)
+BalanceConstraintBuilder(Nodes_df, model.setE).add_balance_constraints(model)
         
 
 # ****************** Flight Interaction Constraint **************** # 
-model.flight_interaction = ConstraintList()
-
-
-for idx1, flight in flights_df.iterrows():
-
-    # Spilled passengers
-    spilled_passengers = sum(
-        sum(
-            model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itineraries_df.iloc[idx, itinerary_no_col]) else 0
-            for t_p_r in spilled_recaptured_vars
-        )
-        if str(flight.iloc[flight_no_col]) in (str(itineraries_df.iloc[idx, flights_col]).split(", "))
-        else 0
-        for idx, itn in itineraries_df.iterrows()   
-    )
-    
-    # Recaptured passengers
-    recaptured_passengers = sum(
-        sum(
-            recapture_ratio * model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[2] == str(itineraries_df.iloc[idx, itinerary_no_col]) else 0
-            for t_p_r in spilled_recaptured_vars
-        )
-        if str(flight.iloc[flight_no_col]) in (str(itineraries_df.iloc[idx, flights_col]).split(", "))
-        else 0
-        for idx, itn in itineraries_df.iterrows()   
-    )
-    
-    # Flight unconstrained demand
-    flight_unconstrained_demand = 0
-    for idx, itn in itineraries_df.iterrows():
-        if str(flight.iloc[flight_no_col]) in (str(itn.iloc[flights_col]).split(", ")):
-            flight_unconstrained_demand += itn.iloc[demand_col]
-
-    # Flight available seats
-    flight_seats_available = sum(
-        (model.x[str(flight.iloc[flight_no_col]), fleet.iloc[0]]) * fleet.iloc[2] for idx, fleet in fleets_df.iterrows()  ########### TAKE CARE FLEETS Index##############
-    )
-    
-    flight_demand_correction = sum(
-        sum(
-            (
-                (demand_correction_factor_df[demand_correction_factor_df['name'] == str(f'D_{opt_iten}_{itn.iloc[itinerary_no_col]}')]['value'].iloc[0]) *
-                (1 - model.z[f'z_{opt_iten}'])
-            )
-            if str(f'D_{opt_iten}_{itn.iloc[itinerary_no_col]}') in demand_correction_factor_df['name'].values
-            else 0
-            for opt_iten in optional_itineraries
-        )
-        if str(flight.iloc[flight_no_col]) in (str(itn.iloc[flights_col]).split(", "))
-        else 0
-        for idx, itn in itineraries_df.iterrows()
-    )
-    
-    print(f'Interaction constraind Demand correction part equation{idx1 + 1}:\n{flight_demand_correction}\n')
-
-    model.flight_interaction.add(expr= spilled_passengers - recaptured_passengers >= flight_unconstrained_demand + flight_demand_correction - flight_seats_available)
+flight_interaction_index = FlightInteractionIndex(flights_df, itineraries_df, flight_no_col, itinerary_no_col, flights_col, demand_col, list(spilled_recaptured_vars))
+fleet_capacities = list(zip(fleets_df.iloc[:, 0], fleets_df.iloc[:, 2]))
+flight_interaction_index.add_flight_interaction_constraints(model, fleet_capacities, recapture_ratio, demand_corrections, optional_itineraries)
            
 # ****************** Spill-Recapture & Demand Constraints **************** #
 model.demand = ConstraintList()
@@ -357,7 +265,7 @@ model.spill_recapture=ConstraintList()
 for itn in range(len(itineraries_df)):  
     
     itenrary=itineraries_df.iloc[itn, itinerary_no_col]
-    t_p_r__sum = sum(model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itenrary) else 0 for t_p_r in spilled_recaptured_vars) # from I_FAM
+    t_p_r__sum = sum(model.spilled_recaptured_vars[t_p_r] for t_p_r in itinerary_parameters.get_spills_from(itenrary)) # from I_FAM
     
     
     demand_correction_factor_sum = sum( 
@@ -394,9 +302,9 @@ for opt_iten in optional_itineraries:
         
 
 # ****************** Solving **************** # 
-opt = SolverFactory('gurobi')
+solver_config = SolverConfig('gurobi')
 print('\n\nSolving please wait\n\n')
-problem_results = opt.solve(model)
+problem_results = solver_config.solve(model)
         
 for idx, flight in flights_df.iterrows():
     for opt_iten in optional_itineraries:
@@ -404,12 +312,12 @@ for idx, flight in flights_df.iterrows():
             str(itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values, flights_col].iloc[0])
         ).split(', ')
 
-        if str(flight.iloc[0]) in flights_list_in_opt_iten and int(pyo.value(model.z[f'z_{opt_iten}'])) == 0:
+        if str(flight.iloc[0]) in flights_list_in_opt_iten and int(round(pyo.value(model.z[f'z_{opt_iten}']))) == 0:
             flights_df.iloc[ (flights_df.loc[:, flight_no_col] == flight.iloc[flight_no_col]) , 'status'] = 'removed'
         else:
             for e in range(1, len(fleets_df) + 1):
                 try:
-                    if pyo.value(model.x[(str(flight.iloc[flight_no_col]), e)]) == 1:
+                    if round(pyo.value(model.x[(str(flight.iloc[flight_no_col]), e)])) == 1:
                         flights_df.iloc[ (flights_df.loc[:, flight_no_col] == flight.iloc[flight_no_col]), 'status'] = e
                 except KeyError:
                     print(f"KeyError: Index {str(flight.iloc[flight_no_col]), e} is not valid for indexed component 'x'")
@@ -431,7 +339,7 @@ flights_df.iloc[:, arrival_col] = flights_df.iloc[:, arrival_col].apply(minutes_
 flights_df.to_excel('ISD_IFAM__routes_output.xlsx', index=False)
 
 
-if problem_results.solver.termination_condition == TerminationCondition.optimal:
+if solver_config.is_solved(problem_results):
     # The solver was successful, and the optimal solution is available
 
     # Access and print the values of your Pyomo variables
@@ -0,0 +1,64 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from SkyLinker.artifacts import get_artifact_store
+from SkyLinker.celery import app
+from SkyLinker.solvers import SolverConfig
+from .utils import FAMModel, WarmStartSolution, isd_scenario_summary
+
+logger = logging.getLogger(__name__)
+
+
+def concurrent_solver_config(solver_config, solves_number, workers=None):
+    """
+    Splits the cores between the models solved side by side: unless the run set its own thread count,
+    each solve gets cores // concurrent solves threads.
+    """
+    solver_config = dict(solver_config)
+    if not solver_config.get('threads'):
+        concurrent = max(1, min(solves_number, workers or os.cpu_count() or 1))
+        solver_config['threads'] = max(1, (os.cpu_count() or 1) // concurrent)
+    return solver_config
+
+
+def run_isd_scenario(network_handle, solver_config, scenario):
+    """Builds and solves the ISD-IFAM model of one scenario from the shared network, returns its comparison row."""
+    # Raises ArtifactExpired when the network expired, or lives on the disk of another host
+    network = get_artifact_store().get_required(network_handle)
+    config = SolverConfig(**solver_config)
+    model = network.build_model(scenario['recapture_ratio'], scenario['decrease_demand_percentage'], scenario['increase_demand_percentage'])
+    results = config.solve(model)
+    return isd_scenario_summary(model, network, config, results, scenario)
+
+
+def run_scenario_sweep(network_handle, solver_config, scenarios, workers=None):
+    """Solves the scenarios in a local process pool, used when no Celery worker is reachable."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_isd_scenario, repeat(network_handle), repeat(solver_config), scenarios))
+
+
+def run_fam_component(flights_df, fleets_df, flight_column_indexes, solver_config, aggregate_ground_arcs=False):
+    """Builds and solves the FAM of one fleet family, returns its WarmStartSolution (None when it was not solved)."""
+    config = SolverConfig(**solver_config)
+    fam = FAMModel(flights_df, fleets_df, flight_column_indexes, aggregate_ground_arcs)
+    results = config.solve(fam.get_model())
+    if not config.is_solved(results):
+        logger.warning("Fleet family %s not solved: %s", fleets_df['Fleet Type'].tolist(), results.solver.termination_condition)
+        return None
+    return WarmStartSolution(fam.get_model(), fam.get_nodes(), {}, fleets_df.values.tolist())
+
+
+def run_fam_decomposition(component_frames, flight_column_indexes, solver_config, aggregate_ground_arcs=False, workers=None):
+    """Solves the FAM of every (flights_df, fleets_df) fleet family in a local process pool, returns their solutions in order."""
+    flights_frames, fleets_frames = zip(*component_frames)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_fam_component, flights_frames, fleets_frames, repeat(flight_column_indexes),
+                                 repeat(solver_config), repeat(aggregate_ground_arcs)))
+
+
+@app.task(name='solve_isd_scenario')
+def solve_isd_scenario(network_handle, solver_config, scenario):
+    logger.info("ISD-IFAM scenario %s started", scenario)
+    return run_isd_scenario(network_handle, solver_config, scenario)
@@ -1,3 +1,206 @@
-from django.test import TestCase
+import math
+from unittest import skipUnless
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+from django.test import SimpleTestCase
+from pyomo.repn import generate_standard_repn
+
+from SkyLinker.solvers import SolverConfig
+from .utils import ALLOWED_FLEETS_COLUMN, FAMModel, ISDIFAMNetwork, flight_fleet_compatibility
 
 # Create your tests here.
+
+FLIGHT_COLUMN_INDEXES = {'flight number': 0, 'origin': 1, 'departure': 2, 'destination': 3, 'arrival': 4, 'distance': 5, 'duration': 6}
+ITINERARY_COLUMN_INDEXES = {'itinerary': 0, 'demand': 1, 'fare': 2, 'flights': 3, 'type': 4}
+TYPE_PRIORITY = {'non_stop': 1, 'direct': 2, 'single_stop': 3, 'double_stop': 4}
+
+
+def round_trip_schedule(pairs_number, seed):
+    """A hub and spoke day of round trips, so every flight can be covered and the balance holds."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(pairs_number):
+        spoke = f"S{int(rng.integers(1, 5)):02d}"
+        departure = int(rng.integers(300, 900))
+        duration = int(rng.integers(45, 180))
+        back = departure + duration + int(rng.integers(30, 120))
+        optional = int(rng.random() < 0.2)
+        for origin, destination, start in (('HUB', spoke, departure), (spoke, 'HUB', back)):
+            rows.append([1000 + len(rows), origin, f"{start // 60:02d}:{start % 60:02d}:00", destination,
+                         f"{(start + duration) // 60:02d}:{(start + duration) % 60:02d}:00", duration * 7.5, duration, optional])
+    return pd.DataFrame(rows, columns=['Flight Number', 'Origin', 'Departure', 'Destination', 'Arrival', 'Distance', 'Duration', 'Optional'])
+
+
+def fleet_table():
+    # The cheapest fleets are short of aircraft, so the balance decides which flights they can take
+    return pd.DataFrame({'Fleet Type': ['E1', 'E2', 'E3'], 'Number of Aircrafts': [2, 3, 30],
+                         'Number of Seats': [70, 120, 180], 'Operating Cost Per Mile': [4.0, 6.5, 9.0]})
+
+
+@skipUnless(SolverConfig.is_available('highs'), 'HiGHS is not installed')
+class AggregatedBalanceTests(SimpleTestCase):
+
+    def solve(self, flights_df, aggregate_ground_arcs):
+        fam = FAMModel(flights_df.copy(), fleet_table(), FLIGHT_COLUMN_INDEXES, aggregate_ground_arcs)
+        model = fam.get_model()
+        solver_config = SolverConfig('highs', mip_gap=0)
+        self.assertTrue(solver_config.is_solved(solver_config.solve(model)))
+        return model
+
+    def test_same_objective_as_full_balance(self):
+        for seed in (1, 2, 3):
+            flights_df = round_trip_schedule(12, seed)
+            full = self.solve(flights_df, False)
+            aggregated = self.solve(flights_df, True)
+
+            self.assertAlmostEqual(pyo.value(aggregated.obj), pyo.value(full.obj), places=4)
+            for name, arc in aggregated.y.items():
+                self.assertGreaterEqual(pyo.value(arc), -1e-6, name)
+
+    def test_same_objective_with_allowed_fleets(self):
+        flights_df = round_trip_schedule(12, 4)
+        flights_df[ALLOWED_FLEETS_COLUMN] = np.where(flights_df['Origin'].isin(['S01', 'S02']) | flights_df['Destination'].isin(['S01', 'S02']),
+                                                     'E2, E3', None)
+        full = self.solve(flights_df, False)
+        aggregated = self.solve(flights_df, True)
+
+        self.assertAlmostEqual(pyo.value(aggregated.obj), pyo.value(full.obj), places=4)
+        compatibility = flight_fleet_compatibility(flights_df, 0, fleet_table()['Fleet Type'].tolist())
+        for model in (full, aggregated):
+            for (flight, fleet), var in model.x.items():
+                if fleet not in compatibility[flight]:
+                    self.assertAlmostEqual(var.value or 0, 0)
+
+
+def hub_itineraries(flights_df, seed):
+    """Non stop itineraries on every flight plus one and two stop itineraries through the hub, several per market."""
+    rng = np.random.default_rng(seed)
+    legs = list(zip(flights_df['Flight Number'].astype(str), flights_df['Origin'], flights_df['Destination']))
+    inbound = [leg for leg in legs if leg[2] == 'HUB']
+    outbound = [leg for leg in legs if leg[1] == 'HUB']
+    itineraries = [([number], rng.choice(['non_stop', 'direct'], p=[0.8, 0.2])) for number, _, _ in legs]
+    for first in inbound:
+        for second in outbound:
+            if first[1] != second[2] and rng.random() < 0.5:
+                itineraries.append(([first[0], second[0]], 'single_stop'))
+                third = [leg for leg in inbound if leg[1] == second[2]]
+                if third and rng.random() < 0.5:
+                    itineraries.append(([first[0], second[0], third[0][0]], 'double_stop'))
+    return pd.DataFrame({'Itinerary': range(1, len(itineraries) + 1),
+                         'Demand': rng.integers(10, 150, len(itineraries)),
+                         'Fare': rng.integers(80, 400, len(itineraries)),
+                         'Flights': [', '.join(flights) for flights, _ in itineraries],
+                         'Type': [itinerary_type for _, itinerary_type in itineraries]})
+
+
+def linear_terms(expr):
+    """Variable name -> coefficient and the constant of a linear expression."""
+    repn = generate_standard_repn(expr, compute_values=True)
+    terms = {}
+    for var, coefficient in zip(repn.linear_vars, repn.linear_coefs):
+        terms[var.name] = terms.get(var.name, 0) + coefficient
+    return {name: coefficient for name, coefficient in terms.items() if coefficient}, repn.constant
+
+
+class ItineraryModelTests(SimpleTestCase):
+    """The ISD-IFAM itinerary parts against brute force references of the row by row code they replaced."""
+
+    def network(self, seed):
+        flights_df = round_trip_schedule(8, seed)
+        itineraries_df = hub_itineraries(flights_df, seed)
+        return ISDIFAMNetwork(flights_df, fleet_table(), itineraries_df, FLIGHT_COLUMN_INDEXES, ITINERARY_COLUMN_INDEXES)
+
+    @staticmethod
+    def markets(network):
+        """Itinerary number -> (From, To, type priority) from the flights data."""
+        flights_df = network.flights_df
+        origin = dict(zip(flights_df['Flight Number'].astype(str), flights_df['Origin']))
+        destination = dict(zip(flights_df['Flight Number'].astype(str), flights_df['Destination']))
+        return {int(number): (origin[flights.split(', ')[0]], destination[flights.split(', ')[-1]], TYPE_PRIORITY[itinerary_type])
+                for number, flights, itinerary_type in zip(network.itineraries_df['Itinerary'], network.itineraries_df['Flights'], network.itineraries_df['Type'])}
+
+    def test_spill_variables(self):
+        for seed in (1, 2, 3):
+            network = self.network(seed)
+            markets = self.markets(network)
+            dummy = len(markets) + 1
+
+            expected = []
+            for p, (origin, destination, priority) in markets.items():
+                expected.append(f"t_{p}_{dummy}")
+                expected.extend(f"t_{p}_{r}" for r, market in markets.items() if market[:2] == (origin, destination) and priority < market[2])
+
+            self.assertEqual(network.spilled_recaptured_vars, expected)
+            self.assertEqual(network.itineraries_df['From'].tolist(), [market[0] for market in markets.values()])
+            self.assertEqual(network.itineraries_df['To'].tolist(), [market[1] for market in markets.values()])
+            self.assertGreater(len(expected), dummy - 1)
+
+    def test_demand_corrections(self):
+        for seed in (1, 2, 3):
+            network = self.network(seed)
+            markets = self.markets(network)
+            flights = {int(number): flights.split(', ') for number, flights in zip(network.itineraries_df['Itinerary'], network.itineraries_df['Flights'])}
+            demand = dict(zip(network.itineraries_df['Itinerary'].astype(int), network.itineraries_df['Demand']))
+            optional_flights = set(network.optional_flights)
+
+            expected = {}
+            for q in network.optional_itinerary_list:
+                for p in markets:
+                    shared = set(flights[q]).intersection(flights[p])
+                    if p == q or (shared and optional_flights.intersection(flights[p])):
+                        continue
+                    same_market = markets[q][:2] == markets[p][:2] and markets[q][2] <= markets[p][2]
+                    value = 15 / 100 * demand[q] if same_market else -5 / 100 * demand[q]
+                    expected[f"D_{q}_{p}"] = math.ceil(value) if value >= 0 else math.floor(value)
+
+            self.assertTrue(network.optional_itinerary_list)
+            self.assertEqual(network.get_demand_corrections(5, 15), expected)
+
+    def test_objective_terms(self):
+        for seed in (1, 2, 3):
+            network = self.network(seed)
+            parameters = network.itinerary_parameters
+            fare = dict(zip(network.itineraries_df['Itinerary'].astype(int), network.itineraries_df['Fare']))
+            demand = dict(zip(network.itineraries_df['Itinerary'].astype(int), network.itineraries_df['Demand']))
+            dummy = len(fare) + 1
+            model = pyo.ConcreteModel()
+            model.t = pyo.Var(network.spilled_recaptured_vars)
+
+            spill_cost = sum(model.t[name] * fare[int(name.split('_')[1])] for name in network.spilled_recaptured_vars)
+            recaptured = sum(model.t[name] * 0.4 * fare[int(name.split('_')[2])] for name in network.spilled_recaptured_vars
+                             if int(name.split('_')[2]) != dummy)
+            self.assertEqual(linear_terms(parameters.spill_cost(model.t)), linear_terms(spill_cost))
+            self.assertEqual(linear_terms(parameters.recaptured_revenue(model.t, 0.4)), linear_terms(recaptured))
+
+            corrections = network.get_demand_corrections(5, 15)
+            expected = {q: demand[q] * fare[q] - sum(corrections.get(f"D_{q}_{p}", 0) * fare[p] for p in fare)
+                        for q in network.optional_itinerary_list}
+            self.assertEqual(parameters.revenue_loss_coefficients(network.optional_itinerary_list, corrections), expected)
+
+    def test_flight_interaction_rows(self):
+        for seed in (1, 2, 3):
+            network = self.network(seed)
+            model = network.build_model(0.4, 5, 15)
+            corrections = network.get_demand_corrections(5, 15)
+            itineraries = list(zip(network.itineraries_df['Itinerary'].astype(int).astype(str), network.itineraries_df['Flights'].str.split(', '),
+                                   network.itineraries_df['Demand']))
+
+            rows = list(model.flight_interaction.values())
+            self.assertEqual(len(rows), len(network.flights_list))
+            for flight, row in zip(network.flights_list, rows):
+                using = [(number, demand) for number, flights, demand in itineraries if flight in flights]
+                spilled = sum(model.spilled_recaptured_vars[name] for number, _ in using for name in network.spilled_recaptured_vars if name.split('_')[1] == number)
+                recaptured = sum(0.4 * model.spilled_recaptured_vars[name] for number, _ in using for name in network.spilled_recaptured_vars if name.split('_')[2] == number)
+                correction = sum(corrections[f"D_{q}_{number}"] * (1 - model.z[str(q)]) for number, _ in using
+                                 for q in network.optional_itinerary_list if f"D_{q}_{number}" in corrections)
+                seats = sum(model.x[flight, fleet] * seats for fleet, seats in network.fleet_capacities)
+                expected_terms, expected_constant = linear_terms(spilled - recaptured - (sum(demand for _, demand in using) + correction - seats))
+
+                body = row.body - row.lower if row.lower is not None else row.upper - row.body
+                terms, constant = linear_terms(body)
+                self.assertEqual(terms.keys(), expected_terms.keys(), flight)
+                for name, coefficient in terms.items():
+                    self.assertAlmostEqual(coefficient, expected_terms[name], msg=f"{flight} {name}")
+                self.assertAlmostEqual(constant, expected_constant, msg=flight)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import upload_flights_excel, download_for_routing_excel, process_flight_columns, upload_itineraries_excel, process_itinerary_columns, fleet_data, solver_selection, optional_flights_selection, ISD_IFAM, FAM, download_excel, download_flights_sample_excel, download_itineraries_sample_excel, demand_adjustment, recapture_ratio, IFAM, preview_flights_sample, preview_itineraries_sample
+from .views import upload_flights_excel, download_for_routing_excel, process_flight_columns, upload_itineraries_excel, process_itinerary_columns, fleet_data, solver_selection, optional_flights_selection, ISD_IFAM, FAM, download_excel, download_flights_sample_excel, download_itineraries_sample_excel, demand_adjustment, recapture_ratio, IFAM, preview_flights_sample, preview_itineraries_sample, scenario_sweep, scenario_sweep_status, scenario_sweep_results
 
 urlpatterns = [
     path('', upload_flights_excel, name='upload_flights_excel'),
@@ -18,6 +18,9 @@ urlpatterns = [
     path('IFAM/', IFAM, name='IFAM'),
     path('ISD_IFAM/', ISD_IFAM, name='ISD_IFAM'),
     path('FAM/', FAM, name='FAM'),
+    path('scenario_sweep/', scenario_sweep, name='scenario_sweep'),
+    path('scenario_sweep/status/', scenario_sweep_status, name='scenario_sweep_status'),
+    path('scenario_sweep/results/', scenario_sweep_results, name='scenario_sweep_results'),
     path('download-excel/', download_excel, name='download_excel'),
     path('download/<str:fleet_type>/', download_for_routing_excel, name='download-fleet-excel'),
     # other URL patterns
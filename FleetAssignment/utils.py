@@ -4,12 +4,15 @@ from io import BytesIO
 import io
 from datetime import datetime, timedelta, time
 import numpy as np
-import math
 from pyomo.util.infeasible import log_infeasible_constraints
 import itertools
 import pyomo.environ as pyo 
 from pyomo.environ import *
 from pyomo.opt import SolverFactory
+import logging
+
+logger = logging.getLogger(__name__)
+
 
 class SyncReadExcel:
     def __init__(self, file_content=None, dtype=str, file_name=None):
@@ -347,61 +350,91 @@ class ClockToMinutes:
 ##########################################################################################################         
 
 class NodesGenerator():
+    """
+    Builds the time-line nodes of every station.
+
+    All departures and arrivals are laid out as one event array sorted by station, time and arrival,
+    and a node starts at every arrival that follows a departure of the same station.
+    """
+
     def __init__(self,flights_df, station_list, flight_no_col, origin_col, destination_col, departure_col, arrival_col, dep, arriv):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights, its departure and arrival columns are overwritten with dep and arriv.
+        - station_list: list of stations, nodes are numbered station by station in this order.
+        - flight_no_col, origin_col, destination_col, departure_col, arrival_col: column indexes in flights_df.
+        - dep, arriv: lists of departure and arrival minutes.
+        """
         self.flights_df = flights_df
         self.dep = dep
         self.arriv = arriv
         self.flights_df.iloc[:, departure_col] = self.dep
         self.flights_df.iloc[:, arrival_col] = self.arriv
         self.cities = station_list
-        
-        self.nodes_df = pd.DataFrame(columns=['node_no', 'city', 'time', 'flights'])
-        self.nodes_df.set_index('node_no', inplace=True)
-        
-        arrival_column_name = self.flights_df.columns[arrival_col]
 
-        for city in self.cities:
-            city_flights = self.flights_df[(self.flights_df.iloc[:, origin_col] == city) | (self.flights_df.iloc[:, destination_col] == city)].copy()
-            
-            def func(From, departure, arrival):
-                if city == From:
-                    return departure
-                else:
-                    return arrival
-                
-            city_flights['stagger_time'] = city_flights.apply(lambda x: func(x.iloc[origin_col], x.iloc[departure_col], x.iloc[arrival_col]), axis=1)
-            city_flights = city_flights.sort_values(['stagger_time', arrival_column_name])
-            
-            types = np.select([city_flights.iloc[:, origin_col] == city, city_flights.iloc[:, destination_col] == city], ['deprt', 'arrv'], default='nan')        
-            
-            prev_type = "arrv"
-            flights = []
-            prev_time = 0
-            for idx, type in enumerate(types):         
-                flight = [city_flights.iloc[idx, flight_no_col], -1] if type == "deprt" else [city_flights.iloc[idx, flight_no_col], 1]
-                
-                if ((prev_type == "deprt") & (type == "arrv")) | (idx == len(types)-1):
-                    if not ((prev_type == "arrv") & (type == "arrv") & (idx == len(types)-1)):
-                        if type == "deprt":
-                            flights.append(flight)
-                        self.nodes_df.loc[len(self.nodes_df)] = [city, prev_time, flights]
-                        flights = []
-                    
-                    if (idx == len(types)-1) & (type == "arrv"):
-                        flights.append(flight)
-                        self.nodes_df.loc[len(self.nodes_df)] = [city, city_flights.iloc[idx]['stagger_time'], flights]
-                        flights = []
-                    
-                
-                flights.append(flight)
-                prev_time = city_flights.iloc[idx]['stagger_time']
-                prev_type = type
-                
-        self.nodes_df.index +=1
-        
-    def get_nodes(self):        
+        station_codes = {city: code for code, city in enumerate(self.cities)}
+        origins = self.flights_df.iloc[:, origin_col].map(station_codes).to_numpy(dtype=float)
+        destinations = self.flights_df.iloc[:, destination_col].map(station_codes).to_numpy(dtype=float)
+        dep_minutes = np.asarray(self.dep, dtype=float)
+        arriv_minutes = np.asarray(self.arriv, dtype=float)
+        positions = np.arange(len(self.flights_df))
+
+        # One departure event at the origin and one arrival event at the destination of every flight
+        is_departure = ~np.isnan(origins)
+        is_arrival = ~np.isnan(destinations) & (destinations != origins)
+        event_city = np.concatenate([origins[is_departure], destinations[is_arrival]]).astype(int)
+        event_time = np.concatenate([dep_minutes[is_departure], arriv_minutes[is_arrival]])
+        event_arrival = np.concatenate([arriv_minutes[is_departure], arriv_minutes[is_arrival]])
+        event_flight = np.concatenate([positions[is_departure], positions[is_arrival]])
+        event_sign = np.concatenate([np.full(is_departure.sum(), -1), np.full(is_arrival.sum(), 1)])
+
+        order = np.lexsort((event_flight, event_arrival, event_time, event_city))
+        event_city, event_time = event_city[order], event_time[order]
+        self.event_flight, self.event_sign = event_flight[order], event_sign[order]
+
+        # A node starts with each station's first event and with every arrival right after a departure
+        new_city = np.ones(len(order), dtype=bool)
+        new_city[1:] = event_city[1:] != event_city[:-1]
+        starts = new_city.copy()
+        starts[1:] |= (self.event_sign[1:] == 1) & (self.event_sign[:-1] == -1)
+        self.event_node = np.cumsum(starts) - 1
+
+        self.node_ptr = np.append(np.flatnonzero(starts), len(order))
+        node_last = self.node_ptr[1:] - 1
+        self.node_city = event_city[self.node_ptr[:-1]]
+
+        # Nodes are stamped with their last event, except a station's last node when it ends with a departure,
+        # which takes the event before it (0 when the station has a single event)
+        node_time = event_time[node_last]
+        city_last = np.append(new_city[1:], True)[node_last] & (self.event_sign[node_last] == -1)
+        previous_event = node_last - 1
+        node_time = np.where(city_last, np.where(new_city[node_last], 0, event_time[np.maximum(previous_event, 0)]), node_time)
+
+        flight_numbers = self.flights_df.iloc[:, flight_no_col].to_numpy()[self.event_flight]
+        signs = self.event_sign.tolist()
+        flights = [[[flight_numbers[k], signs[k]] for k in range(start, end)]
+                   for start, end in zip(self.node_ptr[:-1], self.node_ptr[1:])]
+
+        self.nodes_df = pd.DataFrame({'city': np.asarray(self.cities)[self.node_city] if len(order) else [],
+                                      'time': node_time, 'flights': flights},
+                                     index=pd.Index(np.arange(1, len(flights) + 1), name='node_no'))
+
+    def get_nodes(self):
         return self.nodes_df
-        
+
+    def get_incidence(self):
+        """
+        Returns the node -> flights incidence as compact integer arrays:
+        - node_ptr: the events of node k are node_ptr[k]:node_ptr[k+1].
+        - event_flight: row position of each event's flight in flights_df.
+        - event_sign: -1 for a departure, 1 for an arrival.
+        """
+        return self.node_ptr, self.event_flight, self.event_sign
+
+    def get_node_cities(self):
+        """Returns the position in station_list of each node's station."""
+        return self.node_city
+
 ##########################################################################################################     
 
 class VariableY():
@@ -420,6 +453,570 @@ class VariableY():
     
 ##########################################################################################################     
 
+class BalanceConstraintBuilder():
+    """
+    Integer index of the time-space network behind the balance constraints.
+
+    Every node gets its inbound and outbound ground arc, its RON role and its flight incidences once,
+    so each balance constraint is written from a few dictionary lookups instead of a scan over all ground arcs.
+    """
+
+    def __init__(self, Nodes_df, fleet_list):
+        """
+        Parameters:
+        - Nodes_df: DataFrame from NodesGenerator, indexed by node number with 'city' and 'flights' columns.
+        - fleet_list: list of fleet types.
+        """
+        self.fleet_list = list(fleet_list)
+        self.node_ids = [int(node) for node in Nodes_df.index]
+        self.node_city = dict(zip(self.node_ids, Nodes_df['city']))
+        self.flights = {node: [(str(flight[0]), flight[1]) for flight in flights]
+                        for node, flights in zip(self.node_ids, Nodes_df['flights'])}
+
+        self.city_nodes = {}
+        for node in self.node_ids:
+            self.city_nodes.setdefault(self.node_city[node], []).append(node)
+
+        self.first_node = {}
+        self.last_node = {}
+        self.inbound = {}     # node -> node its inbound ground arc starts from
+        self.outbound = {}    # node -> node its outbound ground arc ends at
+        for city, nodes in self.city_nodes.items():
+            nodes.sort()
+            self.first_node[city] = nodes[0]
+            self.last_node[city] = nodes[-1]
+            for tail, head in zip(nodes[:-1], nodes[1:]):
+                self.outbound[tail] = head
+                self.inbound[head] = tail
+
+    @staticmethod
+    def ground_arc_name(tail, head, fleet):
+        """Name of the ground arc variable, the same format VariableY uses."""
+        return f"{tail}_{head},{fleet}"
+
+    def balance_terms(self, model, node, fleet):
+        """Returns the terms of the balance constraint of node for fleet, in the order the views used to write them."""
+        city = self.node_city[node]
+        terms = []
+        if node in self.inbound:
+            terms.append(model.y[self.ground_arc_name(self.inbound[node], node, fleet)])
+        if node in self.outbound:
+            terms.append(-1 * model.y[self.ground_arc_name(node, self.outbound[node], fleet)])
+        for flight, sign in self.flights[node]:
+            terms.append(sign * model.x[flight, fleet])
+        if self.first_node[city] != self.last_node[city]:
+            if node == self.first_node[city]:
+                terms.append(model.RON[city, fleet])
+            elif node == self.last_node[city]:
+                terms.append(-1 * model.RON[city, fleet])
+        return terms
+
+    def add_balance_constraints(self, model):
+        """
+        Adds model.balance, one constraint per node and fleet, using model.x, model.y and model.RON.
+
+        Returns:
+        - The ConstraintList.
+        """
+        model.balance = ConstraintList()
+        for fleet in self.fleet_list:
+            for node in self.node_ids:
+                terms = self.balance_terms(model, node, fleet)
+                if terms:
+                    model.balance.add(expr=sum(terms) == 0)
+        return model.balance
+
+    def add_aggregated_balance_constraints(self, model, compatibility=None):
+        """
+        Presolved alternative to add_balance_constraints() with far fewer ground arcs and balance rows.
+
+        An arc leaving a node without departures is never below the arc before it, and one entering a node
+        without arrivals never below the arc after it, so only the arcs from a node with departures into a node
+        with arrivals can bind. Those keep a variable (model.ground_arc, continuous since it always equals RON
+        plus whole flights); the nodes between two of them are merged into one balance row. model.y maps the
+        solution back: it is an expression of every original ground arc, the kept arc or RON before it plus
+        the flights since. The x and RON values allowed are exactly those of the full node balances.
+
+        Parameters:
+        - model: model with x and RON, it gets ground_arc (Var), balance (ConstraintList) and y (Expression).
+        - compatibility: dict {flight: fleets allowed to fly it} from flight_fleet_compatibility(); the other
+          flights are left out of the fleet's time-lines, which merges the nodes they separated.
+
+        Returns:
+        - The ConstraintList.
+        """
+        rows = []        # (inbound, outbound, flights) of every merged node, an end is an arc name, 'RON' or None
+        mapping = {}     # original arc -> (fleet, city, kept arc name or 'RON', flights since it)
+        for fleet in self.fleet_list:
+            for city, nodes in self.city_nodes.items():
+                # The RON term only exists where the station has more than one node, as in balance_terms()
+                ron = 'RON' if len(nodes) > 1 else None
+                node_flights = [[(flight, sign) for flight, sign in self.flights[node]
+                                 if compatibility is None or fleet in compatibility[flight]] for node in nodes]
+
+                binding = set()
+                busy = [position for position, flights in enumerate(node_flights) if flights]
+                for position, following in zip(busy[:-1], busy[1:]):
+                    if any(sign == -1 for _, sign in node_flights[position]) and any(sign == 1 for _, sign in node_flights[following]):
+                        binding.add(position)
+
+                inbound, merged, base, since = ron, [], ron, []
+                for position, node in enumerate(nodes):
+                    merged += node_flights[position]
+                    since += node_flights[position]
+                    if node not in self.outbound:
+                        continue
+                    name = self.ground_arc_name(node, self.outbound[node], fleet)
+                    if position in binding:
+                        rows.append((fleet, city, inbound, name, merged))
+                        inbound, merged, base, since = name, [], name, []
+                    mapping[name] = (fleet, city, base, list(since))
+                rows.append((fleet, city, inbound, ron, merged))
+
+        kept = [row[3] for row in rows if row[3] not in (None, 'RON')]
+        model.ground_arc = pyo.Var(kept, within=NonNegativeReals)
+
+        def end_term(fleet, city, end):
+            if end == 'RON':
+                return model.RON[city, fleet]
+            return model.ground_arc[end] if end is not None else 0
+
+        model.balance = ConstraintList()
+        for fleet, city, inbound, outbound, flights in rows:
+            if inbound == outbound == 'RON':
+                inbound = outbound = None       # a station merged into one node: RON in and out cancel
+            if not flights and inbound is None and outbound is None:
+                continue
+            model.balance.add(expr=end_term(fleet, city, inbound) - end_term(fleet, city, outbound)
+                              + sum(sign * model.x[flight, fleet] for flight, sign in flights) == 0)
+
+        def ground_arc_rule(model, name):
+            fleet, city, base, since = mapping[name]
+            return end_term(fleet, city, base) + sum(sign * model.x[flight, fleet] for flight, sign in since)
+
+        model.y = pyo.Expression(list(mapping), rule=ground_arc_rule)
+        return model.balance
+
+    def get_inbound(self):
+        return self.inbound
+
+    def get_outbound(self):
+        return self.outbound
+
+    def get_flights(self):
+        return self.flights
+
+def ground_arc_values(model):
+    """Returns {ground arc name: value} of model.y, whether it holds variables or the expressions of the aggregated balance."""
+    if model.y.ctype is pyo.Var:
+        return model.y.extract_values()
+    return {name: pyo.value(expression, exception=False) for name, expression in model.y.items()}
+
+##########################################################################################################
+
+class ScheduleDiff():
+    """
+    Flights added, removed or changed between the schedule of a previous run and the current one,
+    and the stations whose time-lines they touch.
+    """
+
+    def __init__(self, previous_schedule, schedule):
+        """
+        Parameters:
+        - previous_schedule, schedule: dicts from schedule_of().
+        """
+        self.added = sorted(set(schedule) - set(previous_schedule))
+        self.removed = sorted(set(previous_schedule) - set(schedule))
+        self.changed = sorted(flight for flight in set(schedule) & set(previous_schedule)
+                              if schedule[flight] != previous_schedule[flight])
+
+        self.affected_stations = set()
+        for flight in self.added + self.changed:
+            self.affected_stations.update((schedule[flight][0], schedule[flight][2]))
+        for flight in self.removed + self.changed:
+            self.affected_stations.update((previous_schedule[flight][0], previous_schedule[flight][2]))
+
+    @staticmethod
+    def schedule_of(flights_df, flight_no_col, origin_col, destination_col, dep, arriv, distance_col=None):
+        """
+        Returns {flight number: (origin, departure minutes, destination, arrival minutes, optional, distance, allowed fleets)},
+        every flight input of the model, so a change of any of them marks the flight as changed.
+
+        Parameters:
+        - flights_df: DataFrame of the flights with its 'Optional' column and the optional 'Allowed Fleets' column.
+        - flight_no_col, origin_col, destination_col: column indexes in flights_df.
+        - dep, arriv: lists of departure and arrival minutes.
+        - distance_col: column index of the distance the operating costs are computed from.
+        """
+        optional = flights_df['Optional'] if 'Optional' in flights_df.columns else [0] * len(flights_df)
+        distance = flights_df.iloc[:, distance_col].astype(str) if distance_col is not None else [''] * len(flights_df)
+        allowed = flights_df[ALLOWED_FLEETS_COLUMN].astype(str) if ALLOWED_FLEETS_COLUMN in flights_df.columns else [''] * len(flights_df)
+        return {int(flight): (origin, float(departure), destination, float(arrival), int(is_optional), flight_distance, allowed_fleets)
+                for flight, origin, departure, destination, arrival, is_optional, flight_distance, allowed_fleets in zip(
+                    flights_df.iloc[:, flight_no_col], flights_df.iloc[:, origin_col], dep,
+                    flights_df.iloc[:, destination_col], arriv, optional, distance, allowed)}
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.changed)
+
+    def get_added(self):
+        return self.added
+
+    def get_removed(self):
+        return self.removed
+
+    def get_changed(self):
+        return self.changed
+
+    def get_affected_stations(self):
+        return self.affected_stations
+
+##########################################################################################################
+
+class WarmStartSolution():
+    """
+    The x, RON and ground arc (y) values of a solved fleet assignment model.
+
+    x is keyed by flight number and fleet, RON by station and fleet, and y by station, position of the
+    arc on the station time-line and fleet, so the values can be put back into the model of an edited schedule.
+    """
+
+    def __init__(self, model, Nodes_df, schedule, fleet_records, demand_records=None):
+        """
+        Parameters:
+        - model: the solved model with x, RON and y.
+        - Nodes_df: DataFrame from NodesGenerator the model was built on.
+        - schedule: dict from ScheduleDiff.schedule_of() for the solved schedule.
+        - fleet_records: list of the fleet table rows, a different fleet table disables fixing flights.
+        - demand_records: the itinerary rows and recapture ratio of an IFAM run, a change of them disables fixing flights.
+        """
+        self.schedule = schedule
+        self.fleet_records = fleet_records
+        self.demand_records = demand_records
+        self.x = {(int(flight), fleet): value for (flight, fleet), value in model.x.extract_values().items() if value is not None}
+        self.ron = {key: value for key, value in model.RON.extract_values().items() if value is not None}
+
+        ground_arcs = self.ground_arc_keys(Nodes_df)
+        self.y = {}
+        for name, value in ground_arc_values(model).items():
+            arc, fleet = name.split(',', 1)
+            if value is not None and arc in ground_arcs:
+                self.y[ground_arcs[arc] + (fleet,)] = value
+
+    @staticmethod
+    def ground_arc_keys(Nodes_df):
+        """Returns {'tail_head': (station, position of the arc on the station time-line)} of every ground arc."""
+        positions = Nodes_df.groupby('city', sort=False).cumcount()
+        keys = {}
+        previous_node, previous_city = None, None
+        for node, city, position in zip(Nodes_df.index, Nodes_df['city'], positions):
+            if city == previous_city:
+                keys[f"{previous_node}_{node}"] = (city, int(position) - 1)
+            previous_node, previous_city = node, city
+        return keys
+
+    def apply(self, model, Nodes_df, diff, fleet_records, fix_unaffected=False, demand_records=None):
+        """
+        Sets the previous values as the starting point of model: x of the flights diff did not touch,
+        RON and y of the stations it did not affect.
+
+        Parameters:
+        - model: the new model with x, RON and y.
+        - Nodes_df: DataFrame from NodesGenerator the new model was built on.
+        - diff: ScheduleDiff from the previous schedule to the new one.
+        - fleet_records: list of the fleet table rows of the new run.
+        - fix_unaffected: bool, also fix x of the flights between two unaffected stations (a heuristic, the
+          fixed flights can not move to a cheaper fleet), only done when the fleets and demand are unchanged.
+        - demand_records: the itinerary rows and recapture ratio of the new IFAM run.
+
+        Returns:
+        - The list of the x variables that were fixed.
+        """
+        touched = set(diff.get_added()) | set(diff.get_changed())
+        affected = diff.get_affected_stations()
+        fix_unaffected = fix_unaffected and fleet_records == self.fleet_records and demand_records == self.demand_records
+        fixed = []
+        for (flight, fleet), var in model.x.items():
+            flight = int(flight)
+            if flight in touched or (flight, fleet) not in self.x:
+                continue
+            var.set_value(self.x[flight, fleet], skip_validation=True)
+            origin, destination = self.schedule[flight][0], self.schedule[flight][2]
+            if fix_unaffected and origin not in affected and destination not in affected:
+                var.fix()
+                fixed.append(var)
+
+        for (station, fleet), var in model.RON.items():
+            if station not in affected and (station, fleet) in self.ron:
+                var.set_value(self.ron[station, fleet], skip_validation=True)
+
+        if model.y.ctype is not pyo.Var:
+            return fixed     # aggregated ground arcs follow from x and RON
+        ground_arcs = self.ground_arc_keys(Nodes_df)
+        for name, var in model.y.items():
+            arc, fleet = name.split(',', 1)
+            key = ground_arcs.get(arc)
+            if key is not None and key[0] not in affected and key + (fleet,) in self.y:
+                var.set_value(self.y[key + (fleet,)], skip_validation=True)
+        return fixed
+
+    def get_schedule(self):
+        return self.schedule
+
+
+def solve_incrementally(solver_config, model, Nodes_df, schedule, fleet_records, previous_solution=None, keep_unaffected=False, demand_records=None):
+    """
+    Solves a fleet assignment model, starting from previous_solution when there is one.
+
+    The previous solution is only a MIP start, so the result is as good as a solve from scratch. With
+    keep_unaffected the flights between stations the schedule edit did not touch also keep their previous
+    fleet for a first, much smaller solve. That is a heuristic: the result may cost more than the optimum.
+    When the restricted model has no solution they are released and the full model is solved from the same start.
+
+    Parameters:
+    - solver_config: SolverConfig of the run.
+    - model: the model with x, RON and y.
+    - Nodes_df: DataFrame from NodesGenerator the model was built on.
+    - schedule: dict from ScheduleDiff.schedule_of() for the current schedule.
+    - fleet_records: list of the fleet table rows.
+    - previous_solution: WarmStartSolution of the previous run, None to solve from scratch.
+    - keep_unaffected: bool, fix the fleet of the flights the edit did not touch (not guaranteed optimal).
+    - demand_records: the itinerary rows and recapture ratio of an IFAM run, None for FAM.
+
+    Returns:
+    - The Pyomo results object and the WarmStartSolution of this run (None when it was not solved).
+    """
+    if previous_solution is None:
+        results = solver_config.solve(model)
+    else:
+        diff = ScheduleDiff(previous_solution.get_schedule(), schedule)
+        fixed = previous_solution.apply(model, Nodes_df, diff, fleet_records, keep_unaffected, demand_records)
+        logger.info(f"Incremental re-solve: {len(diff.get_added())} added, {len(diff.get_removed())} removed, "
+                    f"{len(diff.get_changed())} changed flights, {len(fixed)} assignments kept")
+        results = solver_config.solve(model, warm_start=True)
+        if fixed and not solver_config.is_solved(results):
+            for var in fixed:
+                var.unfix()
+            results = solver_config.solve(model, warm_start=True)
+
+    if not solver_config.is_solved(results):
+        return results, None
+    return results, WarmStartSolution(model, Nodes_df, schedule, fleet_records, demand_records)
+
+##########################################################################################################
+
+ALLOWED_FLEETS_COLUMN = 'Allowed Fleets'
+
+
+def flight_fleet_compatibility(flights_df, flight_no_col, fleet_list):
+    """
+    Returns {flight number: fleet types allowed to fly it} from the optional 'Allowed Fleets' column of
+    flights_df, which lists comma separated fleet types. Without the column, or for an empty cell or one
+    naming no known fleet, every fleet may fly the flight.
+    """
+    fleet_list = list(fleet_list)
+    flights = flights_df.iloc[:, flight_no_col].astype(str).tolist()
+    if ALLOWED_FLEETS_COLUMN not in flights_df.columns:
+        return {flight: fleet_list for flight in flights}
+
+    known = {str(fleet): fleet for fleet in fleet_list}
+    compatibility = {}
+    for flight, cell in zip(flights, flights_df[ALLOWED_FLEETS_COLUMN]):
+        names = [name.strip() for name in str(cell).split(',')] if pd.notna(cell) else []
+        compatibility[flight] = [known[name] for name in names if name in known] or fleet_list
+    return compatibility
+
+##########################################################################################################
+
+class FAMModel():
+    """The basic fleet assignment model (FAM): coverage, resource and balance constraints under the operating cost objective."""
+
+    def __init__(self, flights_df, fleets_df, flight_column_indexes, aggregate_ground_arcs=False):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights with its 'Optional' column, its departure and arrival columns are overwritten with minutes.
+        - fleets_df: DataFrame of the fleets as fleet_data saves it.
+        - flight_column_indexes: dict of the flight column indexes.
+        - aggregate_ground_arcs: bool, write the balance with BalanceConstraintBuilder.add_aggregated_balance_constraints().
+        """
+        flight_no_col = flight_column_indexes.get('flight number')
+        origin_col = flight_column_indexes.get('origin')
+        departure_col = flight_column_indexes.get('departure')
+        destination_col = flight_column_indexes.get('destination')
+        arrival_col = flight_column_indexes.get('arrival')
+        distance_col = flight_column_indexes.get('distance')
+
+        station_list = np.unique(flights_df.iloc[:, origin_col].to_list())       # list of stations
+        flights_list = flights_df.iloc[:, flight_no_col].astype(str).tolist()    # list of flights
+        fleet_list = fleets_df['Fleet Type'].tolist()
+        oc_list = fleets_df['Operating Cost Per Mile'].tolist()
+        compatibility = flight_fleet_compatibility(flights_df, flight_no_col, fleet_list)
+
+        # ****************** Convert time to minutes **************** #
+        dep_arriv = ClockToMinutes(flights_df, departure_col, arrival_col)
+        self.dep = dep_arriv.get_departure_minutes()
+        self.arriv = dep_arriv.get_arrival_minutes()
+
+        # ****************** Generate Balance Nodes **************** #
+        self.Nodes_df = NodesGenerator(flights_df, station_list, flight_no_col, origin_col, destination_col,
+                                       departure_col, arrival_col, self.dep, self.arriv).get_nodes()
+
+        model = ConcreteModel()
+        model.setF = pyo.Set(initialize=flights_list)   # set of all flights optional and non optional
+        model.setE = pyo.Set(initialize=fleet_list)     # set of fleet
+        model.setS = pyo.Set(initialize=station_list)   # set of stations
+
+        cat = FlightsCategorization(flights_df, flight_no_col)
+        model.setF_optional = pyo.Set(initialize=cat.optional_flights)             # set of optional flights
+        model.setF_non_optional = pyo.Set(initialize=cat.non_optional_flights)     # set of non optional flights
+
+        # ****************** Operating Cost (C) and Available Aircraft (Ne) **************** #
+        self.cost_list = flights_oeprating_costs(flights_df, fleets_df).given_operating_cost(distance_col, oc_list)
+        C_fe = {}
+        cost_list_counter = 0
+        for i in model.setF:
+            for j in model.setE:
+                C_fe[f'{i},{j}'] = self.cost_list[cost_list_counter]
+                cost_list_counter += 1
+        Ne = {}
+        for number_of_airplane in range(len(fleets_df)):
+            Ne[fleets_df.iloc[number_of_airplane]['Fleet Type']] = fleets_df.iloc[number_of_airplane]['Number of Aircrafts']
+
+        model.x = pyo.Var(model.setF, model.setE, within=Binary, bounds=(0, 1))
+        x = model.x
+        model.RON = pyo.Var(model.setS, model.setE, within=Integers, bounds=(0, None))
+        RON = model.RON
+
+        # A fleet the flight does not allow can not be assigned to it
+        for f in model.setF:
+            for e in set(fleet_list).difference(compatibility[f]):
+                x[f, e].setub(0)
+
+        model.obj = pyo.Objective(expr=sum([C_fe[f"{f},{e}"]*x[f, e] for f in model.setF for e in model.setE]), sense=minimize)
+
+        # ****************** Coverage Constraint **************** #
+        model.coverage = ConstraintList()
+        for f in model.setF:
+            if f in model.setF_optional:
+                model.coverage.add(expr=sum([x[f, e] for e in model.setE]) <= 1)
+            elif f in model.setF_non_optional:
+                model.coverage.add(expr=sum([x[f, e] for e in model.setE]) == 1)
+
+        # ****************** Resources Constraint **************** #
+        model.resource = ConstraintList()
+        for e in model.setE:
+            model.resource.add(expr=sum([RON[station, e] for station in model.setS]) <= Ne[e])
+
+        # ****************** Balance Constraint **************** #
+        balance = BalanceConstraintBuilder(self.Nodes_df, model.setE)
+        if aggregate_ground_arcs:
+            balance.add_aggregated_balance_constraints(model, compatibility)
+        else:
+            model.y = pyo.Var(VariableY(self.Nodes_df, station_list, fleet_list).get_y(), within=Integers, bounds=(0, None))
+            balance.add_balance_constraints(model)
+        self.model = model
+
+    def get_model(self):
+        return self.model
+
+    def get_nodes(self):
+        return self.Nodes_df
+
+    def get_departure_minutes(self):
+        return self.dep
+
+    def get_arrival_minutes(self):
+        return self.arriv
+
+    def get_cost_list(self):
+        return self.cost_list
+
+##########################################################################################################
+
+class FleetFamilyDecomposition():
+    """
+    Splits a fleet assignment into fleet families that share no station and no fleet.
+
+    Stations and fleets are joined through every flight and the fleets allowed to fly it. Each connected
+    component keeps its flights, its aircraft and its whole station time-lines, so its FAM can be solved
+    on its own and the component optima together are an optimum of the full schedule.
+    """
+
+    def __init__(self, flights_df, fleets_df, flight_no_col, origin_col, destination_col):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights, with the optional 'Allowed Fleets' column.
+        - fleets_df: DataFrame of the fleets as fleet_data saves it.
+        - flight_no_col, origin_col, destination_col: column indexes in flights_df.
+        """
+        fleet_list = fleets_df['Fleet Type'].tolist()
+        flights = flights_df.iloc[:, flight_no_col].astype(str).tolist()
+        compatibility = flight_fleet_compatibility(flights_df, flight_no_col, fleet_list)
+
+        parent = {}
+
+        def find(key):
+            parent.setdefault(key, key)
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for flight, origin, destination in zip(flights, flights_df.iloc[:, origin_col], flights_df.iloc[:, destination_col]):
+            parent[find(('station', destination))] = find(('station', origin))
+            for fleet in compatibility[flight]:
+                parent[find(('fleet', fleet))] = find(('station', origin))
+
+        # Components in the order of their first flight, fleets that fly nothing are left out
+        components = {}
+        for position, origin in enumerate(flights_df.iloc[:, origin_col]):
+            components.setdefault(find(('station', origin)), {'flights': [], 'fleets': [], 'stations': set()})['flights'].append(position)
+        for key in list(parent):
+            component = components.get(find(key))
+            if component is not None:
+                if key[0] == 'fleet':
+                    component['fleets'].append(key[1])
+                else:
+                    component['stations'].add(key[1])
+        for component in components.values():
+            component['fleets'].sort(key=fleet_list.index)
+        self.components = list(components.values())
+
+    def get_components(self):
+        """Returns a list of {'flights': row positions, 'fleets': fleet types, 'stations': set of stations} per family."""
+        return self.components
+
+    def get_component_frames(self, flights_df, fleets_df):
+        """Returns the (flights_df, fleets_df) of every family, to be taken before the FAM overwrites the flight times."""
+        return [(flights_df.iloc[component['flights']].reset_index(drop=True),
+                 fleets_df[fleets_df['Fleet Type'].isin(component['fleets'])].reset_index(drop=True))
+                for component in self.components]
+
+    @staticmethod
+    def load_solutions(model, Nodes_df, solutions):
+        """
+        Writes the WarmStartSolution of every family into the x, RON and y variables of the full model;
+        pairs no family covers (a fleet at a station of another family) are 0.
+        """
+        x, ron, y = {}, {}, {}
+        for solution in solutions:
+            x.update(solution.x)
+            ron.update(solution.ron)
+            y.update(solution.y)
+
+        for (flight, fleet), var in model.x.items():
+            var.set_value(round(x.get((int(flight), fleet), 0)))
+        for key, var in model.RON.items():
+            var.set_value(round(ron.get(key, 0)))
+        if model.y.ctype is not pyo.Var:
+            return
+        ground_arcs = WarmStartSolution.ground_arc_keys(Nodes_df)
+        for name, var in model.y.items():
+            arc, fleet = name.split(',', 1)
+            var.set_value(round(y.get(ground_arcs[arc] + (fleet,), 0)))
+
+##########################################################################################################     
+
 class flights_oeprating_costs:
     ''' Get the flights dataframe as input and calculate or import its operating costs based on fleet'''
     
@@ -487,146 +1084,728 @@ class VariableZ():
         
         
 ##########################################################################################################     
+class SpillCandidates():
+    """
+    Spill/recapture candidates of every itinerary, found market by market.
+
+    Itineraries are joined to the flights through a flight-number index to get their market (From, To).
+    Within a market, passengers of an itinerary can be recaptured by every itinerary of lower priority,
+    and by the dummy itinerary (number of itineraries + 1) that stands for the other airlines.
+    """
+
+    TYPE_PRIORITY = {'non_stop': 1, 'direct': 2, 'single_stop': 3, 'double_stop': 4}
+
+    def __init__(self, flights_df, itineraries_df, itinerary_no_col, flights_col, flight_no_col, origin_col, destination_col, type_col):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights.
+        - itineraries_df: DataFrame of the itineraries, its flights column lists the flight numbers separated by ', '.
+        - itinerary_no_col, flights_col, type_col: column indexes in itineraries_df.
+        - flight_no_col, origin_col, destination_col: column indexes in flights_df.
+        """
+        # First row of every flight number, as the boolean masks used to pick
+        flight_index = {}
+        for flight, origin, destination in zip(flights_df.iloc[:, flight_no_col], flights_df.iloc[:, origin_col], flights_df.iloc[:, destination_col]):
+            flight_index.setdefault(int(flight), (origin, destination))
+
+        self.numbers = itineraries_df.iloc[:, itinerary_no_col].tolist()
+        self.dummy_itinerary = str(len(itineraries_df) + 1)
+        self.origins = []
+        self.destinations = []
+        for number, flights in zip(self.numbers, itineraries_df.iloc[:, flights_col]):
+            flight_numbers = str(flights).split(', ')
+            try:
+                self.origins.append(flight_index[int(flight_numbers[0])][0])
+                self.destinations.append(flight_index[int(flight_numbers[-1])][1])
+            except KeyError as e:
+                raise ValueError(f"Flight {e.args[0]} of itinerary {number} is not in the flights data.")
+
+        self.type_priority = itineraries_df.iloc[:, type_col].map(self.TYPE_PRIORITY)
+
+        # Lower priority alternatives of each row, in row order
+        markets = pd.MultiIndex.from_arrays([self.origins, self.destinations]).factorize()[0] if self.numbers else np.array([], dtype=int)
+        type_priority = self.type_priority.to_numpy(dtype=float)
+        self.alternatives = [[] for _ in self.numbers]
+        order = np.argsort(markets, kind='stable')
+        bounds = np.flatnonzero(np.diff(markets[order])) + 1
+        for rows in np.split(order, bounds):
+            if len(rows) < 2:
+                continue
+            priority = type_priority[rows]
+            for p, r in zip(*np.nonzero(priority[:, None] < priority[None, :])):
+                self.alternatives[rows[p]].append(rows[r])
+
+    def get_spillage(self):
+        """Returns the spillage string of each itinerary: the dummy itinerary followed by its alternatives."""
+        return [', '.join([self.dummy_itinerary] + [str(self.numbers[r]) for r in alternatives]) for alternatives in self.alternatives]
+
+    def get_recapture_lists(self):
+        """Returns a dict of itinerary number -> numbers of the itineraries that can recapture its passengers."""
+        return {self.numbers[p]: [self.numbers[r] for r in alternatives] for p, alternatives in enumerate(self.alternatives)}
+
+    def get_spill_variables(self):
+        """Returns the t_p_r variable names, itinerary by itinerary, the dummy itinerary first."""
+        spill_variables = []
+        for number, alternatives in zip(self.numbers, self.alternatives):
+            spill_variables.append(f"t_{number}_{self.dummy_itinerary}")
+            spill_variables.extend(f"t_{number}_{self.numbers[r]}" for r in alternatives)
+        return spill_variables
+
+    def get_origins(self):
+        return self.origins
+
+    def get_destinations(self):
+        return self.destinations
+
+    def get_type_priority(self):
+        return self.type_priority
+
+##########################################################################################################     
+
 class spilled_and_captured_variables():
     
     def __init__(self,flights_df):    
         self.__flights_df=flights_df
+        self.candidates = None
             
     def Itinraries_df_simplify(self, itineraries_df,itinerary_no_col, flights_col, flight_no_col, origin_col, destination_col,type_col):
         """
         Output the itineraries dataframe after adding 'From', 'To', spillage itineraries, and optional or not.
         
         """
-       
-        # Making new column and place the origin and destination of itineraries according to the itinerary start and end flight
-        print("Flight No. Col:", flight_no_col)
-        print("Origin Col:", origin_col)
-        print("Destination Col:", destination_col)
-        
-        print("Flights DataFrame:")
-        print(self.__flights_df)
-        
-        print("Itineraries DataFrame:")
-        print(itineraries_df)
-            
-        for idx, itn in itineraries_df.iterrows():
-            
-            # Get the first and last flight numbers from the flights column
-            flight_numbers = [int(flight) for flight in str(itn.iloc[flights_col]).split(', ')]
-            first_flight_num, last_flight_num = flight_numbers[0], flight_numbers[-1]
-            
-            print(flight_numbers)
-            print(flights_col)
-            
-            
-            # Find the 'From' for the first flight and 'To' for the last flight
-            itineraries_df.at[idx, 'From'] = self.__flights_df.iloc[(self.__flights_df.iloc[:, flight_no_col] == first_flight_num).values, origin_col].iloc[0]
-            itineraries_df.at[idx, 'To'] = self.__flights_df.iloc[(self.__flights_df.iloc[:, flight_no_col] == last_flight_num).values, destination_col].iloc[0]
+        self.candidates = SpillCandidates(self.__flights_df, itineraries_df, itinerary_no_col, flights_col, flight_no_col, origin_col, destination_col, type_col)
+
+        # Origin of the first flight and destination of the last flight of each itinerary
+        itineraries_df['From'] = self.candidates.get_origins()
+        itineraries_df['To'] = self.candidates.get_destinations()
+
+        # The dummy itinerary (number of itineraries + 1) followed by the lower priority itineraries of the same market
+        itineraries_df['spillage'] = self.candidates.get_spillage()
+        itineraries_df['type_priority'] = self.candidates.get_type_priority()
 
-        # Make a spillage column and contain number of itineraries +1 which is the dummy itinerary    
-        itineraries_df['spillage'] = str(len(itineraries_df) + 1)
-        
-        # Define a mapping for itinerary types to integers reflecting their priority
-        type_priority = {'non_stop': 1, 'direct': 2, 'single_stop': 3, 'double_stop': 4}
-        # Convert itinerary types to their numeric priorities for comparison
-        itineraries_df['type_priority'] = itineraries_df.iloc[:,type_col].map(type_priority)
-        
-        # In the spillage column for each itinerary, check for other alternative itineraries and add its number in the column
-        for idx, itn in itineraries_df.iterrows():
-            spillage_itineraries = []
-            for idx2, itn2 in itineraries_df.iterrows():
-                if itn['From'] == itn2['From'] and itn['To'] == itn2['To'] and itn['type_priority'] < itn2['type_priority']:
-                    spillage_itineraries.append(str(itn2.iloc[itinerary_no_col]))
-
-            # Update spillage if there are other eligible itineraries
-            if spillage_itineraries:
-                itineraries_df.at[idx, 'spillage'] += ', ' + ', '.join(spillage_itineraries)
-
-        # Optionally drop the 'type_priority' column if it's no longer needed
         return itineraries_df
     
     def spill_recaptured_variables_list(self, itenraries_df,itinerary_no_col):
         ''' return a list of t_p_r which is the spllied from itenrary p and recaptured by iternrary r'''
         
         spilled_recaptured_vars=[]
-        # Spillage variables                
-        for idx, itn in itenraries_df.iterrows():
-            for spill_on in itn['spillage'].split(', '):
-                if spill_on != itn.iloc[itinerary_no_col]:
-                    
-                    # Add spill on the other itinerary that's accounting for spill to other airlines
-                    if spill_on == str(len(itenraries_df) + 1):
-                        var_name = "t_" + str(itn.iloc[itinerary_no_col]) + "_" + str(spill_on)
-                        spilled_recaptured_vars.append(var_name)
-                        
-                    
-                    else:
-                        #print("Itineraries data type")
-                        #print(itenraries_df.dtypes)
-                        #spill_on_type = itenraries_df[itenraries_df['itinerary'] == int(spill_on)]['type'].iloc[0]
-                        
-                        var_name = "t_" + str(itn.iloc[itinerary_no_col]) + "_" + str(spill_on)
-                        spilled_recaptured_vars.append(var_name)
-        
-        
-        # print(spilled_recaptured_vars)
+        for itinerary, spillage in zip(itenraries_df.iloc[:, itinerary_no_col].tolist(), itenraries_df['spillage']):
+            for spill_on in spillage.split(', '):
+                if spill_on != itinerary:
+                    spilled_recaptured_vars.append("t_" + str(itinerary) + "_" + str(spill_on))
+
         return(spilled_recaptured_vars)
     
+##########################################################################################################
+
+class SpillScreening():
+    """
+    Drops the t_p_r spill variables that can not change an IFAM solution.
+
+    A flight may only need spill when its unconstrained demand plus every passenger that could be
+    recaptured onto it exceeds the seats of the smallest fleet. Spilling from an itinerary that uses
+    no such flight never frees a needed seat, so its t_p_r are kept only where they pay off on their
+    own (recapture ratio x fare of r above the fare of p). The model keeps its optimum.
+    """
+
+    def __init__(self, itineraries_df, flight_numbers, itinerary_no_col, demand_col, fare_col, flights_col, spilled_recaptured_vars, seats, recapture_ratio):
+        """
+        Parameters:
+        - itineraries_df: DataFrame of the itineraries, its flights column lists the flight numbers separated by ', '.
+        - flight_numbers: flight numbers of the schedule.
+        - itinerary_no_col, demand_col, fare_col, flights_col: column indexes in itineraries_df.
+        - spilled_recaptured_vars: list of t_p_r variable names.
+        - seats: seats of every fleet that may fly the flights.
+        - recapture_ratio: share of the spilled passengers that are recaptured.
+        """
+        numbers = [str(number) for number in itineraries_df.iloc[:, itinerary_no_col]]
+        demands = itineraries_df.iloc[:, demand_col].tolist()
+        itinerary_flights = [list(dict.fromkeys(str(flights).split(', '))) for flights in itineraries_df.iloc[:, flights_col]]
+        demand, fare, flights = {}, {}, {}
+        # The first row of an itinerary number wins, as in ItineraryParameters
+        for number, itinerary_demand, itinerary_fare, legs in zip(numbers, demands, itineraries_df.iloc[:, fare_col], itinerary_flights):
+            demand.setdefault(number, itinerary_demand)
+            fare.setdefault(number, itinerary_fare)
+            flights.setdefault(number, legs)
+
+        spills = [(t_p_r, *t_p_r.split('_')[1:]) for t_p_r in spilled_recaptured_vars]
+        recapture_bound = {}
+        for t_p_r, p, r in spills:
+            recapture_bound[r] = recapture_bound.get(r, 0) + recapture_ratio * demand.get(p, 0)
+
+        # Unconstrained demand of a flight, and the same plus the most it could recapture
+        self.flight_demand = dict.fromkeys((str(flight) for flight in flight_numbers), 0)
+        flight_load = dict(self.flight_demand)
+        for number, itinerary_demand, legs in zip(numbers, demands, itinerary_flights):
+            for flight in legs:
+                if flight in self.flight_demand:
+                    self.flight_demand[flight] += itinerary_demand
+                    flight_load[flight] += itinerary_demand + recapture_bound.get(number, 0)
+
+        self.min_seats, self.max_seats = min(seats), max(seats)
+        self.constrained_flights = {flight for flight, load in flight_load.items() if load > self.min_seats}
+        self.always_constrained_flights = {flight for flight, flight_demand in self.flight_demand.items() if flight_demand > self.max_seats}
+
+        constrained_itineraries = {number for number, legs in flights.items() if self.constrained_flights.intersection(legs)}
+        self.spill_variables = [t_p_r for t_p_r, p, r in spills
+                                if p in constrained_itineraries or (r in fare and recapture_ratio * fare[r] > fare[p])]
+        self.candidates_number = len(spills)
+        logger.info(f"Spill screening: {len(self.constrained_flights)} of {len(flight_load)} flights may be constrained, "
+                    f"{self.get_skipped_number()} of {self.candidates_number} spill variables skipped")
+
+    def get_spill_variables(self):
+        """Returns the t_p_r names to build the model with, in their original order."""
+        return self.spill_variables
+
+    def get_skipped_number(self):
+        return self.candidates_number - len(self.spill_variables)
+
+    def get_report(self):
+        """Returns the figures shown with the IFAM results."""
+        return {'flights': len(self.flight_demand),
+                'constrained_flights': len(self.constrained_flights),
+                'always_constrained_flights': len(self.always_constrained_flights),
+                'spill_variables': len(self.spill_variables),
+                'skipped_spill_variables': self.get_skipped_number()}
+
+##########################################################################################################     
+
+class ItineraryParameters():
+    """
+    Itinerary number -> fare, demand and flights lookups for the IFAM objective terms,
+    with the t_p_r spill variable names parsed into (p, r) integer pairs once.
+    """
+
+    def __init__(self, itineraries_df, itinerary_no_col, demand_col, fare_col, flights_col, spilled_recaptured_vars=()):
+        """
+        Parameters:
+        - itineraries_df: DataFrame of the itineraries.
+        - itinerary_no_col, demand_col, fare_col, flights_col: column indexes in itineraries_df.
+        - spilled_recaptured_vars: list of t_p_r variable names.
+        """
+        self.numbers = [int(number) for number in itineraries_df.iloc[:, itinerary_no_col]]
+        self.dummy_itinerary = len(itineraries_df) + 1
+        self.fare = {}
+        self.demand = {}
+        self.flights = {}
+        # The first row of an itinerary number wins, as it did with the boolean masks
+        for number, fare, demand, flights in zip(self.numbers, itineraries_df.iloc[:, fare_col], itineraries_df.iloc[:, demand_col], itineraries_df.iloc[:, flights_col]):
+            if number not in self.fare:
+                self.fare[number] = fare
+                self.demand[number] = demand
+                self.flights[number] = str(flights).split(', ')
+
+        self.spill_keys = [(t_p_r, *self.parse_spill_key(t_p_r)) for t_p_r in spilled_recaptured_vars]
+        self.spills_from = {}
+        for t_p_r, p, r in self.spill_keys:
+            self.spills_from.setdefault(p, []).append(t_p_r)
+
+    @staticmethod
+    def parse_spill_key(t_p_r):
+        """'t_3_7' -> (3, 7)"""
+        _, p, r = t_p_r.split('_')
+        return int(p), int(r)
+
+    def spill_cost(self, spilled_recaptured_vars):
+        """Fare of itinerary p for every passenger spilled from p."""
+        return sum(spilled_recaptured_vars[t_p_r] * self.fare[p] for t_p_r, p, r in self.spill_keys)
+
+    def recaptured_revenue(self, spilled_recaptured_vars, recapture_ratio):
+        """Fare of itinerary r for the recaptured share of the passengers spilled onto r, the dummy itinerary excluded."""
+        return sum(spilled_recaptured_vars[t_p_r] * recapture_ratio * self.fare[r]
+                   for t_p_r, p, r in self.spill_keys
+                   if r != self.dummy_itinerary and 1 <= p < self.dummy_itinerary)
+
+    def revenue_loss_coefficients(self, optional_itineraries, demand_corrections):
+        """
+        Unconstrained revenue lost when an optional itinerary is cancelled, net of the corrected demand of the others.
+
+        Parameters:
+        - optional_itineraries: list of optional itinerary numbers.
+        - demand_corrections: dict of D_q_p name -> demand correction.
+
+        Returns:
+        - dict of optional itinerary number -> coefficient of (1 - z_q).
+        """
+        coefficients = {}
+        for q in optional_itineraries:
+            q = int(q)
+            coefficients[q] = self.demand[q] * self.fare[q] - sum(demand_corrections[f'D_{q}_{p}'] * self.fare[p]
+                                                                  for p in self.numbers if f'D_{q}_{p}' in demand_corrections)
+        return coefficients
+
+    def get_spills_from(self, p):
+        """Returns the t_p_r names spilling from itinerary p."""
+        return self.spills_from.get(int(p), [])
+
 ##########################################################################################################     
 
 class DemandCorrection():
+    """
+    Demand correction D_q_p of every optional itinerary q towards every other itinerary p.
+
+    Each itinerary's flights are a row of a sparse itinerary x flight incidence. The pairs sharing a flight come
+    from the product of the optional rows with that incidence, taken through a flight -> itineraries index, and
+    same-market/different-market pairs are told apart with array comparisons.
+    """
+
+    PAIRS_PER_BLOCK = 2_000_000
+
     def __init__(self, itineraries_df, demand_increase_factor, demand_decrease_factor, optional_itineraries, optional_flight, itinerary_no_col, flights_col, demand_col):
-        # Create an empty list to store each row of the new DataFrame
-        self.data = []
-        
-        # Iterate over each itinerary
-        for index1, row1 in itineraries_df.iterrows():
-            # Ensure 'flights' is a list of strings
-            flights_of_first_itinerary = str(row1.iloc[flights_col]).split(', ')    
-            # Check if this itinerary is cancellable
-            if row1.iloc[itinerary_no_col] in optional_itineraries:
-                # Compare with every other itinerary
-                for index2, row2 in itineraries_df.iterrows():
-                    if index1 != index2:
-                        flights_of_second_itinerary = str(row2.iloc[flights_col]).split(', ')
-                        shared_flights = set(flights_of_first_itinerary).intersection(flights_of_second_itinerary)
-                        
-                        # Construct the column name
-                        column_name = f"D_{row1.iloc[itinerary_no_col]}_{row2.iloc[itinerary_no_col]}"
-                        append_data = True  # Initialize flag to append data
-                        
-                        if not shared_flights:
-                            if row1['From'] == row2['From'] and row1['To'] == row2['To'] and row1['type_priority'] <= row2['type_priority']:
-                                # Same origin and destination and no shared flights with valid priority
-                                value = (demand_increase_factor/100) * row1.iloc[demand_col]  # Increase by 15%
-                            else:
-                                # Different origin or destination and no shared flights
-                                value = (-demand_decrease_factor/100) * row1.iloc[demand_col]  # Decrease by 5%
-                                
-                        elif shared_flights:
-                            for flight in flights_of_second_itinerary:
-                                if flight in optional_flight:
-                                    append_data = False  # Do not append data if the shared flight is cancellable
-                                                
-                                else:
-                                    if row1['From'] == row2['From'] and row1['To'] == row2['To'] and row1['type_priority'] <= row2['type_priority']:
-                                        # Same origin and destination and shared flights with valid priority
-                                        value = (demand_increase_factor/100) * row1.iloc[demand_col]  # Increase by 15%
-                                    else:
-                                        # Different origin or destination and shared flights
-                                        value = (-demand_decrease_factor/100) * row1.iloc[demand_col]  # Decrease by 5%
-                        
-                        # Check the flag before appending
-                        if append_data:
-                            if value >= 0:
-                                value = math.ceil(value)
-                            else:
-                                value = math.floor(value)
-                            self.data.append({'name': column_name, 'value': value})
-                            
+        """
+        Parameters:
+        - itineraries_df: DataFrame of the itineraries with the From, To and type_priority columns of Itinraries_df_simplify.
+        - demand_increase_factor, demand_decrease_factor: percentages applied to the demand of q.
+        - optional_itineraries: list of optional itinerary numbers.
+        - optional_flight: list of optional flight numbers as strings.
+        - itinerary_no_col, flights_col, demand_col: column indexes in itineraries_df.
+        """
+        numbers = itineraries_df.iloc[:, itinerary_no_col].tolist()
+        itineraries_number = len(numbers)
+        flights = [str(itinerary_flights).split(', ') for itinerary_flights in itineraries_df.iloc[:, flights_col]]
+
+        # Sparse incidence: entry k links itinerary entry_rows[k] to flight entry_flights[k]
+        entry_rows = np.repeat(np.arange(itineraries_number), [len(itinerary_flights) for itinerary_flights in flights])
+        entry_flights, flight_numbers = pd.factorize(pd.Index(list(itertools.chain.from_iterable(flights)), dtype=object))
+        optional_flight = set(optional_flight)
+        optional_entries = np.array([flight in optional_flight for flight in flight_numbers], dtype=bool)[entry_flights]
+        has_optional_flight = np.bincount(entry_rows[optional_entries], minlength=itineraries_number) > 0
+
+        # Flight -> itineraries index (the incidence transposed)
+        order = np.argsort(entry_flights, kind='stable')
+        flight_rows = entry_rows[order]
+        flight_ptr = np.searchsorted(entry_flights[order], np.arange(len(flight_numbers) + 1))
+
+        optional_rows = np.flatnonzero(itineraries_df.iloc[:, itinerary_no_col].isin(list(optional_itineraries)).to_numpy())
+        markets = pd.MultiIndex.from_arrays([itineraries_df['From'], itineraries_df['To']]).factorize()[0]
+        type_priority = itineraries_df['type_priority'].to_numpy(dtype=float)
+        demand = itineraries_df.iloc[:, demand_col].to_numpy(dtype=float)
+
+        self.names = []
+        values = []
+        block_size = max(1, self.PAIRS_PER_BLOCK // max(itineraries_number, 1))
+        for start in range(0, len(optional_rows), block_size):
+            rows = optional_rows[start:start + block_size]
+            shared = self.shared_flights(rows, entry_rows, entry_flights, flight_rows, flight_ptr, itineraries_number)
+
+            # A pair sharing flights is left out when the other itinerary has an optional flight
+            keep = ~shared | ~has_optional_flight[None, :]
+            keep[np.arange(len(rows)), rows] = False
+
+            same_market = (markets[rows][:, None] == markets[None, :]) & (type_priority[rows][:, None] <= type_priority[None, :])
+            value = np.where(same_market, (demand_increase_factor/100) * demand[rows][:, None], (-demand_decrease_factor/100) * demand[rows][:, None])
+            value = np.where(value >= 0, np.ceil(value), np.floor(value))
+
+            q, p = np.nonzero(keep)
+            self.names.extend(f"D_{numbers[rows[i]]}_{numbers[j]}" for i, j in zip(q.tolist(), p.tolist()))
+            values.append(value[q, p])
+
+        self.values = np.concatenate(values).astype('int64') if values else np.array([], dtype='int64')
+
+    @staticmethod
+    def shared_flights(rows, entry_rows, entry_flights, flight_rows, flight_ptr, itineraries_number):
+        """Boolean matrix of the given itineraries (rows) against all itineraries, True where they share a flight."""
+        shared = np.zeros((len(rows), itineraries_number), dtype=bool)
+        block_row = np.full(itineraries_number, -1)
+        block_row[rows] = np.arange(len(rows))
+
+        entries = block_row[entry_rows] >= 0
+        owners = block_row[entry_rows[entries]]
+        starts = flight_ptr[entry_flights[entries]]
+        counts = flight_ptr[entry_flights[entries] + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        shared[np.repeat(owners, counts), flight_rows[np.repeat(starts, counts) + offsets]] = True
+        return shared
+
     def get_demand_correction_df(self):
         # Create DataFrame from the list
-        self.demand_correction_factor_df = pd.DataFrame(self.data)
+        self.demand_correction_factor_df = pd.DataFrame({'name': self.names, 'value': self.values})
         return self.demand_correction_factor_df
-    
-    
\ No newline at end of file
+
+    def get_demand_correction_lookup(self):
+        """Returns the corrections as a dict of D_q_p name -> value."""
+        lookup = {}
+        for name, value in zip(self.names, self.values.tolist()):
+            lookup.setdefault(name, value)
+        return lookup
+
+##########################################################################################################     
+
+class FlightInteractionIndex():
+    """
+    Incidences behind the flight interaction constraints, built once as CSR arrays:
+    - flight -> itineraries using the flight: flight_itineraries[flight_ptr[f]:flight_ptr[f+1]]
+    - itinerary -> t_p_r variables spilling from it: spill_out[out_ptr[i]:out_ptr[i+1]]
+    - itinerary -> t_p_r variables recaptured by it: spill_in[in_ptr[i]:in_ptr[i+1]]
+    Flights and itineraries are row positions, variables are positions in spilled_recaptured_vars.
+    """
+
+    def __init__(self, flights_df, itineraries_df, flight_no_col, itinerary_no_col, flights_col, demand_col, spilled_recaptured_vars):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights.
+        - itineraries_df: DataFrame of the itineraries, its flights column lists the flight numbers separated by ', '.
+        - flight_no_col: column index in flights_df.
+        - itinerary_no_col, flights_col, demand_col: column indexes in itineraries_df.
+        - spilled_recaptured_vars: list of t_p_r variable names.
+        """
+        self.flight_numbers = [str(flight) for flight in flights_df.iloc[:, flight_no_col]]
+        self.itinerary_numbers = [str(number) for number in itineraries_df.iloc[:, itinerary_no_col]]
+        self.demand = itineraries_df.iloc[:, demand_col].tolist()
+        self.spill_names = list(spilled_recaptured_vars)
+
+        flight_rows = {}
+        for row, flight in enumerate(self.flight_numbers):
+            flight_rows.setdefault(flight, []).append(row)
+        pairs = [(flight_row, row)
+                 for row, flights in enumerate(itineraries_df.iloc[:, flights_col])
+                 for flight in dict.fromkeys(str(flights).split(', '))
+                 for flight_row in flight_rows.get(flight, [])]
+        self.flight_ptr, self.flight_itineraries = self.csr(pairs, len(self.flight_numbers))
+
+        itinerary_rows = {}
+        for row, number in enumerate(self.itinerary_numbers):
+            itinerary_rows.setdefault(number, []).append(row)
+        spill_out, spill_in = [], []
+        for position, t_p_r in enumerate(self.spill_names):
+            _, p, r = t_p_r.split('_')
+            spill_out.extend((row, position) for row in itinerary_rows.get(p, []))
+            spill_in.extend((row, position) for row in itinerary_rows.get(r, []))
+        self.out_ptr, self.spill_out = self.csr(spill_out, len(self.itinerary_numbers))
+        self.in_ptr, self.spill_in = self.csr(spill_in, len(self.itinerary_numbers))
+
+    @staticmethod
+    def csr(pairs, rows_number):
+        """(row, column) pairs -> (ptr, columns) with the columns of each row in ascending order."""
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        ptr = np.zeros(rows_number + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs[:, 0], minlength=rows_number), out=ptr[1:])
+        return ptr, pairs[order, 1]
+
+    def add_flight_interaction_constraints(self, model, fleet_capacities, recapture_ratio, demand_corrections=None, optional_itineraries=()):
+        """
+        Adds model.flight_interaction, one constraint per flight:
+        spilled - recaptured passengers >= unconstrained demand (+ demand correction) - seats.
+
+        Parameters:
+        - model: model with the x, spilled_recaptured_vars and, for demand corrections, z variables.
+        - fleet_capacities: list of (fleet type, number of seats).
+        - recapture_ratio: share of the spilled passengers that are recaptured.
+        - demand_corrections: optional dict of D_q_p name -> value (ISD-IFAM).
+        - optional_itineraries: optional itinerary numbers whose corrections apply.
+
+        Returns:
+        - The ConstraintList.
+        """
+        t_p_r = model.spilled_recaptured_vars
+        flight_ptr, flight_itineraries = self.flight_ptr.tolist(), self.flight_itineraries.tolist()
+        out_ptr, spill_out = self.out_ptr.tolist(), self.spill_out.tolist()
+        in_ptr, spill_in = self.in_ptr.tolist(), self.spill_in.tolist()
+
+        corrections = [[] for _ in self.itinerary_numbers]
+        if demand_corrections:
+            optional = {str(q) for q in optional_itineraries}
+            itinerary_rows = {}
+            for row, number in enumerate(self.itinerary_numbers):
+                itinerary_rows.setdefault(number, []).append(row)
+            for name, value in demand_corrections.items():
+                _, q, p = name.split('_')
+                if q in optional:
+                    for row in itinerary_rows.get(p, []):
+                        corrections[row].append((q, value))
+
+        model.flight_interaction = ConstraintList()
+        for k, flight in enumerate(self.flight_numbers):
+            rows = flight_itineraries[flight_ptr[k]:flight_ptr[k + 1]]
+
+            spilled_passengers = sum(t_p_r[self.spill_names[v]] for row in rows for v in spill_out[out_ptr[row]:out_ptr[row + 1]])
+            recaptured_passengers = sum(recapture_ratio * t_p_r[self.spill_names[v]] for row in rows for v in spill_in[in_ptr[row]:in_ptr[row + 1]])
+            flight_unconstrained_demand = sum(self.demand[row] for row in rows)
+            flight_seats_available = sum(model.x[flight, fleet] * seats for fleet, seats in fleet_capacities)
+            flight_demand_correction = sum(value * (1 - model.z[q]) for row in rows for q, value in corrections[row])
+
+            model.flight_interaction.add(expr=spilled_passengers - recaptured_passengers >= flight_unconstrained_demand + flight_demand_correction - flight_seats_available)
+        return model.flight_interaction
+
+    def get_flight_itineraries(self):
+        return self.flight_ptr, self.flight_itineraries
+
+    def get_spill_out(self):
+        return self.out_ptr, self.spill_out
+
+    def get_spill_in(self):
+        return self.in_ptr, self.spill_in
+
+
+##########################################################################################################
+
+class ISDIFAMNetwork():
+    """
+    The parts of an ISD-IFAM model that do not depend on the recapture ratio or the demand adjustment percentages:
+    time-line nodes, operating costs, optional flights and itineraries, spill/recapture variables and the
+    flight interaction index.
+
+    It is built once per upload and writes the model of any number of (recapture ratio, demand adjustment) scenarios.
+    flights_df and itineraries_df are prepared in place the way the ISD-IFAM view always did.
+    """
+
+    def __init__(self, flights_df, fleets_df, itineraries_df, flight_column_indexes, itinerary_column_indexes, aggregate_ground_arcs=False):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights with its 'Optional' column and the optional 'Allowed Fleets' column.
+        - fleets_df: DataFrame of the fleets.
+        - itineraries_df: DataFrame of the itineraries.
+        - flight_column_indexes, itinerary_column_indexes: dicts of column indexes saved by the upload steps.
+        - aggregate_ground_arcs: bool, write the balance with BalanceConstraintBuilder.add_aggregated_balance_constraints().
+        """
+        self.aggregate_ground_arcs = aggregate_ground_arcs
+        self.flights_df = flights_df
+        self.fleets_df = fleets_df
+        self.itineraries_df = itineraries_df
+        self.flight_no_col = flight_column_indexes.get('flight number')
+        self.origin_col = flight_column_indexes.get('origin')
+        self.departure_col = flight_column_indexes.get('departure')
+        self.destination_col = flight_column_indexes.get('destination')
+        self.arrival_col = flight_column_indexes.get('arrival')
+        self.distance_col = flight_column_indexes.get('distance')
+        self.itinerary_no_col = itinerary_column_indexes.get('itinerary')
+        self.demand_col = itinerary_column_indexes.get('demand')
+        self.fare_col = itinerary_column_indexes.get('fare')
+        self.flights_col = itinerary_column_indexes.get('flights')
+        self.type_col = itinerary_column_indexes.get('type')
+
+        self.station_list = np.unique(flights_df.iloc[:, self.origin_col].to_list())
+        self.flights_list = flights_df.iloc[:, self.flight_no_col].astype(str).tolist()
+        self.fleet_list = fleets_df['Fleet Type'].tolist()
+        self.compatibility = flight_fleet_compatibility(flights_df, self.flight_no_col, self.fleet_list)
+
+        # ****************** Time-line nodes and ground arcs **************** #
+        dep_arriv = ClockToMinutes(flights_df, self.departure_col, self.arrival_col)
+        self.dep = dep_arriv.get_departure_minutes()
+        self.arriv = dep_arriv.get_arrival_minutes()
+        self.Nodes_df = NodesGenerator(flights_df, self.station_list, self.flight_no_col, self.origin_col, self.destination_col,
+                                       self.departure_col, self.arrival_col, self.dep, self.arriv).get_nodes()
+        self.var_y = None if aggregate_ground_arcs else VariableY(self.Nodes_df, self.station_list, self.fleet_list).get_y()
+        self.balance = BalanceConstraintBuilder(self.Nodes_df, self.fleet_list)
+
+        self.Ne = {}
+        for number_of_airplane in range(len(fleets_df)):
+            self.Ne[fleets_df.iloc[number_of_airplane]['Fleet Type']] = fleets_df.iloc[number_of_airplane]['Number of Aircrafts']
+
+        # ****************** Operating costs C(f,e) **************** #
+        cost_list = flights_oeprating_costs(flights_df, fleets_df).given_operating_cost(self.distance_col, fleets_df['Operating Cost Per Mile'].tolist())
+        self.C_fe = {}
+        cost_list_counter = 0
+        for i in dict.fromkeys(self.flights_list):
+            for j in dict.fromkeys(self.fleet_list):
+                self.C_fe[f'{i},{j}'] = cost_list[cost_list_counter]
+                cost_list_counter += 1
+
+        # ****************** Optional flights and itineraries **************** #
+        cat = FlightsCategorization(flights_df, self.flight_no_col)
+        self.optional_flights = cat.optional_flights
+        self.non_optional_flights = cat.non_optional_flights
+
+        optional_flight_set = {str(flight) for flight in self.optional_flights}
+        self.optional_itinerary_list = []
+        for itinerary, itinerary_flights in zip(itineraries_df.iloc[:, self.itinerary_no_col], itineraries_df.iloc[:, self.flights_col]):
+            if optional_flight_set.intersection(str(itinerary_flights).split(", ")) and itinerary not in self.optional_itinerary_list:
+                self.optional_itinerary_list.append(itinerary)
+
+        for idx in range(len(itineraries_df)):
+            if itineraries_df.iloc[idx, self.itinerary_no_col] in self.optional_itinerary_list:
+                itineraries_df.at[idx, 'Optional'] = 1
+        itineraries_df.fillna(0, inplace=True)
+        self.var_z = VariableZ(itineraries_df, self.itinerary_no_col).get_z()
+        self.itineraries_demand_list = itineraries_df.iloc[:, self.demand_col].tolist()
+
+        # ****************** Spill/recapture variables and itinerary parameters **************** #
+        data1 = spilled_and_captured_variables(flights_df)
+        itineraries_df = spilled_and_captured_variables.Itinraries_df_simplify(data1, itineraries_df, self.itinerary_no_col, self.flights_col,
+                                                                              self.flight_no_col, self.origin_col, self.destination_col, self.type_col)
+        itineraries_df.iloc[:, self.itinerary_no_col] = itineraries_df.iloc[:, self.itinerary_no_col].astype('int64')
+        self.itineraries_df = itineraries_df
+        self.spilled_recaptured_vars = spilled_and_captured_variables.spill_recaptured_variables_list(data1, itineraries_df, self.itinerary_no_col)
+        self.itinerary_parameters = ItineraryParameters(itineraries_df, self.itinerary_no_col, self.demand_col, self.fare_col, self.flights_col, self.spilled_recaptured_vars)
+        itineraries_df['market'] = itineraries_df.apply(lambda row: [row['From'], row['To']], axis=1)
+
+        self.optional_itineraries = np.array(self.optional_itinerary_list, dtype='int64')
+        self.optional_itinerary_flights = {
+            opt_iten: str(itineraries_df.iloc[(itineraries_df.iloc[:, self.itinerary_no_col] == opt_iten).values, self.flights_col].iloc[0]).split(", ")
+            for opt_iten in self.optional_itineraries}
+        self.R_Unconstrained_Revenue = sum(itineraries_df.iloc[idx, self.demand_col] * itineraries_df.iloc[idx, self.fare_col] for idx in range(len(itineraries_df)))
+
+        # ****************** Flight interaction index **************** #
+        self.flight_interaction_index = FlightInteractionIndex(flights_df, itineraries_df, self.flight_no_col, self.itinerary_no_col, self.flights_col,
+                                                               self.demand_col, list(dict.fromkeys(self.spilled_recaptured_vars)))
+        self.fleet_capacities = list(zip(fleets_df['Fleet Type'], fleets_df['Number of Seats']))
+
+    def get_demand_corrections(self, decrease_demand_percentage, increase_demand_percentage):
+        """Returns the demand correction lookup {'D_q_p': value} of one demand adjustment scenario."""
+        demand_correction = DemandCorrection(self.itineraries_df, increase_demand_percentage, decrease_demand_percentage, self.optional_itinerary_list,
+                                             self.optional_flights, self.itinerary_no_col, self.flights_col, self.demand_col)
+        return demand_correction.get_demand_correction_lookup()
+
+    def build_model(self, recapture_ratio, decrease_demand_percentage, increase_demand_percentage):
+        """
+        Writes the ISD-IFAM model of one scenario.
+
+        Parameters:
+        - recapture_ratio: float, share of the spilled passengers an itinerary of the same market recaptures.
+        - decrease_demand_percentage, increase_demand_percentage: demand adjustment percentages of DemandCorrection.
+
+        Returns:
+        - The Pyomo model.
+        """
+        model = ConcreteModel()
+        model.setF = pyo.Set(initialize=self.flights_list)     # set of flights
+        model.setE = pyo.Set(initialize=self.fleet_list)       # set of fleet
+        model.setS = pyo.Set(initialize=self.station_list)     # set of stations
+
+        model.x = pyo.Var(model.setF, model.setE, within=Binary, bounds=(0, None))
+        x = model.x
+        model.RON = pyo.Var(model.setS, model.setE, within=Integers, bounds=(0, None))
+        RON = model.RON
+        # A fleet the flight does not allow can not be assigned to it
+        for f in model.setF:
+            for e in set(self.fleet_list).difference(self.compatibility[f]):
+                x[f, e].setub(0)
+        if not self.aggregate_ground_arcs:
+            model.y = pyo.Var(self.var_y, within=Integers, bounds=(0, None))
+
+        model.setF_optional = pyo.Set(initialize=self.optional_flights)             # set of optional flights
+        model.setF_non_optional = pyo.Set(initialize=self.non_optional_flights)     # set of non optional flights
+        model.setp = pyo.RangeSet(len(self.itineraries_df))                         # set of itineraries
+        model.setp_optional = pyo.Set(initialize=self.optional_itinerary_list)      # set of optional itineraries
+
+        if self.var_z is not None:
+            model.z = pyo.Var(self.var_z, within=Binary, bounds=(0, 1))
+        demand_list = self.itineraries_demand_list
+        model.t_spilled = pyo.Var(model.setp, within=pyo.Integers, bounds=lambda model, i: (0, demand_list[i-1]))
+        model.spilled_recaptured_vars = pyo.Var(self.spilled_recaptured_vars, within=Integers, bounds=(0, None))
+
+        demand_corrections = self.get_demand_corrections(decrease_demand_percentage, increase_demand_percentage)
+
+        # ****************** Objective Function **************** #
+        C_Operating_cost = sum(self.C_fe[f"{f},{e}"] * model.x[f, e] for f in model.setF for e in model.setE)
+        S_Spill_Cost = self.itinerary_parameters.spill_cost(model.spilled_recaptured_vars)
+        M_Recaptured_Revenue = self.itinerary_parameters.recaptured_revenue(model.spilled_recaptured_vars, recapture_ratio)
+        revenue_loss = self.itinerary_parameters.revenue_loss_coefficients(self.optional_itineraries, demand_corrections)
+        DeltaR_Uncontrained_Revenue_Loss = sum(revenue_loss[opt_iten] * (1 - model.z[f'{opt_iten}']) for opt_iten in self.optional_itineraries)
+        model.obj = pyo.Objective(
+            expr=(-C_Operating_cost - S_Spill_Cost + self.R_Unconstrained_Revenue + M_Recaptured_Revenue - DeltaR_Uncontrained_Revenue_Loss),
+            sense=pyo.maximize
+        )
+
+        # ****************** Coverage Constraint **************** #
+        model.coverage = ConstraintList()
+        for f in model.setF:
+            if f in model.setF_optional:
+                model.coverage.add(expr=sum([x[f, e] for e in model.setE]) <= 1)
+            elif f in model.setF_non_optional:
+                model.coverage.add(expr=sum([x[f, e] for e in model.setE]) == 1)
+
+        # ****************** Resources Constraint **************** #
+        model.resources = ConstraintList()
+        for e in model.setE:
+            model.resources.add(expr=sum([RON[station, e] for station in model.setS]) <= self.Ne[e])
+
+        # ****************** Balance Constraint **************** #
+        if self.aggregate_ground_arcs:
+            self.balance.add_aggregated_balance_constraints(model, self.compatibility)
+        else:
+            self.balance.add_balance_constraints(model)
+
+        # ****************** Flight Interaction Constraint **************** #
+        self.flight_interaction_index.add_flight_interaction_constraints(model, self.fleet_capacities, recapture_ratio, demand_corrections, self.optional_itineraries)
+
+        # ****************** Spill-Recapture & Demand Constraints **************** #
+        model.demand = ConstraintList()
+        model.spill_recapture = ConstraintList()
+        for itn in range(len(self.itineraries_df)):
+            itenrary = self.itineraries_df.iloc[itn, self.itinerary_no_col]
+            t_p_r__sum = sum(model.spilled_recaptured_vars[t_p_r] for t_p_r in self.itinerary_parameters.get_spills_from(itenrary))
+            demand_correction_factor_sum = sum(demand_corrections[f'D_{opt_iten}_{itenrary}'] * (1-model.z[f'{opt_iten}'])
+                                               for opt_iten in self.optional_itineraries if f'D_{opt_iten}_{itenrary}' in demand_corrections)
+            model.demand.add(expr=t_p_r__sum - self.itineraries_df.iloc[itn, self.demand_col] - demand_correction_factor_sum <= 0)
+            model.spill_recapture.add(expr=t_p_r__sum == model.t_spilled[itenrary])
+
+        # ****************** Ensure Zq = 0 and Zq = 1 Constraints **************** #
+        model.Ensure_Z_is_zero = ConstraintList()
+        for opt_iten in self.optional_itineraries:
+            for flight in self.optional_itinerary_flights[opt_iten]:
+                model.Ensure_Z_is_zero.add(expr=model.z[f'{opt_iten}'] <= sum([x[flight, e] for e in model.setE]))
+
+        model.Ensure_Z_is_ONE = ConstraintList()
+        for opt_iten in self.optional_itineraries:
+            opt_iten_flights = self.optional_itinerary_flights[opt_iten]
+            N_q = len(opt_iten_flights)  # Number of flights in optional itinerary
+            model.Ensure_Z_is_ONE.add(expr=model.z[f'{opt_iten}'] - sum([x[flight, e] for e in model.setE for flight in opt_iten_flights]) >= 1-N_q)
+
+        return model
+
+    def get_flights_df(self):
+        return self.flights_df
+
+    def get_itineraries_df(self):
+        return self.itineraries_df
+
+    def get_nodes(self):
+        return self.Nodes_df
+
+##########################################################################################################
+
+def scenario_grid(recapture_ratios, decrease_demand_percentages, increase_demand_percentages):
+    """Returns every (recapture ratio, decrease %, increase %) combination as a list of scenario dicts."""
+    return [{'recapture_ratio': recapture_ratio, 'decrease_demand_percentage': decrease, 'increase_demand_percentage': increase}
+            for recapture_ratio, decrease, increase in itertools.product(recapture_ratios, decrease_demand_percentages, increase_demand_percentages)]
+
+
+def isd_scenario_summary(model, network, solver_config, results, scenario):
+    """
+    Returns one row of the scenario comparison table: objective, spilled and recaptured passengers,
+    and the flights and aircraft of every fleet.
+
+    Parameters:
+    - model: the ISD-IFAM model of the scenario after solving.
+    - network: the ISDIFAMNetwork it was built from.
+    - solver_config: SolverConfig it was solved with.
+    - results: the Pyomo results object.
+    - scenario: dict from scenario_grid().
+    """
+    row = {'Recapture Ratio': scenario['recapture_ratio'],
+           'Decrease in Demand %': scenario['decrease_demand_percentage'],
+           'Increase in Demand %': scenario['increase_demand_percentage'],
+           'Status': str(results.solver.termination_condition)}
+    if not solver_config.is_solved(results):
+        return row
+
+    fleet_flights = dict.fromkeys(network.fleet_list, 0)
+    for (flight, fleet), value in model.x.extract_values().items():
+        if value is not None and round(value) == 1:
+            fleet_flights[fleet] += 1
+    fleet_aircraft = dict.fromkeys(network.fleet_list, 0)
+    for (station, fleet), value in model.RON.extract_values().items():
+        fleet_aircraft[fleet] += int(round(value or 0))
+
+    parameters = network.itinerary_parameters
+    recaptured = sum(value for t_p_r, value in model.spilled_recaptured_vars.extract_values().items()
+                     if value and parameters.parse_spill_key(t_p_r)[1] != parameters.dummy_itinerary)
+
+    row['Objective'] = round(pyo.value(model.obj), 2)
+    row['Operated Flights'] = sum(fleet_flights.values())
+    row['Spilled Passengers'] = int(round(sum(value or 0 for value in model.t_spilled.extract_values().values())))
+    row['Recaptured Passengers'] = round(scenario['recapture_ratio'] * recaptured, 1)
+    for fleet in network.fleet_list:
+        row[f'{fleet} Flights'] = fleet_flights[fleet]
+        row[f'{fleet} Aircraft'] = fleet_aircraft[fleet]
+    return row
+
+
+def scenario_comparison_df(rows):
+    """Returns the scenario rows as a table, best objective first and unsolved scenarios last."""
+    comparison_df = pd.DataFrame(rows)
+    if 'Objective' in comparison_df.columns:
+        comparison_df = comparison_df.sort_values('Objective', ascending=False, na_position='last', kind='stable')
+    return comparison_df.reset_index(drop=True)
@@ -1,24 +1,33 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
-from .forms import ExcelUploadForm, create_column_index_form, create_solver_selection_form, FleetCountForm, create_fleet_detail_form, create_optional_flights_form, DemandAdjustmentForm, RecaptureRatioForm
-from .utils import SyncReadExcel, FlightColumnIndex, ItinColumnIndex, ClockToMinutes, NodesGenerator, VariableY, flights_oeprating_costs, FlightsCategorization, VariableZ, spilled_and_captured_variables, DemandCorrection
+from .forms import ExcelUploadForm, create_column_index_form, create_solver_selection_form, FleetCountForm, create_fleet_detail_form, create_optional_flights_form, DemandAdjustmentForm, RecaptureRatioForm, ScenarioSweepForm
+from .utils import SyncReadExcel, FlightColumnIndex, ItinColumnIndex, ClockToMinutes, NodesGenerator, VariableY, BalanceConstraintBuilder, ScheduleDiff, WarmStartSolution, solve_incrementally, FAMModel, FleetFamilyDecomposition, flight_fleet_compatibility, flights_oeprating_costs, spilled_and_captured_variables, SpillScreening, ItineraryParameters, FlightInteractionIndex, ISDIFAMNetwork, scenario_grid, scenario_comparison_df
 import pandas as pd
 import json
 import numpy as np
-from io import StringIO
 from pyomo.util.infeasible import log_infeasible_constraints
 import pyomo.environ as pyo 
 from pyomo.environ import *
-from pyomo.opt import SolverFactory
 import os
+import time
 from django.conf import settings
 import traceback
 from django.http import FileResponse, HttpResponseNotFound, HttpResponse, HttpResponseServerError
 from django.http import JsonResponse
+from django.urls import reverse
+from celery import group
+from celery.result import AsyncResult
+from kombu.exceptions import OperationalError
+from .tasks import solve_isd_scenario, run_scenario_sweep, run_fam_decomposition, concurrent_solver_config
+from SkyLinker.artifacts import get_artifact_store, save_session_frame, load_session_frame, normalize_frame, save_session_artifact, load_session_artifact, redirect_when_expired
+from SkyLinker.solvers import SolverConfig
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds the scenario sweep may go without a newly solved scenario before its status is reported as stale
+SCENARIO_SWEEP_STALE_SECONDS = 15 * 60
+
 @login_required
 def upload_flights_excel(request):
     if request.method == 'POST':
@@ -36,13 +45,8 @@ def upload_flights_excel(request):
                 # Handle the error (e.g., display an error message to the user)
                 return render(request, 'pages/fleetassignment.html', {'flight_excel_form': form, 'error_message': str(e)})
 
-            # Convert DataFrame to JSON for session storage
-            flights_df_json = read_excel.get_dataframe().to_json(orient='split')
-            flights_list = read_excel.get_data_list()
-
-            # Store in session
-            request.session['flights_df'] = flights_df_json
-            request.session['flights_list'] = flights_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'flights_df', normalize_frame(read_excel.get_dataframe()))
 
             return redirect('process_flight_columns')
     else:
@@ -50,14 +54,14 @@ def upload_flights_excel(request):
 
     return render(request, 'pages/fleetassignment.html', {'flight_excel_form': form})
 
+@redirect_when_expired('upload_flights_excel')
 def process_flight_columns(request):
     if 'flights_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_flights_excel')
 
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
     # Initialize ColumnIndex with DataFrame
     flight_column_index = FlightColumnIndex(flights_df)
@@ -145,10 +149,8 @@ def fleet_data(request):
                     fleet_details.append(fleet_data)
 
                 fleets_df = pd.DataFrame(fleet_details)
-                fleet_list = fleets_df['Fleet Type'].tolist()
                 
-                request.session['fleets_df'] = fleets_df.to_json(orient='split')
-                request.session['fleet_list'] = fleet_list
+                save_session_frame(request, 'fleets_df', fleets_df)
                 # Process valid forms
                 # Do something with the data
                 return redirect('solver_selection')
@@ -171,8 +173,23 @@ def solver_selection(request):
             # Extract selected solver from the form
             selected_solver = solver_selection_form.cleaned_data['solver']
             
+            mip_gap = solver_selection_form.cleaned_data['mip_gap']
+            solver_config = SolverConfig(
+                solver=solver_selection_form.cleaned_data['mip_solver'],
+                threads=solver_selection_form.cleaned_data['threads'],
+                time_limit=solver_selection_form.cleaned_data['time_limit'],
+                mip_gap=mip_gap / 100 if mip_gap is not None else None,
+                return_incumbent=solver_selection_form.cleaned_data['return_incumbent'],
+                persistent=solver_selection_form.cleaned_data['persistent'],
+            )
+            
             # Save the extracted values into the session
             request.session['selected_solver'] = selected_solver
+            request.session['solver_config'] = solver_config.to_dict()
+            request.session['incremental_resolve'] = solver_selection_form.cleaned_data['incremental']
+            request.session['keep_unaffected_assignments'] = solver_selection_form.cleaned_data['keep_unaffected']
+            request.session['decompose_fleet_families'] = solver_selection_form.cleaned_data['decompose']
+            request.session['aggregate_ground_arcs'] = solver_selection_form.cleaned_data['aggregate_ground_arcs']
             
             if selected_solver == 'ISD-IFAM':
                 return redirect('demand_adjustment')  # Adjust 'next_step' as needed
@@ -237,13 +254,8 @@ def upload_itineraries_excel(request):
                 # Handle the error (e.g., display an error message to the user)
                 return render(request, 'pages/fleetassignment.html', {'itinerary_excel_form': form, 'error_message': str(e)})
 
-            # Convert DataFrame to JSON for session storage
-            itineraries_df_json = read_excel.get_dataframe().to_json(orient='split')
-            itineraries_list = read_excel.get_data_list()
-
-            # Store in session
-            request.session['itineraries_df'] = itineraries_df_json
-            request.session['itineraries_list'] = itineraries_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'itineraries_df', normalize_frame(read_excel.get_dataframe()))
 
             return redirect('process_itinerary_columns')
     else:
@@ -251,14 +263,14 @@ def upload_itineraries_excel(request):
 
     return render(request, 'pages/fleetassignment.html', {'itinerary_excel_form': form})
 
+@redirect_when_expired('upload_flights_excel')
 def process_itinerary_columns(request):
     if 'itineraries_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_itineraries_excel')
 
     # Load DataFrame from session
-    itineraries_df_json = request.session.get('itineraries_df')
-    itineraries_df = pd.read_json(StringIO(itineraries_df_json), orient='split')
+    itineraries_df = load_session_frame(request, 'itineraries_df')
     
     # Initialize ColumnIndex with DataFrame
     itinerary_column_index = ItinColumnIndex(itineraries_df)
@@ -322,9 +334,9 @@ def process_itinerary_columns(request):
             else:
                 return redirect('optional_flights_selection') 
  
+@redirect_when_expired('upload_flights_excel')
 def optional_flights_selection(request):
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
     flight_column_indexes = json.loads(request.session['flight_column_indexes'])
     flight_no_col = flight_column_indexes.get('flight number')
@@ -356,9 +368,8 @@ def optional_flights_selection(request):
                 
             print(f'flights_df\n: {flights_df['Optional']}\n \n')
 
-            # Convert DataFrame back to JSON and store in session
-            flights_df_json = flights_df.to_json(orient='split')
-            request.session['flights_df'] = flights_df_json
+            # Store the DataFrame back server-side
+            save_session_frame(request, 'flights_df', flights_df)
             
             selected_solver = request.session.get('selected_solver')
             
@@ -376,13 +387,12 @@ def optional_flights_selection(request):
         'optional_flights_form': form
     })        
 
+@redirect_when_expired('upload_flights_excel')
 def FAM(request):
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
      
-    fleets_df_json = request.session.get('fleets_df')
-    fleets_df = pd.read_json(StringIO(fleets_df_json), orient='split') 
+    fleets_df = load_session_frame(request, 'fleets_df')
     
     flight_column_indexes = json.loads(request.session['flight_column_indexes'])
     flight_no_col = flight_column_indexes.get('flight number')
@@ -393,145 +403,45 @@ def FAM(request):
     distance_col = flight_column_indexes.get('distance')
     duration_col = flight_column_indexes.get('duration')
        
-    station_list = np.unique(flights_df.iloc[:, origin_col].to_list())       # list of stations
-    flights_list = flights_df.iloc[:, flight_no_col].astype(str).tolist()    #List of flights
-    fleet_list = fleets_df['Fleet Type'].tolist()
-    oc_list = fleets_df['Operating Cost Per Mile'].tolist()
-    
-    # ****************** Convert time to minutes **************** #
-    dep_arriv = ClockToMinutes(flights_df, departure_col, arrival_col)
-    dep = dep_arriv.get_departure_minutes()
-    arriv = dep_arriv.get_arrival_minutes()
-     
-    # ****************** Generate Balance Nodes **************** #
-    Nodes_df_instance = NodesGenerator(flights_df, station_list, flight_no_col, origin_col, destination_col, departure_col, arrival_col, dep, arriv)
-    Nodes_df = Nodes_df_instance.get_nodes()
-       
-    # ****************** Ground Arc Variable (Y) **************** #
-    var_y_instance = VariableY(Nodes_df, station_list, fleet_list)
-    vars_y = var_y_instance.get_y()
-    
+    # ****************** Split Independent Fleet Families **************** #
+    # Taken before the FAM overwrites the flight times with minutes
+    component_frames = []
+    if request.session.get('decompose_fleet_families'):
+        decomposition = FleetFamilyDecomposition(flights_df, fleets_df, flight_no_col, origin_col, destination_col)
+        if len(decomposition.get_components()) > 1:
+            component_frames = decomposition.get_component_frames(flights_df, fleets_df)
+
     # ----------------------- FAM MODEL --------------------------#
-    # Creating Model
-    model = ConcreteModel()
-    # ----------------------- Generating Problem's sets Starts Here --------------------------#
-   
-    model.setF = pyo.Set(initialize = flights_list) # set of all flights optional and non optional
-    model.setE = pyo.Set(initialize = fleet_list)  # set of fleet --> from 1 to 2
-    model.setS = pyo.Set(initialize=station_list)  # set of stations --> [ORD,LAX,BOS]
-    
-    # ****************** Find Optional Flights **************** #
-    cat = FlightsCategorization(flights_df, flight_no_col)
-    optional_flights = cat.optional_flights
-    non_optional_flights = cat.non_optional_flights
+    aggregate_ground_arcs = request.session.get('aggregate_ground_arcs', False)
+    fam = FAMModel(flights_df, fleets_df, flight_column_indexes, aggregate_ground_arcs)
+    model = fam.get_model()
+    Nodes_df = fam.get_nodes()
+    dep = fam.get_departure_minutes()
+    arriv = fam.get_arrival_minutes()
+    cost_list = fam.get_cost_list()
     
-    print(f'optional flights\n {optional_flights} \n\n')
     print(f'flights_df\n {flights_df} \n\n')        
-                
-    
-    # ****************** Define non/Optional Flight Sets**************** #
-    model.setF_optional = pyo.Set(initialize = optional_flights)             # set of optional flights
-    model.setF_non_optional = pyo.Set(initialize = non_optional_flights )    # set of non optional flights
-    
-    # ----------------------- Generating Problem's sets Ends Here --------------------------#
-
-    # ----------------------- Generating Problem's Parameters Starts Here --------------------------#
-    # first paramater in the problem is C(f,e) which is the cost of assigning aircraft e to flight leg f
-    # Making the list of costs
-
-    # ****************** Calculate Operating Cost (C) **************** #
-    flights_costs= flights_oeprating_costs(flights_df , fleets_df)
-    cost_list= flights_costs.given_operating_cost(distance_col, oc_list)
-
-    # Creating the dictionary which has the flight,fleet as key equals to value from cost_list
-    C_fe = {}
-    cost_list_counter = 0
-    for i in model.setF:
-        for j in model.setE:
-            C_fe[f'{i},{j}'] = cost_list[cost_list_counter]
-            cost_list_counter += 1
-
-    # Let's move to the second paramater in our problem (Ne) which is the number of available aircraft of each fleet type
-    Ne = {}
-    for number_of_airplane in range(len(fleets_df)):
-        Ne[fleets_df.iloc[number_of_airplane]['Fleet Type']] = fleets_df.iloc[number_of_airplane]['Number of Aircrafts']
-    # ----------------------- Generating Problem's Parameters Ends Here --------------------------#
-        
-    # ----------------------- Generating Problem's Decision Variables Starts Here --------------------------#
-    # Defining the first decision variable (Xf,e) which is binary that indicates is that flight coverd by the first or second fleet
-    # this is two dimensional variable the first dimension indicates the flight number and the second one indicates the fleet number
-    model.x = pyo.Var(model.setF, model.setE, within = Binary, bounds=(0,1))
-    x = model.x
-
-    # Defining the second desicion variable(RONs,e) which is Integer
-    # that represents represents the number of aircraft of fleet type e that remain overnight at station S
-    model.RON = pyo.Var(model.setS, model.setE, within=Integers, bounds = (0,None))
-    RON = model.RON
-
-    # Defining the third decision variable(Yi_j,e) which is Integer
-    # that represents the number of aircrafts between nodes i and j for fleet e
-    model.y = pyo.Var(vars_y, within=Integers, bounds = (0,None))
-    y = model.y
-    # ----------------------- Generating Problem's Decision Variables Ends Here --------------------------#
-
-    # ----------------------- Generating Problem's Objective Function Starts Here --------------------------#
-    #Objective Function is minimizing the operating cost of flight f operated by fleet e
-    model.obj = pyo.Objective(expr=sum([C_fe[f"{f},{e}"]*x[f,e]
-                                        for f in model.setF
-                                        for e in model.setE]),
-                            sense=minimize)
-    # ----------------------- Generating Problem's Objective Function Ends Here  --------------------------#
-    
-    # ----------------------- Writing Constraints by Pyomo Syntax Starts Here --------------------------# 
-
-    # ****************** Coverage Constraint **************** #
-    model.coverage = ConstraintList()
-    for f in model.setF:
-        if f in model.setF_optional:
-            model.coverage.add(expr = sum([x[f,e] for e in model.setE ]) <= 1)
-        elif f in model.setF_non_optional:
-            model.coverage.add(expr = sum([x[f,e] for e in model.setE ]) == 1)
-
-    # Writing the Resources Constraints
-    model.resource = ConstraintList()
-    for e in model.setE:
-        model.resource.add(expr=sum([RON[station,e]
-                        for station in model.setS]) <= Ne[e])
-
-    # Writing the Balance Constraints
-    model.balance = ConstraintList()
-    for fleet in model.setE:
-        for node in Nodes_df.index:
-            
-            city = Nodes_df.iloc[node-1]['city']
-            city_nodes_df = Nodes_df[Nodes_df['city'] == city]
-
-            first_node = city_nodes_df.index.values.min()
-            last_node = city_nodes_df.index.values.max()
-
-            y_sum = 0
-
-    # Assuming 'first_node', 'last_node' are defined
-            if first_node != last_node:
-                # Writing The Ground Arcs
-                y_sum = (sum([model.y[var_name] if (var_name.replace(",", "_").split('_')[1] == str(node)) & ((str(fleet)) in var_name) else 0 for var_name in vars_y])) +\
-                    (sum([-1*model.y[var_name] if (var_name.replace(",", "_").split('_')[0] == str(node)) &
-                    ((str(fleet)) in var_name) else 0 for var_name in vars_y]))
-
-            #Writing The Whole Balance Constraint
-            model.balance.add(expr=y_sum +
-                            sum(flight[1] * model.x[str(flight[0]), fleet]
-                                for flight in Nodes_df.iloc[node-1]['flights'])
-                            + (RON[city, fleet] if node == first_node and node != last_node else -1 *
-                                model.RON[city, fleet] if node == last_node and node != first_node else 0)
-                            == 0)
-            
-    # ----------------------- Writing Constraints by Pyomo Syntax Ends Here --------------------------# 
-    # ----------------------- FAM Model Ends Here --------------------------# 
     
     # ----------------------- Solving The Problem --------------------------# 
-    opt = SolverFactory('gurobi') #Solving using gurobi solver
-    problem_results = opt.solve(model)
+    solver_config = SolverConfig.from_session(request.session)
+    schedule = ScheduleDiff.schedule_of(flights_df, flight_no_col, origin_col, destination_col, dep, arriv, distance_col)
+    if component_frames:
+        # Every family is its own FAM, solved in parallel and merged back into the full model
+        logger.info(f"Solving {len(component_frames)} independent fleet families in parallel")
+        solutions = run_fam_decomposition(component_frames, flight_column_indexes,
+                                          concurrent_solver_config(solver_config.to_dict(), len(component_frames)), aggregate_ground_arcs)
+        solved = all(solution is not None for solution in solutions)
+        solution = None
+        if solved:
+            decomposition.load_solutions(model, Nodes_df, solutions)
+            solution = WarmStartSolution(model, Nodes_df, schedule, fleets_df.values.tolist())
+    else:
+        previous_solution = load_session_artifact(request, 'FAM_previous_solution', missing_ok=True) if request.session.get('incremental_resolve') else None
+        problem_results, solution = solve_incrementally(solver_config, model, Nodes_df, schedule, fleets_df.values.tolist(), previous_solution,
+                                                        request.session.get('keep_unaffected_assignments', False))
+        solved = solver_config.is_solved(problem_results)
+    if solution is not None:
+        save_session_artifact(request, 'FAM_previous_solution', solution)
     # Function to convert minutes to hh:mm:ss format
     def minutes_to_time(minutes):
         hours = int(minutes // 60)
@@ -545,21 +455,16 @@ def FAM(request):
     print(f'Operating cost \n\n {cost_list}\n\n')
 
 
-    if problem_results.solver.termination_condition == TerminationCondition.optimal:
+    if solved:
     # The solver was successful, and the optimal solution is available
     
         # Create a dictionary to store fleet type assignments for each flight based on Pyomo variable x
         flight_assignments = {}
         operate_flight = {}
-        for i in model.component_objects(pyo.Var, active=True):  # Iterate over all Pyomo variables
-            print(i)
-            if i.name == "x":  # Ensure to process only the relevant variable
-                for idx in i:
-                    print(f'{i[idx]} = {i[idx].value}')  # Debug print
-                    flight_number, fleet_type = idx
-                    if pyo.value(i[idx]) == 1:  # Check if this assignment is selected
-                        # Ensure that flight_number is an integer if it's stored as such in flights_df
-                        flight_assignments[int(flight_number)] = fleet_type
+        for (flight_number, fleet_type), value in model.x.extract_values().items():
+            if round(value) == 1:  # Check if this assignment is selected
+                # Ensure that flight_number is an integer if it's stored as such in flights_df
+                flight_assignments[int(flight_number)] = fleet_type
         
         # Now, ensure all flights are accounted for in 'operate_flight'
         for flight_number in flights_df.iloc[:, flight_no_col]:
@@ -585,13 +490,11 @@ def FAM(request):
         ron_aggregate = {}  # Dictionary to hold RON data
 
         # Extract RON data from the model
-        for ron_var in model.component_objects(pyo.Var, active=True):
-            if ron_var.name == "RON":
-                for (station, fleet_type), value in ron_var.items():
-                    if pyo.value(value) >= 0:  # Only consider positive RON values
-                        if (station, fleet_type) not in ron_aggregate:
-                            ron_aggregate[(station, fleet_type)] = 0
-                        ron_aggregate[(station, fleet_type)] += int(pyo.value(value))
+        for (station, fleet_type), value in model.RON.extract_values().items():
+            if value >= 0:  # Only consider positive RON values
+                if (station, fleet_type) not in ron_aggregate:
+                    ron_aggregate[(station, fleet_type)] = 0
+                ron_aggregate[(station, fleet_type)] += int(round(value))
 
         # Convert RON data to a DataFrame for easier display
         ron_df = pd.DataFrame(list(ron_aggregate.items()), columns=['Station_Fleet', 'Number of Aircraft Staying Overnight'])
@@ -679,16 +582,15 @@ def save_FAM_dataframes_to_excel(result_df, ron_df):
     
     return filename
 
+@redirect_when_expired('upload_flights_excel')
 def IFAM(request):
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
-    fleets_df_json = request.session.get('fleets_df')
-    fleets_df = pd.read_json(StringIO(fleets_df_json), orient='split')
+    fleets_df = load_session_frame(request, 'fleets_df')
     
-    itineraries_df_json = request.session.get('itineraries_df')
-    itineraries_df = pd.read_json(StringIO(itineraries_df_json), orient='split')
+    itineraries_df = load_session_frame(request, 'itineraries_df')
+    itinerary_records = itineraries_df.astype(str).values.tolist()     # demand and fares as uploaded, compared by the incremental re-solve
     
     flight_column_indexes = json.loads(request.session['flight_column_indexes'])
     flight_no_col = flight_column_indexes.get('flight number')
@@ -726,10 +628,6 @@ def IFAM(request):
     # ****** Recapture ratio bpr ****** #
     recapture_ratio = request.session.get('recapture_ratio')
 
-    # ****** Ground Arc Variable (Y) ****** #
-    var_y_instance = VariableY(Nodes_df, station_list, fleet_list)
-    var_y = var_y_instance.get_y()
-    
     # ****** Number of Available ACs ****** #
     Ne = {}
     for number_of_airplane in range(len(fleets_df)):
@@ -749,8 +647,11 @@ def IFAM(request):
     model.RON = pyo.Var(model.setS, model.setE, within=Integers, bounds=(0, None)) # Second desicion variable (RONs,e) which is binary that represents represents the number of aircraft of fleet type e that remain overnight at station s
     RON = model.RON
 
-    model.y = pyo.Var(var_y, within=Integers, bounds=(0, None)) # Defining the third decision variable(Y1_2,e) which is Integer that represents the number of aircrafts between nodes
-    y = model.y
+    # A fleet the flight does not allow ('Allowed Fleets' column) can not be assigned to it
+    compatibility = flight_fleet_compatibility(flights_df, flight_no_col, fleet_list)
+    for f in model.setF:
+        for e in set(fleet_list).difference(compatibility[f]):
+            x[f, e].setub(0)
 
 
     # ****** Calculate Operating Cost (C) ****** #
@@ -782,6 +683,13 @@ def IFAM(request):
     spilled_recaptured_vars=spilled_and_captured_variables.spill_recaptured_variables_list(data1, itineraries_df, itinerary_no_col)
     #print(f"Variable t_p_r:\n{spilled_recaptured_vars}")
 
+    # ****** Keep only the spill variables of itineraries on flights that may run out of seats ****** #
+    spill_screening = SpillScreening(itineraries_df, flights_list, itinerary_no_col, demand_col, fare_col, flights_col,
+                                     spilled_recaptured_vars, fleets_df['Number of Seats'].tolist(), recapture_ratio)
+    spilled_recaptured_vars = spill_screening.get_spill_variables()
+
+    itinerary_parameters = ItineraryParameters(itineraries_df, itinerary_no_col, demand_col, fare_col, flights_col, spilled_recaptured_vars)
+
     model.spilled_recaptured_vars = pyo.Var(spilled_recaptured_vars, within=Integers, bounds=(0, None))
     spilled_recaptured_vars = model.spilled_recaptured_vars
 
@@ -804,16 +712,12 @@ def IFAM(request):
     #print(f'Operating Cost (C):\n{C_Operating_cost}\n') 
 
     # ****** Calculate Spill Cost (S) ****** #
-    S_Spill_Cost=sum(model.spilled_recaptured_vars[t_p_r] * itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == int(t_p_r.split('_')[1])).values , fare_col].values[0] for t_p_r in spilled_recaptured_vars)
+    S_Spill_Cost=itinerary_parameters.spill_cost(model.spilled_recaptured_vars)
 
     #print(f'Spill Cost (S):\n{S_Spill_Cost}\n')
 
     # ****** Calculate Recaptured Revenue (M) ****** #
-    M_Recaptured_Revenue=sum(model.spilled_recaptured_vars[t_p_r] * recapture_ratio * itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == int(t_p_r.split('_')[2])).values , fare_col].values[0] 
-                if t_p_r.split('_')[1] == str(r) and int(t_p_r.split('_')[2]) != len(itineraries_df)+1  
-                else 0 
-                for t_p_r in spilled_recaptured_vars   
-                for r in model.setp.data())
+    M_Recaptured_Revenue=itinerary_parameters.recaptured_revenue(model.spilled_recaptured_vars, recapture_ratio)
     #print(f'Recaptured Revenue (M):\n{M_Recaptured_Revenue}\n')
 
     # ****** Objective Function ****** #
@@ -833,75 +737,19 @@ def IFAM(request):
         model.resources.add(expr=sum([RON[station, e]for station in model.setS]) <= Ne[e])   
         
     # ****** Balance Constraint ****** #
-    model.balance = ConstraintList()
-    for fleet in model.setE:
-        for node in Nodes_df.index:
-
-            city = Nodes_df.iloc[node-1]['city']
-            city_nodes_df = Nodes_df[Nodes_df['city'] == city]
-
-            first_node = city_nodes_df.index.values.min()
-            last_node = city_nodes_df.index.values.max()
-
-            y_sum = 0
-
-    # Assuming 'first_node', 'last_node' are defined
-            if first_node != last_node:
-                # Define the constraint using Pyomo syntax
-                y_sum = (sum([model.y[var_name] if (var_name.replace(",", "").split('_')[1] == str(node)) & ((str(fleet)) in var_name) else 0 for var_name in var_y])) +\
-                    (sum([-1*model.y[var_name] if (var_name.replace(",", "").split('_')[0] == str(node)) &
-                    ((str(fleet)) in var_name) else 0 for var_name in var_y]))
-
-            model.balance.add(expr=y_sum +
-                            sum(flight[1] * model.x[str(flight[0]), fleet]
-                                for flight in Nodes_df.iloc[node-1]['flights'])
-                            + (RON[city, fleet] if node == first_node and node != last_node else -1 *
-                                model.RON[city, fleet] if node == last_node and node != first_node else 0)
-                            == 0)
+    balance = BalanceConstraintBuilder(Nodes_df, model.setE)
+    if request.session.get('aggregate_ground_arcs'):
+        balance.add_aggregated_balance_constraints(model, compatibility)   # ground arcs become expressions of x and RON
+    else:
+        # Ground arc variable (Y), the number of aircraft between two nodes of a station
+        model.y = pyo.Var(VariableY(Nodes_df, station_list, fleet_list).get_y(), within=Integers, bounds=(0, None))
+        balance.add_balance_constraints(model)
             
 
     # ****** Flight Interaction Constraint ****** # 
-    model.flight_interaction = ConstraintList()
-
-    for idx1, flight in flights_df.iterrows():
-
-        # Spilled passengers
-        spilled_passengers = sum(
-            sum(
-                model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itineraries_df.iloc[idx, itinerary_no_col]) else 0
-                for t_p_r in spilled_recaptured_vars
-            )
-            if str(flight.iloc[flight_no_col]) in (str(itineraries_df.iloc[idx, flights_col]).split(", "))
-            else 0
-            for idx, itn in itineraries_df.iterrows()   
-        )
-        
-        # Recaptured passengers
-        recaptured_passengers = sum(
-            sum(
-                recapture_ratio * model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[2] == str(itineraries_df.iloc[idx, itinerary_no_col]) else 0
-                for t_p_r in spilled_recaptured_vars
-            )
-            if str(flight.iloc[flight_no_col]) in (str(itineraries_df.iloc[idx, flights_col]).split(", "))
-            else 0
-            for idx, itn in itineraries_df.iterrows()   
-        )
-        
-        # Flight unconstrained demand
-        flight_unconstrained_demand = 0
-        for idx, itn in itineraries_df.iterrows():
-            if str(flight.iloc[flight_no_col]) in (str(itn.iloc[flights_col]).split(", ")):
-                flight_unconstrained_demand += itn.iloc[demand_col]
-
-        # Flight available seats
-        flight_seats_available = sum(
-            (model.x[str(flight.iloc[flight_no_col]), fleet.iloc[0]]) * fleet.iloc[2] for idx, fleet in fleets_df.iterrows()  ########### TAKE CARE FLEETS Index##############
-        )
-        
-        
-        #print(f'Interaction constraind Demand correction part equation{idx1 + 1}:\n{flight_demand_correction}\n')
-
-        model.flight_interaction.add(expr= spilled_passengers - recaptured_passengers >= flight_unconstrained_demand - flight_seats_available)
+    flight_interaction_index = FlightInteractionIndex(flights_df, itineraries_df, flight_no_col, itinerary_no_col, flights_col, demand_col, list(spilled_recaptured_vars))
+    fleet_capacities = list(zip(fleets_df['Fleet Type'], fleets_df['Number of Seats']))
+    flight_interaction_index.add_flight_interaction_constraints(model, fleet_capacities, recapture_ratio)
             
     # ****** Spill-Recapture & Demand Constraints ****** #
     model.demand = ConstraintList()
@@ -909,17 +757,23 @@ def IFAM(request):
     for itn in range(len(itineraries_df)):  
         
         itenrary=itineraries_df.iloc[itn, itinerary_no_col]
-        t_p_r_sum = sum(model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itenrary) else 0 for t_p_r in spilled_recaptured_vars) # from I_FAM
+        spills = itinerary_parameters.get_spills_from(itenrary)
+        t_p_r_sum = sum(model.spilled_recaptured_vars[t_p_r] for t_p_r in spills) # from I_FAM
         
-        model.demand.add(expr= t_p_r_sum - itineraries_df.iloc[itn, demand_col] <= 0) # Demand Constraints
+        if spills:  # an itinerary left without spill variables by the screening spills nothing
+            model.demand.add(expr= t_p_r_sum - itineraries_df.iloc[itn, demand_col] <= 0) # Demand Constraints
         
         model.spill_recapture.add(expr=t_p_r_sum== model.t_spilled[itenrary])  # Spill_recapture Constraints
         
             
     # ****** Solving ****** # 
-    opt = SolverFactory('gurobi')
-    #print('\n\nSolving please wait\n\n')
-    problem_results = opt.solve(model)
+    solver_config = SolverConfig.from_session(request.session)
+    previous_solution = load_session_artifact(request, 'IFAM_previous_solution', missing_ok=True) if request.session.get('incremental_resolve') else None
+    schedule = ScheduleDiff.schedule_of(flights_df, flight_no_col, origin_col, destination_col, dep, arriv, distance_col)
+    problem_results, solution = solve_incrementally(solver_config, model, Nodes_df, schedule, fleets_df.values.tolist(), previous_solution,
+                                                    request.session.get('keep_unaffected_assignments', False), [itinerary_records, recapture_ratio])
+    if solution is not None:
+        save_session_artifact(request, 'IFAM_previous_solution', solution)
             
     # Function to convert minutes to hh:mm:ss format
     def minutes_to_time(minutes):
@@ -932,7 +786,7 @@ def IFAM(request):
     flights_df.iloc[:, arrival_col] = flights_df.iloc[:, arrival_col].apply(minutes_to_time)
 
 
-    if problem_results.solver.termination_condition == TerminationCondition.optimal:
+    if solver_config.is_solved(problem_results):
     # The solver was successful, and the optimal solution is available
     
         # Create a dictionary to store fleet type assignments for each flight based on Pyomo variable x
@@ -940,15 +794,10 @@ def IFAM(request):
         
         flight_assignments = {}
         operate_flight = {}
-        for i in model.component_objects(pyo.Var, active=True):  # Iterate over all Pyomo variables
-            print(i)
-            if i.name == "x":  # Ensure to process only the relevant variable
-                for idx in i:
-                    print(f'{i[idx]} = {i[idx].value}')  # Debug print
-                    flight_number, fleet_type = idx
-                    if pyo.value(i[idx]) == 1:  # Check if this assignment is selected
-                        # Ensure that flight_number is an integer if it's stored as such in flights_df
-                        flight_assignments[int(flight_number)] = fleet_type
+        for (flight_number, fleet_type), value in model.x.extract_values().items():
+            if round(value) == 1:  # Check if this assignment is selected
+                # Ensure that flight_number is an integer if it's stored as such in flights_df
+                flight_assignments[int(flight_number)] = fleet_type
            
         # Now, ensure all flights are accounted for in 'operate_flight'
         for flight_number in flights_df.iloc[:, flight_no_col]:
@@ -974,13 +823,11 @@ def IFAM(request):
         ron_aggregate = {}  # Dictionary to hold RON data
 
         # Extract RON data from the model
-        for ron_var in model.component_objects(pyo.Var, active=True):
-            if ron_var.name == "RON":
-                for (station, fleet_type), value in ron_var.items():
-                    if pyo.value(value) >= 0:  # Only consider positive RON values
-                        if (station, fleet_type) not in ron_aggregate:
-                            ron_aggregate[(station, fleet_type)] = 0
-                        ron_aggregate[(station, fleet_type)] += int(pyo.value(value))
+        for (station, fleet_type), value in model.RON.extract_values().items():
+            if value >= 0:  # Only consider positive RON values
+                if (station, fleet_type) not in ron_aggregate:
+                    ron_aggregate[(station, fleet_type)] = 0
+                ron_aggregate[(station, fleet_type)] += int(round(value))
 
         # Convert RON data to a DataFrame for easier display
         ron_df = pd.DataFrame(list(ron_aggregate.items()), columns=['Station_Fleet', 'Number of Aircraft Staying Overnight'])
@@ -1002,12 +849,9 @@ def IFAM(request):
         
         # Extracting data from t_spilled
         spilled_data = {}
-        for var in model.component_objects(pyo.Var, active=True):
-            if var.name == "t_spilled":
-                for (i_j), value in var.items():
-                    if pyo.value(value) > 0:  # Only consider cases where passengers are actually spilled and recaptured
-                        i = i_j  # Split to get itinerary i and j
-                        spilled_data[(int(i))] = int(pyo.value(value))                        
+        for i, value in model.t_spilled.extract_values().items():
+            if round(value) > 0:  # Only consider cases where passengers are actually spilled
+                spilled_data[int(i)] = int(round(value))
 
         # Convert the data to a DataFrame
         spilled_df = pd.DataFrame(list(spilled_data.items()), columns=['Itinerary', 'Number of Passengers'])
@@ -1026,12 +870,10 @@ def IFAM(request):
         
         # Extracting data from spilled_recaptured_vars
         spilled_recaptured_data = {}
-        for var in model.component_objects(pyo.Var, active=True):
-            if var.name == "spilled_recaptured_vars":
-                for (i_j), value in var.items():
-                    if pyo.value(value) > 0:  # Only consider cases where passengers are actually spilled and recaptured
-                        i, j = i_j.split('_')[1:]  # Split to get itinerary i and j
-                        spilled_recaptured_data[(int(i), int(j))] = round(recapture_ratio * int(pyo.value(value)), 1)
+        for i_j, value in model.spilled_recaptured_vars.extract_values().items():
+            if round(value) > 0:  # Only consider cases where passengers are actually spilled and recaptured
+                i, j = i_j.split('_')[1:]  # Split to get itinerary i and j
+                spilled_recaptured_data[(int(i), int(j))] = round(recapture_ratio * int(round(value)), 1)
 
         # Convert the data to a DataFrame
         spilled_recaptured_df = pd.DataFrame(list(spilled_recaptured_data.items()), columns=['Itinerary_Pair', 'Number of Passengers'])
@@ -1086,6 +928,7 @@ def IFAM(request):
 
         return render(request, 'pages/fleetassignment.html', {
             'objective_value_IFAM': objective_value,
+            'spill_screening': spill_screening.get_report(),
             'optimized_schedule_html': result_df.to_html(classes=["table", "table-striped"], index=False),
             'ron_schedule_html': ron_df.to_html(classes=["table", "table-striped"], index=False),  # Add this line
             'spilled_recaptured_html': spilled_recaptured_df.to_html(classes=["table", "table-striped"], index=False),
@@ -1104,16 +947,14 @@ def IFAM(request):
         }
         return render(request, 'pages/fleetassignment.html', context)
     
+@redirect_when_expired('upload_flights_excel')
 def ISD_IFAM(request):
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
-    fleets_df_json = request.session.get('fleets_df')
-    fleets_df = pd.read_json(StringIO(fleets_df_json), orient='split')
+    fleets_df = load_session_frame(request, 'fleets_df')
     
-    itineraries_df_json = request.session.get('itineraries_df')
-    itineraries_df = pd.read_json(StringIO(itineraries_df_json), orient='split')
+    itineraries_df = load_session_frame(request, 'itineraries_df')
     
     flight_column_indexes = json.loads(request.session['flight_column_indexes'])
     flight_no_col = flight_column_indexes.get('flight number')
@@ -1126,357 +967,23 @@ def ISD_IFAM(request):
     
     itinerary_column_indexes = json.loads(request.session['itinerary_column_indexes'])
     itinerary_no_col = itinerary_column_indexes.get('itinerary')
-    demand_col = itinerary_column_indexes.get('demand')
-    fare_col = itinerary_column_indexes.get('fare')
-    flights_col = itinerary_column_indexes.get('flights')
-    type_col = itinerary_column_indexes.get('type')
     
     # Debugging log
     logger.debug(f"itinerary_no_col: {itinerary_no_col}")
     
-    station_list = np.unique(flights_df.iloc[:, origin_col].to_list())       # list of stations
-    flights_list = flights_df.iloc[:, flight_no_col].astype(str).tolist()    #List of flights
-    fleet_list = fleets_df['Fleet Type'].tolist()
-    oc_list = fleets_df['Operating Cost Per Mile'].tolist()
-    
-    # ****************** Convert time to minutes **************** #
-    dep_arriv = ClockToMinutes(flights_df, departure_col, arrival_col)
-    dep = dep_arriv.get_departure_minutes()
-    arriv = dep_arriv.get_arrival_minutes()
-
-        
-    # ****************** Generate Balance Nodes **************** #
-    Nodes_df_instance = NodesGenerator(flights_df, station_list, flight_no_col, origin_col, destination_col, departure_col, arrival_col, dep, arriv)
-    Nodes_df = Nodes_df_instance.get_nodes()
-    
     # ****************** Recapture ratio bpr **************** #
     recapture_ratio = request.session.get('recapture_ratio')
     decrease_demand_percentage = request.session.get('decrease_demand_percentage')
     increase_demand_percentage = request.session.get('increase_demand_percentage')
-    
-    # ****************** Ground Arc Variable (Y) **************** #
-    var_y_instance = VariableY(Nodes_df, station_list, fleet_list)
-    var_y = var_y_instance.get_y()
-    
-    # ****************** Number of Available ACs **************** #
-    Ne = {}
-    for number_of_airplane in range(len(fleets_df)):
-        Ne[fleets_df.iloc[number_of_airplane]['Fleet Type']] = fleets_df.iloc[number_of_airplane]['Number of Aircrafts']
-        
-    # ****************** Define FAM Model Sets **************** #
-    model = ConcreteModel()
-    model.setF = pyo.Set(initialize = flights_list)     # set of flights
-    model.setE = pyo.Set(initialize = fleet_list)       # set of fleet
-    model.setS = pyo.Set(initialize=station_list)       # set of stations
-
-
-    # ****************** Define FAM Model Decision Variables **************** #
-    model.x = pyo.Var(model.setF, model.setE, within=Binary, bounds=(0, None))  # This is two dimensional variable the first dimension indicates the flight number and the second one indicates the fleet number
-    x = model.x
-
-    model.RON = pyo.Var(model.setS, model.setE, within=Integers, bounds=(0, None)) # Second desicion variable (RONs,e) which is binary that represents represents the number of aircraft of fleet type e that remain overnight at station s
-    RON = model.RON
-
-    model.y = pyo.Var(var_y, within=Integers, bounds=(0, None)) # Defining the third decision variable(Y1_2,e) which is Integer that represents the number of aircrafts between nodes
-    y = model.y
-
-
-    # ****************** Calculate Operating Cost (C) **************** #
-    flights_costs= flights_oeprating_costs(flights_df , fleets_df)
-    cost_list= flights_costs.given_operating_cost(distance_col,oc_list)
-    # cost_list = [30000,16600,15100,13500,15500,45000,57000,13500,42000,16600,15500,45000]  #######################TAKECARE##################
-
-    # Creating the dictionary which has the flight,fleet as key equals to value from cost_list
-    C_fe = {}
-    cost_list_counter = 0
-    for i in model.setF:
-        for j in model.setE:
-            C_fe[f'{i},{j}'] = cost_list[cost_list_counter]
-            cost_list_counter += 1
-            
-    # ****************** Find Optional Flights **************** #
-    cat = FlightsCategorization(flights_df, flight_no_col)
-    optional_flights = cat.optional_flights
-    non_optional_flights = cat.non_optional_flights
-    
-    print(f'optional flights\n {optional_flights} \n\n')
-    print(f'flights_df\n {flights_df} \n\n')        
-                
-    
-    # ****************** Define non/Optional Flight Sets**************** #
-    model.setF_optional = pyo.Set(initialize = optional_flights)             # set of optional flights
-    model.setF_non_optional = pyo.Set(initialize = non_optional_flights )    # set of non optional flights
-    
-    # ****************** Find Optional Itineraries **************** #
-    optional_itineraries=[]
-    for idx, itn in itineraries_df.iterrows():
-        for opt_flight in optional_flights:
-            if str(opt_flight) in (str(itn[flights_col]).split(", ")) and itn[itinerary_no_col] not in optional_itineraries :
-                optional_itineraries.append(itn[itinerary_no_col])
-                
-    print(f'optional itineraries\n {optional_itineraries} \n\n')     
-                
-    # ****************** Define non/Optional Itinerary Sets**************** #
-    model.setp = pyo.RangeSet(len(itineraries_df))                            # set of itenraries
-    model.setp_optional=pyo.Set(initialize=optional_itineraries)                # set of optional itenraries
-    
-
-    # ****************** Generate Zq Decision Variable**************** #
-    def optional_df(itineraries_df, optional_itineraries, itinerary_no_col):
-        # Iterate over each row of the DataFrame
-        print(itinerary_no_col)
-        for idx in range(len(itineraries_df)):
-            # Check if the itinerary is in the list of optional itineraries
-            if itineraries_df.iloc[idx, itinerary_no_col] in optional_itineraries:
-                # Set the 'Optional' column to 1 for this row
-                itineraries_df.at[idx, 'Optional'] = 1
-                
-        itineraries_df.fillna(0,inplace = True)
-
-        return itineraries_df
-            
-    optional_dfs = optional_df(itineraries_df, optional_itineraries, itinerary_no_col)     
-    var_z = VariableZ(itineraries_df, itinerary_no_col)
-    var_z = var_z.get_z()
-    if var_z is not None:
-        model.z = pyo.Var(var_z, within = Binary, bounds = (0,1))
-
-    # ****************** Define spilled passenger from itinerary p (tp) **************** #
-    itineraries_demand_list =itineraries_df.iloc[:, demand_col].tolist() # Get column of demand from itenraries dataframe and convert to list
-    model.t_spilled = pyo.Var(model.setp, within=pyo.Integers, bounds=lambda model, i: (0, itineraries_demand_list[i-1]))
-    t_spilled=model.t_spilled
-    
-    # ****************** Define spilled passenger from itinerary p and recaptured by itinerary r (tpr) **************** #
-    data1=spilled_and_captured_variables(flights_df)
-    itineraries_df=spilled_and_captured_variables.Itinraries_df_simplify(data1,itineraries_df,itinerary_no_col, flights_col, flight_no_col, origin_col, destination_col,type_col)
-
-    itineraries_df.iloc[:, itinerary_no_col] = itineraries_df.iloc[:, itinerary_no_col].astype('int64')
-    spilled_recaptured_vars=spilled_and_captured_variables.spill_recaptured_variables_list(data1, itineraries_df, itinerary_no_col)
-    #print(f"Variable t_p_r:\n{spilled_recaptured_vars}")
-
-    model.spilled_recaptured_vars = pyo.Var(spilled_recaptured_vars, within=Integers, bounds=(0, None))
-    spilled_recaptured_vars = model.spilled_recaptured_vars
-
-
-    # ****************** Add Market Column in Itinerary dataframe **************** #
-    itineraries_df['market'] = itineraries_df.apply(lambda row: [row['From'], row['To']], axis=1)
-
-    # Create a list of lists 'airline_markets'
-    airline_markets_for_each_itenrary = itineraries_df['market'].tolist() 
-    # getting the unique markets
-    ailine_market=[]
-
-    for market in airline_markets_for_each_itenrary:
-        if market not in ailine_market:
-            ailine_market.append(market)
-    #print(f'Itinerary Data Frame:\n{itineraries_df}\n')
-
-
-    # ****************** Define Demand correction variable Delta Dqp **************** #
-    demand_correction = DemandCorrection(itineraries_df, increase_demand_percentage, decrease_demand_percentage, optional_itineraries, optional_flights, itinerary_no_col, flights_col, demand_col)
-    demand_correction_factor_df = demand_correction.get_demand_correction_df()
-    #print(f'Demand Correction Factor:\n{demand_correction_factor_df}\n')
-
-    #__C__Operating costs
-    C_Operating_cost=sum(C_fe[f"{f},{e}"] * model.x[f, e] for f in model.setF for e in model.setE)
-    #print(f'Operating Cost (C):\n{C_Operating_cost}\n')
-    
-            
-    # ****************** Calculate Unconstrained Revenue (R) **************** #
-    R_Unconstrained_Revenue=sum(itineraries_df.iloc[idx, demand_col] * itineraries_df.iloc[idx, fare_col] for idx in range(len(itineraries_df)))
-    #print(f'Unconstrained Revenue (R):\n{R_Unconstrained_Revenue}\n')
-
-
-    # ****************** Calculate Spill Cost (S) **************** #
-    S_Spill_Cost=sum(model.spilled_recaptured_vars[t_p_r] * itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == int(t_p_r.split('_')[1])).values , fare_col].values[0] for t_p_r in spilled_recaptured_vars)
-
-    #print(f'Spill Cost (S):\n{S_Spill_Cost}\n')
-
-
-    # ****************** Calculate Recaptured Revenue (M) **************** #
-    M_Recaptured_Revenue=sum(model.spilled_recaptured_vars[t_p_r] * recapture_ratio * itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == int(t_p_r.split('_')[2])).values , fare_col].values[0] 
-                if t_p_r.split('_')[1] == str(r) and int(t_p_r.split('_')[2]) != len(itineraries_df)+1  
-                else 0 
-                for t_p_r in spilled_recaptured_vars   
-                for r in model.setp.data())
-    #print(f'Recaptured Revenue (M):\n{M_Recaptured_Revenue}\n')
-
-
-    # ****************** Calculate Unconstrained Revenue Loss (Delta R) **************** #
-    optional_itineraries = np.array(optional_itineraries, dtype='int64')
-    DeltaR_Uncontrained_Revenue_Loss = sum(
-        (
-            (itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values , demand_col].iloc[0] *
-            itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values , fare_col].iloc[0])
-            - sum(
-                (demand_correction_factor_df.loc[demand_correction_factor_df['name'] == f'D_{opt_iten}_{iten.iloc[itinerary_no_col]}', 'value'].iloc[0] *
-                itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == iten.iloc[itinerary_no_col]).values , fare_col].iloc[0])
-                if f'D_{opt_iten}_{iten.iloc[itinerary_no_col]}' in demand_correction_factor_df['name'].tolist()
-                else 0
-                for idx, iten in itineraries_df.iterrows()
-            )
-        ) *
-        (1 - model.z[f'{opt_iten}'])
-        for opt_iten in optional_itineraries
-    )
-
-    #print(f'Unconstrained Revenue Loss (Delta R):\n{DeltaR_Uncontrained_Revenue_Loss}\n')
 
-
-    # ****************** Objective Function **************** #
-    model.obj = pyo.Objective(
-        expr=(-C_Operating_cost - S_Spill_Cost + R_Unconstrained_Revenue + M_Recaptured_Revenue - DeltaR_Uncontrained_Revenue_Loss),
-        sense=pyo.maximize
-    )
-
-
-    # ****************** Coverage Constraint **************** #
-    model.coverage = ConstraintList()
-    for f in model.setF:
-        if f in model.setF_optional:
-            model.coverage.add(expr = sum([x[f,e] for e in model.setE ]) <= 1)
-        elif f in model.setF_non_optional:
-            model.coverage.add(expr = sum([x[f,e] for e in model.setE ]) == 1)
-            
-
-    # ****************** Resources Constraint **************** #
-    model.resources = ConstraintList()
-    for e in model.setE:
-        model.resources.add(expr=sum([RON[station, e]for station in model.setS]) <= Ne[e])
-        
-        
-    # ****************** Balance Constraint **************** #
-    model.balance = ConstraintList()
-    for fleet in model.setE:
-        for node in Nodes_df.index:
-
-            city = Nodes_df.iloc[node-1]['city']
-            city_nodes_df = Nodes_df[Nodes_df['city'] == city]
-
-            first_node = city_nodes_df.index.values.min()
-            last_node = city_nodes_df.index.values.max()
-
-            y_sum = 0
-
-    # Assuming 'first_node', 'last_node' are defined
-            if first_node != last_node:
-                # Define the constraint using Pyomo syntax
-                y_sum = (sum([model.y[var_name] if (var_name.replace(",", "_").split('_')[1] == str(node)) & ((str(fleet)) in var_name) else 0 for var_name in var_y])) +\
-                    (sum([-1*model.y[var_name] if (var_name.replace(",", "_").split('_')[0] == str(node)) &
-                    ((str(fleet)) in var_name) else 0 for var_name in var_y]))
-
-            model.balance.add(expr=y_sum +
-                            sum(flight[1] * model.x[str(flight[0]), fleet]
-                                for flight in Nodes_df.iloc[node-1]['flights'])
-                            + (RON[city, fleet] if node == first_node and node != last_node else -1 *
-                                model.RON[city, fleet] if node == last_node and node != first_node else 0)
-                            == 0)
-            
-
-    # ****************** Flight Interaction Constraint **************** # 
-    model.flight_interaction = ConstraintList()
-
-
-    for idx1, flight in flights_df.iterrows():
-
-        # Spilled passengers
-        spilled_passengers = sum(
-            sum(
-                model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itineraries_df.iloc[idx, itinerary_no_col]) else 0
-                for t_p_r in spilled_recaptured_vars
-            )
-            if str(flight.iloc[flight_no_col]) in (str(itineraries_df.iloc[idx, flights_col]).split(", "))
-            else 0
-            for idx, itn in itineraries_df.iterrows()   
-        )
-        
-        # Recaptured passengers
-        recaptured_passengers = sum(
-            sum(
-                recapture_ratio * model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[2] == str(itineraries_df.iloc[idx, itinerary_no_col]) else 0
-                for t_p_r in spilled_recaptured_vars
-            )
-            if str(flight.iloc[flight_no_col]) in (str(itineraries_df.iloc[idx, flights_col]).split(", "))
-            else 0
-            for idx, itn in itineraries_df.iterrows()   
-        )
-        
-        # Flight unconstrained demand
-        flight_unconstrained_demand = 0
-        for idx, itn in itineraries_df.iterrows():
-            if str(flight.iloc[flight_no_col]) in (str(itn.iloc[flights_col]).split(", ")):
-                flight_unconstrained_demand += itn.iloc[demand_col]
-
-        # Flight available seats
-        flight_seats_available = sum(
-            (model.x[str(flight.iloc[flight_no_col]), fleet.iloc[0]]) * fleet.iloc[2] for idx, fleet in fleets_df.iterrows()  ########### TAKE CARE FLEETS Index##############
-        )
-        
-        flight_demand_correction = sum(
-            sum(
-                (
-                    (demand_correction_factor_df[demand_correction_factor_df['name'] == str(f'D_{opt_iten}_{itn.iloc[itinerary_no_col]}')]['value'].iloc[0]) *
-                    (1 - model.z[f'{opt_iten}'])
-                )
-                if str(f'D_{opt_iten}_{itn.iloc[itinerary_no_col]}') in demand_correction_factor_df['name'].values
-                else 0
-                for opt_iten in optional_itineraries
-            )
-            if str(flight.iloc[flight_no_col]) in (str(itn.iloc[flights_col]).split(", "))
-            else 0
-            for idx, itn in itineraries_df.iterrows()
-        )
-        
-        #print(f'Interaction constraind Demand correction part equation{idx1 + 1}:\n{flight_demand_correction}\n')
-
-        model.flight_interaction.add(expr= spilled_passengers - recaptured_passengers >= flight_unconstrained_demand + flight_demand_correction - flight_seats_available)
-            
-    # ****************** Spill-Recapture & Demand Constraints **************** #
-    model.demand = ConstraintList()
-    model.spill_recapture=ConstraintList()
-    for itn in range(len(itineraries_df)):  
-        
-        itenrary=itineraries_df.iloc[itn, itinerary_no_col]
-        t_p_r__sum = sum(model.spilled_recaptured_vars[t_p_r] if t_p_r.split('_')[1] == str(itenrary) else 0 for t_p_r in spilled_recaptured_vars) # from I_FAM
-        
-        
-        demand_correction_factor_sum = sum( 
-                                        (demand_correction_factor_df[demand_correction_factor_df['name'] == str(f'D_{opt_iten}_{itenrary}')]['value'].iloc[0])
-                                        * (1-model.z[f'{opt_iten}'])
-                                        if str(f'D_{opt_iten}_{itenrary}') in demand_correction_factor_df['name'].values else 0
-                                        for opt_iten in optional_itineraries)
-        
-        model.demand.add(expr= t_p_r__sum - itineraries_df.iloc[itn, demand_col] -  demand_correction_factor_sum <= 0) # Demand Constraints
-        
-        model.spill_recapture.add(expr=t_p_r__sum == model.t_spilled[itenrary])  # Spill_recapture Constraints
-        
-    # ****************** Ensure Zq = 0 Constraint **************** #    
-    model.Ensure_Z_is_zero = ConstraintList()
-    
-
-    for opt_iten in optional_itineraries:
-        
-        opt_iten_flights=str((itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values , flights_col].iloc[0])).split(", ")
-
-        for flight in opt_iten_flights:
-            
-            model.Ensure_Z_is_zero.add(expr=   model.z[f'{opt_iten}'] <= sum([x[flight,e] for e in model.setE ]  ))
-            
-            
-    # ****************** Ensure Zq = 1 Constraint **************** # 
-    model.Ensure_Z_is_ONE = ConstraintList()
-    for opt_iten in optional_itineraries:
-        
-        opt_iten_flights=str((itineraries_df.iloc[ (itineraries_df.iloc[:, itinerary_no_col] == opt_iten).values , flights_col].iloc[0])).split(", ")
-        N_q=len(opt_iten_flights)  # Number of flights in optional itenrary
-        
-        model.Ensure_Z_is_ONE.add(expr = model.z[f'{opt_iten}'] - sum([x[flight,e] for e in model.setE for flight in opt_iten_flights]  ) >= 1-N_q)
-            
+    # ****************** ISD-IFAM Model **************** #
+    network = ISDIFAMNetwork(flights_df, fleets_df, itineraries_df, flight_column_indexes, itinerary_column_indexes,
+                             request.session.get('aggregate_ground_arcs', False))
+    model = network.build_model(recapture_ratio, decrease_demand_percentage, increase_demand_percentage)
 
     # ****************** Solving **************** # 
-    opt = SolverFactory('gurobi')
-    #print('\n\nSolving please wait\n\n')
-    problem_results = opt.solve(model)
+    solver_config = SolverConfig.from_session(request.session)
+    problem_results = solver_config.solve(model)
 
     # Function to convert minutes to hh:mm:ss format
     def minutes_to_time(minutes):
@@ -1488,32 +995,20 @@ def ISD_IFAM(request):
     flights_df.iloc[:, departure_col] = flights_df.iloc[:, departure_col].apply(minutes_to_time)
     flights_df.iloc[:, arrival_col] = flights_df.iloc[:, arrival_col].apply(minutes_to_time)
 
-    if problem_results.solver.termination_condition == TerminationCondition.optimal:
+    if solver_config.is_solved(problem_results):
         # The solver was successful, and the optimal solution is available
         model.pprint()
     
         # Create a dictionary to store fleet type assignments for each flight based on Pyomo variable x
         flight_assignments = {}
         operate_flight = {}
-        for i in model.component_objects(pyo.Var, active=True):  # Iterate over all Pyomo variables
-            print(i)
-            if i.name == "x":  # Ensure to process only the relevant variable
-                for idx in i:
-                    print(f'{i[idx]} = {i[idx].value}')  # Debug print
-                    flight_number, fleet_type = idx
-                    if pyo.value(i[idx]) == 1:  # Check if this assignment is selected
-                        # Ensure that flight_number is an integer if it's stored as such in flights_df
-                        flight_assignments[int(flight_number)] = fleet_type
-            if i.name == "z":  # Ensure to process only the relevant variable
-                for idx in i:
-                    print(f'{i[idx]} = {i[idx].value}')  # Debug print
-                    flight_number= idx
-                    print(f'z flight number\n: {flight_number}')
-                    if pyo.value(i[idx]) == 1:  # Check if this assignment is selected
-                        # Ensure that flight_number is an integer if it's stored as such in flights_df
-                        operate_flight[int(flight_number)] = 'Yes'
-                    else:
-                        operate_flight[int(flight_number)] = 'No'
+        for (flight_number, fleet_type), value in model.x.extract_values().items():
+            if round(value) == 1:  # Check if this assignment is selected
+                # Ensure that flight_number is an integer if it's stored as such in flights_df
+                flight_assignments[int(flight_number)] = fleet_type
+        if hasattr(model, 'z'):
+            for flight_number, value in model.z.extract_values().items():
+                operate_flight[int(flight_number)] = 'Yes' if round(value) == 1 else 'No'
         
         # Now, ensure all flights are accounted for in 'operate_flight'
         for flight_number in flights_df.iloc[:, flight_no_col]:
@@ -1544,13 +1039,11 @@ def ISD_IFAM(request):
         ron_aggregate = {}  # Dictionary to hold RON data
 
         # Extract RON data from the model
-        for ron_var in model.component_objects(pyo.Var, active=True):
-            if ron_var.name == "RON":
-                for (station, fleet_type), value in ron_var.items():
-                    if pyo.value(value) >= 0:  # Only consider positive RON values
-                        if (station, fleet_type) not in ron_aggregate:
-                            ron_aggregate[(station, fleet_type)] = 0
-                        ron_aggregate[(station, fleet_type)] += int(pyo.value(value))
+        for (station, fleet_type), value in model.RON.extract_values().items():
+            if value >= 0:  # Only consider positive RON values
+                if (station, fleet_type) not in ron_aggregate:
+                    ron_aggregate[(station, fleet_type)] = 0
+                ron_aggregate[(station, fleet_type)] += int(round(value))
 
         # Convert RON data to a DataFrame for easier display
         ron_df = pd.DataFrame(list(ron_aggregate.items()), columns=['Station_Fleet', 'Number of Aircraft Staying Overnight'])
@@ -1572,12 +1065,9 @@ def ISD_IFAM(request):
         
         # Extracting data from t_spilled
         spilled_data = {}
-        for var in model.component_objects(pyo.Var, active=True):
-            if var.name == "t_spilled":
-                for (i_j), value in var.items():
-                    if pyo.value(value) > 0:  # Only consider cases where passengers are actually spilled and recaptured
-                        i = i_j  # Split to get itinerary i and j
-                        spilled_data[(int(i))] = int(pyo.value(value))
+        for i, value in model.t_spilled.extract_values().items():
+            if round(value) > 0:  # Only consider cases where passengers are actually spilled
+                spilled_data[int(i)] = int(round(value))
 
         # Convert the data to a DataFrame
         spilled_df = pd.DataFrame(list(spilled_data.items()), columns=['Itinerary', 'Number of Passengers'])
@@ -1596,12 +1086,10 @@ def ISD_IFAM(request):
         
         # Extracting data from spilled_recaptured_vars
         spilled_recaptured_data = {}
-        for var in model.component_objects(pyo.Var, active=True):
-            if var.name == "spilled_recaptured_vars":
-                for (i_j), value in var.items():
-                    if pyo.value(value) > 0:  # Only consider cases where passengers are actually spilled and recaptured
-                        i, j = i_j.split('_')[1:]  # Split to get itinerary i and j
-                        spilled_recaptured_data[(int(i), int(j))] = round(recapture_ratio * int(pyo.value(value)), 1)
+        for i_j, value in model.spilled_recaptured_vars.extract_values().items():
+            if round(value) > 0:  # Only consider cases where passengers are actually spilled and recaptured
+                i, j = i_j.split('_')[1:]  # Split to get itinerary i and j
+                spilled_recaptured_data[(int(i), int(j))] = round(recapture_ratio * int(round(value)), 1)
 
         # Convert the data to a DataFrame
         spilled_recaptured_df = pd.DataFrame(list(spilled_recaptured_data.items()), columns=['Itinerary_Pair', 'Number of Passengers'])
@@ -1667,6 +1155,101 @@ def ISD_IFAM(request):
         }
         return render(request, 'pages/fleetassignment.html', context)
        
+@redirect_when_expired('upload_flights_excel')
+def scenario_sweep(request):
+    if request.method == 'POST':
+        form = ScenarioSweepForm(request.POST)
+        if form.is_valid():
+            if not request.session.get('itineraries_df'):
+                return render(request, 'pages/fleetassignment.html', {
+                    'scenario_sweep_form': form,
+                    'error_message': 'Please upload the flights, fleets and itineraries through the ISD-IFAM steps first.'
+                })
+
+            # ****** Build the network once, every scenario only writes its own model from it ****** #
+            network = ISDIFAMNetwork(load_session_frame(request, 'flights_df'), load_session_frame(request, 'fleets_df'),
+                                     load_session_frame(request, 'itineraries_df'), json.loads(request.session['flight_column_indexes']),
+                                     json.loads(request.session['itinerary_column_indexes']), request.session.get('aggregate_ground_arcs', False))
+            network_handle = get_artifact_store().put(network)
+
+            scenarios = scenario_grid(form.cleaned_data['recapture_ratios'], form.cleaned_data['decrease_demand_percentages'],
+                                      form.cleaned_data['increase_demand_percentages'])
+            solver_config = concurrent_solver_config(SolverConfig.from_session(request.session).to_dict(), len(scenarios))
+            request.session['scenario_sweep_scenarios'] = scenarios
+
+            # ****** Fan the scenarios out to the Celery workers, the page polls their progress ****** #
+            try:
+                sweep = group(solve_isd_scenario.s(network_handle, solver_config, scenario) for scenario in scenarios).apply_async()
+            except (OperationalError, RuntimeError):
+                # Without a broker the scenarios are solved inside this request, so only a small grid is accepted
+                if len(scenarios) > form.MAX_LOCAL_SCENARIOS:
+                    return render(request, 'pages/fleetassignment.html', {
+                        'scenario_sweep_form': form,
+                        'error_message': f'The scenario workers are unavailable, so at most {form.MAX_LOCAL_SCENARIOS} scenarios can be solved right now. Please enter fewer values or try again later.'
+                    })
+                logger.warning("Celery broker unavailable, solving the scenarios in a local process pool")
+                request.session['scenario_sweep_rows'] = run_scenario_sweep(network_handle, solver_config, scenarios)
+                return redirect('scenario_sweep_results')
+
+            request.session['scenario_sweep_tasks'] = [result.id for result in sweep.results]
+            request.session['scenario_sweep_progress'] = [0, time.time()]
+            return render(request, 'pages/fleetassignment.html', {'sweep_scenarios_number': len(scenarios)})
+    else:
+        # Start the grid from the values of the last ISD-IFAM run
+        initial = {field: str(request.session[key]) for field, key in (('recapture_ratios', 'recapture_ratio'),
+                                                                        ('decrease_demand_percentages', 'decrease_demand_percentage'),
+                                                                        ('increase_demand_percentages', 'increase_demand_percentage'))
+                   if request.session.get(key) is not None}
+        form = ScenarioSweepForm(initial=initial)
+
+    return render(request, 'pages/fleetassignment.html', {'scenario_sweep_form': form})
+
+
+def scenario_sweep_status(request):
+    """Polled by the scenario sweep page, returns how many scenarios are solved."""
+    task_ids = request.session.get('scenario_sweep_tasks')
+    if not task_ids:
+        return JsonResponse({'state': 'UNKNOWN', 'error': 'No scenario sweep is running.'}, status=404)
+
+    results = [AsyncResult(task_id, app=solve_isd_scenario.app) for task_id in task_ids]
+    solved = sum(result.ready() for result in results)
+    if solved < len(results):
+        # A broker without a running worker leaves the tasks pending forever, so give up when nothing moves
+        last_solved, last_change = request.session.get('scenario_sweep_progress', [0, time.time()])
+        if solved != last_solved:
+            request.session['scenario_sweep_progress'] = [solved, time.time()]
+        elif time.time() - last_change > SCENARIO_SWEEP_STALE_SECONDS:
+            logger.error(f"Scenario sweep stalled at {solved} of {len(results)} scenarios")
+            for key in ('scenario_sweep_tasks', 'scenario_sweep_progress'):
+                request.session.pop(key, None)
+            return JsonResponse({'state': 'STALE', 'current': solved, 'total': len(results),
+                                 'error': 'No scenario was solved for a long time, the scenario workers may be down. Please start the sweep again later.'})
+        return JsonResponse({'state': 'PROGRESS', 'current': solved, 'total': len(results)})
+
+    rows = []
+    for result, scenario in zip(results, request.session.get('scenario_sweep_scenarios', [])):
+        if result.successful():
+            rows.append(result.result)
+        else:
+            logger.error(f"Scenario {scenario} failed: {result.info}")
+            rows.append({'Recapture Ratio': scenario['recapture_ratio'], 'Decrease in Demand %': scenario['decrease_demand_percentage'],
+                         'Increase in Demand %': scenario['increase_demand_percentage'], 'Status': 'failed'})
+    request.session['scenario_sweep_rows'] = rows
+    del request.session['scenario_sweep_tasks']
+    request.session.pop('scenario_sweep_progress', None)
+    return JsonResponse({'state': 'SUCCESS', 'redirect': reverse('scenario_sweep_results')})
+
+
+def scenario_sweep_results(request):
+    rows = request.session.get('scenario_sweep_rows')
+    if not rows:
+        return redirect('scenario_sweep')
+
+    comparison_df = scenario_comparison_df(rows)
+    return render(request, 'pages/fleetassignment.html', {
+        'scenario_comparison_html': comparison_df.to_html(classes=["table", "table-striped"], index=False, na_rep='-')
+    })
+
 def save_ISD_dataframes_to_excel(result_df, ron_df, spilled_df, spilled_recaptured_df):
     filename = 'Fleet_Assignment_Report.xlsx'
     filepath = os.path.join(settings.MEDIA_ROOT, filename)
@@ -0,0 +1,68 @@
+"""
+Benchmarks for the itinerary builder. They are not used by the views; run them from a shell, e.g.
+python manage.py shell -c "from ItineraryBuilder.benchmarks import benchmark_connection_engine; print(benchmark_connection_engine())"
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from .utils import ClockToMinutes, ConnectionIndex
+
+
+def synthetic_flight_schedule(legs_number, stations_number=40, seed=0):
+    """
+    Builds a random one-day flight schedule with the upload column layout
+    (Flight Number, Origin, Departure, Destination, Arrival), used for benchmarking.
+    """
+    rng = np.random.default_rng(seed)
+    stations = [f"S{k:03d}" for k in range(stations_number)]
+    origins = rng.integers(0, stations_number, legs_number)
+    destinations = (origins + rng.integers(1, stations_number, legs_number)) % stations_number
+    departures = rng.integers(5 * 60, 23 * 60, legs_number)
+    arrivals = (departures + rng.integers(45, 300, legs_number)) % (24 * 60)
+
+    return pd.DataFrame({
+        'Flight Number': [str(1000 + k) for k in range(legs_number)],
+        'Origin': [stations[k] for k in origins],
+        'Departure': [f"{m // 60:02d}:{m % 60:02d}:00" for m in departures],
+        'Destination': [stations[k] for k in destinations],
+        'Arrival': [f"{m // 60:02d}:{m % 60:02d}:00" for m in arrivals],
+    })
+
+
+def benchmark_connection_engine(sizes=(100, 500, 1000, 2500, 5000), min_connection=30, max_connection=240, brute_force_limit=1000):
+    """
+    Times the single stop pairing step with ConnectionIndex against the pairwise scan it replaced.
+    The pairwise scan is only timed up to brute_force_limit legs.
+
+    Returns:
+    - DataFrame with one row per schedule size.
+    """
+    results = []
+    for size in sizes:
+        flights = synthetic_flight_schedule(size)
+        dep_arriv = ClockToMinutes(flights, 2, 4)
+        dep, arriv = dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes()
+        origins, destinations = flights['Origin'].tolist(), flights['Destination'].tolist()
+
+        start = time.perf_counter()
+        connections = ConnectionIndex(origins, dep, min_connection, max_connection)
+        pairs = [(i, j) for i in range(size) for j in connections.get_connections(destinations[i], arriv[i])
+                 if j > i and origins[i] != destinations[j]]
+        indexed_seconds = time.perf_counter() - start
+
+        pairwise_seconds = None
+        if size <= brute_force_limit:
+            start = time.perf_counter()
+            pairwise = [(i, j) for i in range(size) for j in range(i + 1, size)
+                        if destinations[i] == origins[j] and origins[i] != destinations[j]
+                        and min_connection <= dep[j] - arriv[i] <= max_connection]
+            pairwise_seconds = time.perf_counter() - start
+            if pairwise != pairs:
+                raise AssertionError(f"ConnectionIndex pairs differ from the pairwise scan for {size} legs")
+
+        results.append({'Legs': size, 'Connections': len(pairs), 'Indexed (s)': round(indexed_seconds, 4),
+                        'Pairwise (s)': None if pairwise_seconds is None else round(pairwise_seconds, 4)})
+
+    return pd.DataFrame(results)
@@ -36,4 +36,9 @@ class ConnectionTimeForm(forms.Form):
     connection_time = forms.FloatField(label='Connection Time in Minutes', min_value=0.0) ##### added
     
 class DistanceConstraintForm(forms.Form):
-    distance_ratio = forms.FloatField(label='Distance Ratio', min_value=0.0) ##### added
\ No newline at end of file
+    distance_ratio = forms.FloatField(label='Distance Ratio', min_value=0.0) ##### added
+
+class ItineraryStopsForm(forms.Form):
+    max_stops = forms.IntegerField(label='Maximum Number of Stops', min_value=1, max_value=5, initial=2)
+    max_elapsed_time = forms.FloatField(label='Maximum Elapsed Time in Minutes', min_value=0.0, required=False,
+                                        help_text='From the first departure to the last arrival, leave empty for no limit.')
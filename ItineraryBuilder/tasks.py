@@ -0,0 +1,44 @@
+import logging
+
+from SkyLinker.artifacts import get_artifact_store, put_frame
+from SkyLinker.celery import app
+from .utils import build_itinerary_results
+
+logger = logging.getLogger(__name__)
+
+BUILD_RESULTS = ['new_flights_df', 'req_format']
+
+
+def save_build_results(results):
+    """Stores the build result DataFrames in the artifact store and returns their handles."""
+    handles = {name: put_frame(results[name]) for name in BUILD_RESULTS}
+    handles['itin_dfs'] = [put_frame(itin_df) for itin_df in results['itin_dfs']]
+    return handles
+
+
+def load_build_results(handles):
+    """Reads the build result DataFrames back, None when they are missing or expired."""
+    if not handles or 'itin_dfs' not in handles:
+        return None
+    results = {name: get_artifact_store().get(handles.get(name)) for name in BUILD_RESULTS}
+    results['itin_dfs'] = [get_artifact_store().get(handle) for handle in handles['itin_dfs']]
+    frames = [results[name] for name in BUILD_RESULTS] + results['itin_dfs']
+    return None if any(df is None for df in frames) else results
+
+
+def run_itinerary_build(flights_df_handle, airport_df_handle, column_indexes, column_indexes_airport, turn_around_time, connection_time, distance_ratio, max_stops=2, max_elapsed_time=None, progress=None):
+    # Raises ArtifactExpired when the uploads expired, or live on the disk of another host
+    flights_df = get_artifact_store().get_required(flights_df_handle)
+    airport_df = get_artifact_store().get_required(airport_df_handle)
+    return build_itinerary_results(flights_df, airport_df, column_indexes, column_indexes_airport, turn_around_time, connection_time, distance_ratio, max_stops, max_elapsed_time, progress)
+
+
+@app.task(bind=True, name='build_itineraries')
+def build_itineraries(self, flights_df_handle, airport_df_handle, column_indexes, column_indexes_airport, turn_around_time, connection_time, distance_ratio, max_stops=2, max_elapsed_time=None):
+    def report_progress(step, current, total):
+        self.update_state(state='PROGRESS', meta={'step': step, 'current': current, 'total': total})
+
+    logger.info("Itinerary build %s started", self.request.id)
+    results = run_itinerary_build(flights_df_handle, airport_df_handle, column_indexes, column_indexes_airport, turn_around_time, connection_time, distance_ratio, max_stops, max_elapsed_time, report_progress)
+
+    return save_build_results(results)
@@ -1,3 +1,116 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from .benchmarks import synthetic_flight_schedule
+from .utils import REQ_FORMAT_COLUMNS, ClockToMinutes, ItinGraphBuilder, ReqFormatBuilder, create_distance_dataframe, req_format_columns
 
 # Create your tests here.
+
+
+def legacy_req_format(flights_df, ss_itin_df, ds_itin_df, flight_no_index, origin_index, departure_index, destination_index, arrival_index):
+    """The row by row req_format construction that turn_around_and_connection_Itin used before ReqFormatBuilder."""
+    req_format = pd.DataFrame(columns=REQ_FORMAT_COLUMNS)
+    types = {1: 'Non Stop', 2: 'Single Stop', 3: 'Double Stop'}
+
+    def duration_str(departure, arrival):
+        departure_time = datetime.strptime(departure, '%H:%M:%S')
+        arrival_time = datetime.strptime(arrival, '%H:%M:%S')
+        if arrival_time < departure_time:
+            arrival_time += timedelta(days=1)
+        return departure_time, arrival_time
+
+    def to_str(delta):
+        hours, minutes = delta.seconds // 3600, (delta.seconds % 3600) // 60
+        return f"{hours}h {minutes}" if minutes > 0 else f"{hours}h"
+
+    non_stop = pd.DataFrame({
+        'Flight_Number_1': flights_df.iloc[:, flight_no_index], 'Origin_1': flights_df.iloc[:, origin_index],
+        'Departure_1': flights_df.iloc[:, departure_index], 'Destination_1': flights_df.iloc[:, destination_index],
+        'Arrival_1': flights_df.iloc[:, arrival_index], 'Distance': flights_df['Distance'],
+    })
+    df_index = 0
+    for legs, itin_df in [(1, non_stop), (2, ss_itin_df), (3, ds_itin_df)]:
+        for idx, flight in itin_df.iterrows():
+            times = [duration_str(flight[f'Departure_{leg}'], flight[f'Arrival_{leg}']) for leg in range(1, legs + 1)]
+            total = sum((arrival - departure for departure, arrival in times), timedelta())
+            total += sum((times[k + 1][0] - times[k][1] for k in range(legs - 1)), timedelta())
+
+            req_format.loc[df_index, 'Airline'] = None
+            req_format.loc[df_index, 'Itinerary_Number'] = df_index + 1
+            req_format.loc[df_index, 'Flights'] = ', '.join(f"{flight[f'Flight_Number_{leg}']}" for leg in range(1, legs + 1))
+            req_format.loc[df_index, 'Itinerary_Origin'] = flight['Origin_1']
+            req_format.loc[df_index, 'Itinerary_Departure_Time'] = flight['Departure_1']
+            req_format.loc[df_index, 'Itinerary_Destination'] = flight[f'Destination_{legs}']
+            req_format.loc[df_index, 'Itinerary_Arrival_Time'] = flight[f'Arrival_{legs}']
+            req_format.loc[df_index, 'Itinerary_Duration'] = to_str(total)
+            req_format.loc[df_index, 'Itinerary_Type'] = types[legs]
+            req_format.loc[df_index, 'Itinerary_Price'] = None
+            req_format.loc[df_index, 'Itinerary_Distance'] = flight['Distance']
+            for leg in range(1, 4):
+                departure, arrival = times[leg - 1] if leg <= legs else (None, None)
+                req_format.loc[df_index, f'Flight{leg}_Origin'] = flight[f'Origin_{leg}'] if leg <= legs else None
+                req_format.loc[df_index, f'Flight{leg}_Departure_Time'] = flight[f'Departure_{leg}'] if leg <= legs else None
+                req_format.loc[df_index, f'Flight{leg}_Destination'] = flight[f'Destination_{leg}'] if leg <= legs else None
+                req_format.loc[df_index, f'Flight{leg}_Arrival_Time'] = flight[f'Arrival_{leg}'] if leg <= legs else None
+                req_format.loc[df_index, f'Flight{leg}_Duration'] = to_str(arrival - departure) if leg <= legs else None
+            df_index += 1
+
+    return req_format
+
+
+class ReqFormatBuilderTests(SimpleTestCase):
+
+    def build_itineraries(self, legs_number, seed, max_stops=2):
+        flights_df = synthetic_flight_schedule(legs_number, stations_number=8, seed=seed)
+        flights_df['Flight Number'] = flights_df['Flight Number'].astype(int)
+        rng = np.random.default_rng(seed)
+        airport_df = pd.DataFrame({'Airport': [f"S{k:03d}" for k in range(8)], 'Latitude': rng.uniform(20, 40, 8), 'Longitude': rng.uniform(20, 50, 8)})
+        airports_distances_df = create_distance_dataframe(airport_df, 0, 1, 2)
+
+        dep_arriv = ClockToMinutes(flights_df, 2, 4)
+        itineraries = ItinGraphBuilder(flights_df, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes(), 0, 1, 2, 3, 4, 30, 240, airports_distances_df, 1.5, max_stops=max_stops)
+        itineraries.generate_itineraries()
+        flights_df = flights_df.drop(columns=['departure_minutes', 'arrival_minutes'])
+        flights_df['Distance'] = np.round(rng.uniform(100, 900, len(flights_df)), 1)
+        return (flights_df, *itineraries.get_all_itineraries())
+
+    def test_matches_row_by_row_format(self):
+        for seed in (1, 2):
+            flights_df, ss_itin_df, ds_itin_df = self.build_itineraries(80, seed)
+            self.assertGreater(len(ds_itin_df), 0)
+
+            expected = legacy_req_format(flights_df, ss_itin_df, ds_itin_df, 0, 1, 2, 3, 4)
+            req_format = ReqFormatBuilder(flights_df, [ss_itin_df, ds_itin_df], 0, 1, 2, 3, 4).get_req_format()
+
+            pd.testing.assert_frame_equal(req_format, expected)
+            self.assertEqual(req_format.to_json(orient='split'), expected.to_json(orient='split'))
+
+    def test_empty_itineraries(self):
+        flights_df, ss_itin_df, ds_itin_df = self.build_itineraries(20, 3)
+        req_format = ReqFormatBuilder(flights_df, [ss_itin_df.iloc[0:0], ds_itin_df.iloc[0:0]], 0, 1, 2, 3, 4).get_req_format()
+
+        self.assertEqual(list(req_format.columns), REQ_FORMAT_COLUMNS)
+        self.assertEqual(len(req_format), len(flights_df))
+        self.assertTrue((req_format['Itinerary_Type'] == 'Non Stop').all())
+
+    def test_triple_stop_itineraries(self):
+        flights_df, ss_itin_df, ds_itin_df, ts_itin_df = self.build_itineraries(120, 4, max_stops=3)
+        self.assertGreater(len(ts_itin_df), 0)
+
+        req_format = ReqFormatBuilder(flights_df, [ss_itin_df, ds_itin_df, ts_itin_df], 0, 1, 2, 3, 4).get_req_format()
+        self.assertEqual(list(req_format.columns), req_format_columns(4))
+
+        # The rows up to double stop are unchanged by the extra legs
+        expected = legacy_req_format(flights_df, ss_itin_df, ds_itin_df, 0, 1, 2, 3, 4)
+        pd.testing.assert_frame_equal(req_format.iloc[:len(expected)][REQ_FORMAT_COLUMNS], expected)
+
+        triple = req_format.iloc[len(expected):]
+        self.assertEqual(len(triple), len(ts_itin_df))
+        self.assertTrue((triple['Itinerary_Type'] == 'Triple Stop').all())
+        self.assertTrue(triple['Flights'].map(lambda flights: len(flights.split(', ')) == 4).all())
+        self.assertEqual(triple['Itinerary_Destination'].tolist(), ts_itin_df['Destination_4'].tolist())
+        self.assertTrue(triple['Flight4_Duration'].notna().all())
+        self.assertTrue(req_format.iloc[:len(expected)]['Flight4_Origin'].isna().all())
@@ -11,6 +11,7 @@ from .forms import TurnAroundTimeForm, ConnectionTimeForm
 import numpy as np
 import pandas as pd
 from math import radians, sin, cos, sqrt, atan2
+from bisect import bisect_left, bisect_right
 
 
 class SyncReadExcel:
@@ -305,31 +306,126 @@ def haversine(lat1, lon1, lat2, lon2):
     return 3959 * (2 * atan2(sqrt(a), sqrt(1 - a)))  # Earth radius in miles
 
 
+# Function to calculate the Haversine distances between all pairs of points at once
+def haversine_matrix(latitudes, longitudes):
+    """
+    Returns the N x N great-circle distance matrix in miles.
+
+    Parameters:
+    - latitudes: array-like of N latitudes in degrees.
+    - longitudes: array-like of N longitudes in degrees.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[None, :] - lat[:, None]
+    dlon = lon[None, :] - lon[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 3959 * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))  # Earth radius in miles
+
+
+def airport_distance_matrix(locations, airport_index, latitude_index, longitude_index):
+    """
+    Returns the airports distance matrix and the station codes indexing its rows and columns.
+
+    Parameters:
+    - locations: DataFrame of the uploaded airport coordinates.
+    - airport_index, latitude_index, longitude_index: column positions in locations.
+    """
+    stations = pd.Index(locations.iloc[:, airport_index])
+    matrix = haversine_matrix(locations.iloc[:, latitude_index], locations.iloc[:, longitude_index])
+    return matrix, stations
+
+
+def distance_matrix_to_dataframe(matrix, stations):
+    """Long-format origin/destination/distance view of a distance matrix, without the diagonal."""
+    origin_codes, destination_codes = np.nonzero(~np.eye(len(stations), dtype=bool))
+    return pd.DataFrame({
+        "origin": stations[origin_codes],
+        "destination": stations[destination_codes],
+        "distance": matrix[origin_codes, destination_codes]
+    })
+
+
 # Function to create a distance DataFrame
 def create_distance_dataframe(locations, airport_index, latitude_index, longitude_index):
-    distances = []
-    for i in range(len(locations)):
-        for j in range(len(locations)):
-            if i != j:
-                lat1, lon1 = locations.iloc[i, latitude_index], locations.iloc[i, longitude_index]
-                lat2, lon2 = locations.iloc[j, latitude_index], locations.iloc[j, longitude_index]
-                distance = haversine(lat1, lon1, lat2, lon2)
-                distances.append({
-                    "origin": locations.iloc[i, airport_index],
-                    "destination": locations.iloc[j, airport_index],
-                    "distance": distance
-                })
-                # unique_airports = UniqueStations(distances, airport_index)
-                # airports_distances = unique_airports.get_stations()
-                airports_distances_df = pd.DataFrame(distances)
-                
-    return airports_distances_df
+    matrix, stations = airport_distance_matrix(locations, airport_index, latitude_index, longitude_index)
+    return distance_matrix_to_dataframe(matrix, stations)
 
 
 # Now you can use distance_df for further processing in your code
 
 ##############################################################################################################
 
+class ODDistanceMatrix:
+    """O/D distance matrix keyed by station codes, built from the origin/destination/distance frame."""
+
+    def __init__(self, airports_distances_df):
+        distances = airports_distances_df.drop_duplicates(subset=['origin', 'destination'])
+        self.stations = pd.Index(pd.unique(pd.concat([distances['origin'], distances['destination']])))
+        self.matrix = np.full((len(self.stations), len(self.stations)), np.nan)
+        self.matrix[self.stations.get_indexer(distances['origin']), self.stations.get_indexer(distances['destination'])] = distances['distance'].to_numpy(dtype=float)
+
+    def lookup(self, origins, destinations):
+        """
+        Returns the O/D distances as a float array, NaN where the pair is not in the matrix.
+
+        Parameters:
+        - origins: array-like of origin station codes.
+        - destinations: array-like of destination station codes (same length as origins).
+        """
+        origin_codes = self.stations.get_indexer(pd.Index(origins))
+        destination_codes = self.stations.get_indexer(pd.Index(destinations))
+        found = (origin_codes >= 0) & (destination_codes >= 0)
+
+        distances = np.full(len(origin_codes), np.nan)
+        distances[found] = self.matrix[origin_codes[found], destination_codes[found]]
+        return distances
+
+    def get_matrix(self):
+        """Returns the N x N distance array (NaN where no distance is known)."""
+        return self.matrix
+
+    def get_stations(self):
+        """Returns the station codes indexing the matrix rows and columns."""
+        return self.stations
+
+
+def itinerary_distances(itin_df, od_matrix, legs_number):
+    """
+    Returns the itinerary distances: the sum of the leg distances rounded to one decimal,
+    0 when any leg is missing from the O/D matrix.
+    """
+    distance = np.zeros(len(itin_df))
+    missing = np.zeros(len(itin_df), dtype=bool)
+    for leg in range(1, legs_number + 1):
+        leg_distance = np.round(od_matrix.lookup(itin_df[f'Origin_{leg}'], itin_df[f'Destination_{leg}']), 1)
+        missing |= np.isnan(leg_distance)
+        distance = distance + leg_distance
+    distance[missing] = 0
+    return distance
+
+
+def filter_itineraries_by_circuity(itin_df, od_matrix, legs_number, distance_ratio):
+    """
+    Adds the 'Distance' column and drops the itineraries longer than distance_ratio times the
+    direct O/D distance, then renumbers 'Itinerary_Number' from 1.
+
+    Parameters:
+    - itin_df: DataFrame with Origin_k/Destination_k columns for k = 1..legs_number.
+    - od_matrix: ODDistanceMatrix of the network.
+    - legs_number: number of legs per itinerary.
+    - distance_ratio: maximum itinerary distance / direct distance ratio.
+    """
+    itin_df['Distance'] = itinerary_distances(itin_df, od_matrix, legs_number)
+    direct_distance = od_matrix.lookup(itin_df['Origin_1'], itin_df[f'Destination_{legs_number}'])
+
+    # Itineraries without a direct O/D distance are kept (NaN comparison is False)
+    itin_df = itin_df[~(itin_df['Distance'].to_numpy() > distance_ratio * direct_distance)].copy()
+    itin_df['Itinerary_Number'] = np.arange(1, len(itin_df) + 1)
+    return itin_df
+
+##############################################################################################################
+
 class Flights_Distance_Duration:
     """This class generates single stop itineraries based on flight schedule and connection times."""
 
@@ -425,396 +521,321 @@ class Flights_Distance_Duration:
 
 ##############################################################################################################
 
-class ItinSSBuilder:
-    """This class generates single stop itineraries based on flight schedule and connection times."""
-    
-    def __init__(self, one_day_flights, dep, arriv, flight_number_index, origin_column_no, departure_index, destination_column_no, arrival_index, min_connection, max_connection, airports_distances_df, distance_ratio):
-        self.flights = one_day_flights
+class ConnectionIndex:
+    """Departures bucketed by origin station and sorted by departure minute, for connection window lookups."""
+
+    def __init__(self, origins, dep, min_connection, max_connection):
+        """
+        Parameters:
+        - origins: list, origin station of every flight.
+        - dep: list, departure time of every flight in minutes (same order as origins).
+        - min_connection: minimum connection time in minutes.
+        - max_connection: maximum connection time in minutes.
+        """
         self.dep = dep
-        self.arriv = arriv
-        self.flight_number_index = int(flight_number_index)
-        self.origin_column_no = int(origin_column_no)
-        self.departure_index = int(departure_index)
-        self.destination_column_no = int(destination_column_no)
-        self.arrival_index = int(arrival_index)
         self.min_connection = min_connection
         self.max_connection = max_connection
-        self.airports_distances_df = airports_distances_df
-        self.distance_ratio = distance_ratio
-        self.itin_list = []
+        self.buckets = {}
+        self.build_buckets(origins)
 
-    def generate_itineraries(self):
-        for i in range(len(self.flights)):
-            for j in range(i + 1, len(self.flights)):
-                if self.is_valid_connection(i, j):
-                    self.add_itinerary(i, j)
-        
-        # Convert list to DataFrame after all itineraries are collected
-        
-        self.itin_df = pd.DataFrame(self.itin_list, columns=[
-            'Itinerary_Number', 'Flight_Number_1', 'Origin_1', 'Departure_1', 'Destination_1', 'Arrival_1',
-            'Flight_Number_2', 'Origin_2', 'Departure_2', 'Destination_2', 'Arrival_2', 'First_Transit_Time', 'Duration'
-        ])
-        
-        
-        for i in range(len(self.itin_df)):
-            distance_itin = 0
-            for j in range(len(self.airports_distances_df)):
-                for k in range(len(self.airports_distances_df)):
-                    if (self.itin_df.loc[i, 'Origin_1'] == self.airports_distances_df.loc[j, 'origin'] and
-                        self.itin_df.loc[i, 'Destination_1'] == self.airports_distances_df.loc[j, 'destination'] and
-                        self.itin_df.loc[i, 'Origin_2'] == self.airports_distances_df.loc[k, 'origin'] and
-                        self.itin_df.loc[i, 'Destination_2'] == self.airports_distances_df.loc[k, 'destination']):
-                        
-                        
-                        distance_itin += round(self.airports_distances_df.loc[j, 'distance'], 1)
-                        distance_itin += round(self.airports_distances_df.loc[k, 'distance'], 1)
-
-            self.itin_df.loc[i, 'Distance'] = distance_itin
-            
-        # Create a boolean mask initialized to keep all rows
-        mask = pd.Series(True, index=self.itin_df.index)
-            
-        for i in range(len(self.itin_df)):
-            for j in range(len(self.airports_distances_df)):
-                if (self.itin_df.loc[i, 'Origin_1'] == self.airports_distances_df.loc[j, 'origin'] and
-                        self.itin_df.loc[i, 'Destination_2'] == self.airports_distances_df.loc[j, 'destination']):
-                    if self.itin_df.loc[i, 'Distance'] > self.distance_ratio * self.airports_distances_df.loc[j, 'distance']:
-                        mask[i] = False
-                        
-        # After the loops, drop the marked rows
-        self.itin_df = self.itin_df[mask]
-        c=1
-        for idx, itins in self.itin_df.iterrows():
-            self.itin_df.loc[idx, 'Itinerary_Number'] = c
-            c += 1
-            
-                    
+    def build_buckets(self, origins):
+        positions_by_station = {}
+        for position, station in enumerate(origins):
+            positions_by_station.setdefault(station, []).append(position)
 
-    def is_valid_connection(self, i, j):
-        # Check if destination of first leg is the origin of the second leg
-        valid_destination_origin = self.flights.iloc[i, self.destination_column_no] == self.flights.iloc[j, self.origin_column_no]
-        not_circular_route = self.flights.iloc[i, self.origin_column_no] != self.flights.iloc[j, self.destination_column_no]
-        connection_time = self.dep[j] - self.arriv[i]
-        valid_connection_time = self.min_connection <= connection_time <= self.max_connection
+        for station, positions in positions_by_station.items():
+            positions.sort(key=lambda position: self.dep[position])
+            self.buckets[station] = ([self.dep[position] for position in positions], positions)
 
-        return valid_destination_origin and not_circular_route and valid_connection_time
-    
-    
-    # def add_itinerary(self, i, j):
-    #     itinerary_number = len(self.itin_list) + 1
-    #     flight1 = self.flights.iloc[i, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
-    #     flight2 = self.flights.iloc[j, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
-
-    #     # Convert departure and arrival times from string to datetime objects
-    #     # Convert departure and arrival times from string to datetime objects
-    #     departure_time = datetime.strptime(self.flights.iloc[j, self.departure_index], '%H:%M:%S')
-    #     arrival_time = datetime.strptime(self.flights.iloc[i, self.arrival_index], '%H:%M:%S')
-        
+    def get_connections(self, station, arrival_minute):
+        """
+        Returns the positions (ascending) of the flights leaving `station` within the connection window
+        of a flight arriving there at `arrival_minute`.
+        """
+        if station not in self.buckets:
+            return []
+        departures, positions = self.buckets[station]
+        start = bisect_left(departures, arrival_minute + self.min_connection - 1e-6)
+        end = bisect_right(departures, arrival_minute + self.max_connection + 1e-6)
 
-    #     # Calculate the transit time difference
-    #     if departure_time > arrival_time:
-    #         delta_1 = departure_time - arrival_time
-    #         hours_1 = delta_1.seconds // 3600
-    #         minutes_1 = (delta_1.seconds % 3600) // 60
-    #         if minutes_1 > 0:
-    #             first_transit_time = [f"{hours_1}h {minutes_1}"]
-    #         else:
-    #             first_transit_time = [f"{hours_1}h"]
-    #     else:
-    #         first_transit_time = ["0h"]  # If departure is not after arrival, set transit time to "0h"
-        
-    #     first_departure_time = datetime.strptime(self.flights.iloc[i, self.departure_index], '%H:%M:%S')
-    #     last_arrival_time = datetime.strptime(self.flights.iloc[j, self.arrival_index], '%H:%M:%S')
-            
-    #     if first_departure_time < last_arrival_time:
-    #         delta_2 = last_arrival_time - first_departure_time
-    #         hours_2 = delta_2.seconds // 3600
-    #         minutes_2 = (delta_2.seconds % 3600) // 60
-    #         if minutes_2 > 0:
-    #             duration = [f"{hours_2}h {minutes_2}"]
-    #         else:
-    #             duration = [f"{hours_2}h"]
-    #     else:
-    #         duration = ["0h"]  # If departure is not after arrival, set transit time to "0h"
+        # Re-check the window bounds exactly as the pairwise comparison does (float minutes)
+        connections = [positions[k] for k in range(start, end)
+                       if self.min_connection <= departures[k] - arrival_minute <= self.max_connection]
+        connections.sort()
+        return connections
 
+    def get_buckets(self):
+        """Returns {station: (sorted departure minutes, flight positions)}."""
+        return self.buckets
 
-    #     row = [itinerary_number] + flight1 + flight2 + first_transit_time + duration
-    #     self.itin_list.append(row)
 
-    def add_itinerary(self, i, j):
-        itinerary_number = len(self.itin_list) + 1
-        flight1 = self.flights.iloc[i, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
-        flight2 = self.flights.iloc[j, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
+##############################################################################################################
 
-        # Convert departure and arrival times from string to datetime objects
-        departure_time = datetime.strptime(self.flights.iloc[j, self.departure_index], '%H:%M:%S')
-        arrival_time = datetime.strptime(self.flights.iloc[i, self.arrival_index], '%H:%M:%S')
-        
-        # Calculate the transit time difference
-        if departure_time > arrival_time:
-            delta_1 = departure_time - arrival_time
-            hours_1 = delta_1.seconds // 3600
-            minutes_1 = (delta_1.seconds % 3600) // 60
-            first_transit_time = f"{hours_1}h {minutes_1}m" if minutes_1 else f"{hours_1}h"
-        else:
-            # Handling crossing midnight: Adjust arrival time to the next day
-            arrival_time += timedelta(days=1)
-            delta_1 = departure_time - arrival_time
-            hours_1 = delta_1.seconds // 3600
-            minutes_1 = (delta_1.seconds % 3600) // 60
-            first_transit_time = f"{hours_1}h {minutes_1}m" if minutes_1 else f"{hours_1}h"
-
-        first_departure_time = datetime.strptime(self.flights.iloc[i, self.departure_index], '%H:%M:%S')
-        last_arrival_time = datetime.strptime(self.flights.iloc[j, self.arrival_index], '%H:%M:%S')
-            
-        if first_departure_time > last_arrival_time:
-            last_arrival_time += timedelta(days=1)
+class ItinGraphBuilder:
+    """
+    Generates itineraries with up to max_stops stops from one flight connection graph.
 
-        delta_2 = last_arrival_time - first_departure_time
-        hours_2 = delta_2.seconds // 3600
-        minutes_2 = (delta_2.seconds % 3600) // 60
-        duration = f"{hours_2}h {minutes_2}m" if minutes_2 else f"{hours_2}h"
+    The graph is built once: every flight points to the flights leaving its destination inside the
+    connection window. Paths are then extended leg by leg, pruned on circular routes, the distance_ratio
+    circuity check and max_elapsed_time. A k-stop itinerary has Flight_Number_n, Origin_n, Departure_n,
+    Destination_n and Arrival_n columns for each of its k + 1 legs, the transit times and the Duration.
+    """
 
-        row = [itinerary_number] + flight1 + flight2 + [first_transit_time] + [duration]
-        self.itin_list.append(row)
-    
-    def get_ss_itin(self):
-        """Returns the single stop itineraries as a DataFrame."""
-        return self.itin_df
-    
-##############################################################################################################
+    TRANSIT_ORDINALS = ['First', 'Second', 'Third', 'Fourth', 'Fifth']
 
-class ItinDSBuilder:
-    """Generates double stop itineraries based on single stop itineraries."""
-    
-    def __init__(self, one_day_flights, ss_itin_df, dep, arriv, flight_number_index, origin_column_no, departure_index, destination_column_no, arrival_index, min_connection, max_connection, airports_distances_df, distance_ratio):
+    def __init__(self, one_day_flights, dep, arriv, flight_number_index, origin_column_no, departure_index, destination_column_no, arrival_index, min_connection, max_connection, airports_distances_df, distance_ratio, max_stops=2, max_elapsed_time=None):
+        """
+        Parameters:
+        - one_day_flights: DataFrame of the flights.
+        - dep, arriv: departure and arrival of every flight in minutes.
+        - flight_number_index, origin_column_no, departure_index, destination_column_no, arrival_index: column positions in one_day_flights.
+        - min_connection, max_connection: connection window in minutes.
+        - airports_distances_df: airport distance matrix as a DataFrame.
+        - distance_ratio: most an itinerary may fly, as a multiple of its origin-destination distance.
+        - max_stops: int, highest number of stops to generate (at most 5).
+        - max_elapsed_time: minutes from first departure to last arrival, None for no limit.
+        """
+        if not 0 < int(max_stops) <= len(self.TRANSIT_ORDINALS):
+            raise ValueError(f"Number of stops must be between 1 and {len(self.TRANSIT_ORDINALS)}.")
         self.flights = one_day_flights
-        self.ss_flights = ss_itin_df
         self.dep = dep
         self.arriv = arriv
-        self.flight_number_index = flight_number_index
-        self.origin_column_no = origin_column_no
-        self.departure_index = departure_index
-        self.destination_column_no = destination_column_no
-        self.arrival_index = arrival_index
+        self.flight_columns = [int(flight_number_index), int(origin_column_no), int(departure_index), int(destination_column_no), int(arrival_index)]
         self.min_connection = min_connection
         self.max_connection = max_connection
-        self.airports_distances_df = airports_distances_df
+        self.od_matrix = ODDistanceMatrix(airports_distances_df)
         self.distance_ratio = distance_ratio
-        self.itin_list = []
+        self.max_stops = int(max_stops)
+        self.max_elapsed_time = max_elapsed_time
+        self.paths = {stops: [] for stops in range(1, self.max_stops + 1)}
+        self.itineraries = {}
+
+    def build_connection_graph(self):
+        """Successor list of every flight, ascending by flight position."""
+        connections = ConnectionIndex(self.origins, self.dep, self.min_connection, self.max_connection)
+        self.successors = [connections.get_connections(self.destinations[i], self.arriv[i]) for i in range(len(self.origins))]
 
     def generate_itineraries(self):
-        for idx, ss_flight in self.ss_flights.iterrows():
-            try:
-                ss_arrival_time = self.parse_time(ss_flight['Arrival_2'])
-                ss_arrival_total_minutes = ss_arrival_time.hour * 60 + ss_arrival_time.minute
+        self.flight_rows = self.flights.iloc[:, self.flight_columns].values.tolist()
+        self.origins = [row[1] for row in self.flight_rows]
+        self.destinations = [row[3] for row in self.flight_rows]
+        self.build_connection_graph()
+
+        # Per flight values used while extending paths
+        self.leg_distances = np.round(self.od_matrix.lookup(self.origins, self.destinations), 1).tolist()
+        self.leg_minutes = [(self.arriv[i] - self.dep[i]) % 1440 for i in range(len(self.origins))]
+        self.origin_codes = self.od_matrix.get_stations().get_indexer(pd.Index(self.origins))
+        self.destination_codes = self.od_matrix.get_stations().get_indexer(pd.Index(self.destinations))
+
+        for i in range(len(self.origins)):
+            self.extend_path([i], [self.origins[i]], self.leg_distances[i], self.leg_minutes[i])
+
+        for stops, paths in self.paths.items():
+            self.itineraries[stops] = self.build_itinerary_df(paths, stops)
+
+    def extend_path(self, path, path_origins, distance, elapsed):
+        last = path[-1]
+        for j in self.successors[last]:
+            # A first leg is only paired with the legs listed after it in the schedule
+            if len(path) == 1 and j <= path[0]:
+                continue
+            if self.destinations[j] in path_origins:
+                continue
+
+            new_elapsed = elapsed + (self.dep[j] - self.arriv[last]) + self.leg_minutes[j]
+            if self.max_elapsed_time is not None and new_elapsed > self.max_elapsed_time:
+                continue
+            new_distance = distance + self.leg_distances[j]
+            if not self.is_within_circuity(path[0], j, new_distance):
+                continue
+
+            new_path = path + [j]
+            self.paths[len(path)].append(tuple(new_path))
+            if len(new_path) <= self.max_stops:
+                self.extend_path(new_path, path_origins + [self.origins[j]], new_distance, new_elapsed)
+
+    def is_within_circuity(self, first, last, distance):
+        """Same check as filter_itineraries_by_circuity, for one path."""
+        if np.isnan(distance):
+            return True  # a leg without distance gives an itinerary distance of 0
+        origin_code, destination_code = self.origin_codes[first], self.destination_codes[last]
+        if origin_code < 0 or destination_code < 0:
+            return True
+        return not distance > self.distance_ratio * self.od_matrix.get_matrix()[origin_code, destination_code]
+
+    def build_itinerary_df(self, paths, stops):
+        columns = ['Itinerary_Number']
+        for leg in range(1, stops + 2):
+            columns += [f'Flight_Number_{leg}', f'Origin_{leg}', f'Departure_{leg}', f'Destination_{leg}', f'Arrival_{leg}']
+        columns += [f'{self.TRANSIT_ORDINALS[k]}_Transit_Time' for k in range(stops)] + ['Duration']
+
+        rows = []
+        for number, path in enumerate(paths, start=1):
+            row = [number]
+            for i in path:
+                row += self.flight_rows[i]
+            for previous, following in zip(path, path[1:]):
+                row.append(self.format_duration(self.dep[following] - self.arriv[previous]))
+            row.append(self.format_duration(self.arriv[path[-1]] - self.dep[path[0]]))
+            rows.append(row)
+
+        itin_df = pd.DataFrame(rows, columns=columns)
+        return filter_itineraries_by_circuity(itin_df, self.od_matrix, stops + 1, self.distance_ratio)
 
-                for j in range(len(self.flights)):
-                    if self.is_valid_connection(idx, j, ss_arrival_total_minutes):
-                        self.add_itinerary(idx, j, ss_arrival_total_minutes)
+    @staticmethod
+    def format_duration(minutes):
+        """Clock difference as 'Xh Ym' (or 'Xh'), wrapped over midnight."""
+        seconds = round(minutes * 60) % 86400
+        hours, minutes = seconds // 3600, (seconds % 3600) // 60
+        return f"{hours}h {minutes}m" if minutes else f"{hours}h"
 
-            except KeyError as e:
-                print(f"KeyError: {e} - likely due to a missing column in the DataFrame.")
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                
-        print('klk',self.itin_list)
-        self.ds_itin_df = pd.DataFrame(self.itin_list, columns=[
-            'Itinerary_Number', 'Flight_Number_1', 'Origin_1', 'Departure_1', 'Destination_1', 'Arrival_1',
-            'Flight_Number_2', 'Origin_2', 'Departure_2', 'Destination_2', 'Arrival_2',
-            'Flight_Number_3', 'Origin_3', 'Departure_3', 'Destination_3', 'Arrival_3', 'First_Transit_Time' , 'Second_Transit_Time', 'Duration'
-        ])
-        
-        for i in range(len(self.ds_itin_df)):
-            distance_itin = 0
-            for j in range(len(self.airports_distances_df)):
-                for k in range(len(self.airports_distances_df)):
-                    for m in range(len(self.airports_distances_df)):
-                        if (self.ds_itin_df.loc[i, 'Origin_1'] == self.airports_distances_df.loc[j, 'origin'] and
-                            self.ds_itin_df.loc[i, 'Destination_1'] == self.airports_distances_df.loc[j, 'destination'] and
-                            self.ds_itin_df.loc[i, 'Origin_2'] == self.airports_distances_df.loc[k, 'origin'] and
-                            self.ds_itin_df.loc[i, 'Destination_2'] == self.airports_distances_df.loc[k, 'destination'] and
-                            self.ds_itin_df.loc[i, 'Origin_3'] == self.airports_distances_df.loc[m, 'origin'] and
-                            self.ds_itin_df.loc[i, 'Destination_3'] == self.airports_distances_df.loc[m, 'destination']):
-                            
-                            distance_itin += round(self.airports_distances_df.loc[j, 'distance'], 1)
-                            distance_itin += round(self.airports_distances_df.loc[k, 'distance'], 1)
-                            distance_itin += round(self.airports_distances_df.loc[m, 'distance'], 1)
-
-            self.ds_itin_df.loc[i, 'Distance'] = distance_itin
-            
-        # Create a boolean mask initialized to keep all rows
-        mask = pd.Series(True, index=self.ds_itin_df.index)
-            
-        for i in range(len(self.ds_itin_df)):
-            for j in range(len(self.airports_distances_df)):
-                if (self.ds_itin_df.loc[i, 'Origin_1'] == self.airports_distances_df.loc[j, 'origin'] and
-                        self.ds_itin_df.loc[i, 'Destination_3'] == self.airports_distances_df.loc[j, 'destination']):
-                    if self.ds_itin_df.loc[i, 'Distance'] > self.distance_ratio * self.airports_distances_df.loc[j, 'distance']:
-                        mask[i] = False
-
-        # After the loops, drop the marked rows
-        self.ds_itin_df = self.ds_itin_df[mask]
-        c=1
-        for idx, itins in self.ds_itin_df .iterrows():
-            self.ds_itin_df.loc[idx, 'Itinerary_Number'] = c
-            c += 1
-
-    def is_valid_connection(self, i, j, ss_arrival_total_minutes):
-        destination_match = self.ss_flights.loc[i, 'Destination_2'] == self.flights.iloc[j, self.origin_column_no]
-        not_circular_route_1 = self.ss_flights.loc[i, 'Origin_1'] != self.flights.iloc[j, self.destination_column_no]
-        not_circular_route_2 = self.ss_flights.loc[i, 'Origin_2'] != self.flights.iloc[j, self.destination_column_no]
-        connection_time = self.dep[j] - ss_arrival_total_minutes
-        valid_connection_time = self.min_connection <= connection_time <= self.max_connection
-
-        return destination_match and not_circular_route_1 and not_circular_route_2 and valid_connection_time
-    # def add_itinerary(self, i, j, ss_arrival_total_minutes):
-        itinerary_number = len(self.itin_list) + 1
-        flight1 = self.ss_flights.loc[i, ['Flight_Number_1', 'Origin_1', 'Departure_1', 'Destination_1', 'Arrival_1']].tolist()
-        flight2 = self.ss_flights.loc[i, ['Flight_Number_2', 'Origin_2', 'Departure_2', 'Destination_2', 'Arrival_2']].tolist()
-        flight3 = self.flights.iloc[j, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
-        
-        # Convert departure and arrival times from string to datetime objects
-        departure_time = datetime.strptime(str(self.ss_flights.iloc[i]['Departure_1']), '%H:%M:%S')
-        arrival_time = datetime.strptime(str(self.ss_flights.iloc[i]['Arrival_1']), '%H:%M:%S')
-        departure_time_2 = datetime.strptime(self.flights.iloc[j, self.departure_index], '%H:%M:%S')
-        
+    def get_itineraries(self, stops):
+        """Returns the itineraries with the given number of stops as a DataFrame."""
+        return self.itineraries[stops]
 
-        # Calculate the transit time difference
-        if departure_time > arrival_time:
-            delta_1 = departure_time - arrival_time
-            hours_1 = delta_1.seconds // 3600
-            minutes_1 = (delta_1.seconds % 3600) // 60
-            if minutes_1 > 0:
-                first_transit_time = [f"{hours_1}h {minutes_1}"]
-            else:
-                first_transit_time = [f"{hours_1}h"]
-        else:
-            first_transit_time = ["0h"]  # If departure is not after arrival, set transit time to "0h"
-            
-        if arrival_time > departure_time_2:
-            delta_3 =  arrival_time - departure_time_2
-            hours_3 = delta_3.seconds // 3600
-            minutes_3 = (delta_3.seconds % 3600) // 60
-            if minutes_3 > 0:
-                second_transit_time = [f"{hours_3}h {minutes_3}"]
-            else:
-                second_transit_time = [f"{hours_3}h"]
-        else:
-            second_transit_time = ["0h"]  # If departure is not after arrival, set transit time to "0h"
-            
-        
-        first_departure_time = datetime.strptime(str(self.ss_flights.iloc[i]['Departure_1']), '%H:%M:%S')   
-        last_arrival_time = datetime.strptime(self.flights.iloc[j, self.arrival_index], '%H:%M:%S')
-            
-        if first_departure_time < last_arrival_time:
-            delta_2 =  last_arrival_time - first_departure_time
-            hours_2 = delta_2.seconds // 3600
-            minutes_2 = (delta_2.seconds % 3600) // 60
-            if minutes_2 > 0:
-                duration = [f"{hours_2}h {minutes_2}"]
-            else:
-                duration = [f"{hours_2}h"]
-        else:
-            duration = ["0h"]  # If departure is not after arrival, set transit time to "0h"
+    def get_all_itineraries(self):
+        """Returns the itineraries of every number of stops, single stop first, as a list of DataFrames."""
+        return [self.itineraries[stops] for stops in range(1, self.max_stops + 1)]
 
-        
-        row = [itinerary_number] + flight1 + flight2 + flight3 + first_transit_time + second_transit_time + duration
-        
-        self.itin_list.append(row)
-        
-    # def add_itinerary(self, i, j, ss_arrival_total_minutes):
-        itinerary_number = len(self.itin_list) + 1
-        flight1 = self.ss_flights.loc[i, ['Flight_Number_1', 'Origin_1', 'Departure_1', 'Destination_1', 'Arrival_1']].tolist()
-        flight2 = self.ss_flights.loc[i, ['Flight_Number_2', 'Origin_2', 'Departure_2', 'Destination_2', 'Arrival_2']].tolist()
-        flight3 = self.flights.iloc[j, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
-        
-        # Convert departure and arrival times from string to datetime objects
-        arrival_time_1 = datetime.strptime(flight1[-1], '%H:%M:%S')  # Arrival_1
-        departure_time_2 = datetime.strptime(flight2[2], '%H:%M:%S')  # Departure_2
-
-        # Adjust for crossing midnight if necessary
-        if departure_time_2 < arrival_time_1:
-            departure_time_2 += timedelta(days=1)
-
-        # Calculate the transit time difference between Arrival_1 and Departure_2
-        delta_transit_1 = departure_time_2 - arrival_time_1
-        hours_transit_1 = int(delta_transit_1.total_seconds() // 3600)
-        minutes_transit_1 = int((delta_transit_1.total_seconds() % 3600) // 60)
-        first_transit_time = f"{hours_transit_1}h {minutes_transit_1}m" if minutes_transit_1 else f"{hours_transit_1}h"
-
-        # For total duration from Departure_1 to Arrival_3
-        first_departure_time = datetime.strptime(flight1[2], '%H:%M:%S')  # Departure_1
-        last_arrival_time = datetime.strptime(flight3[-1], '%H:%M:%S')  # Arrival_3
-
-        # Adjust for crossing midnight if necessary
-        if last_arrival_time < first_departure_time:
-            last_arrival_time += timedelta(days=1)
-
-        delta_total_duration = last_arrival_time - first_departure_time
-        hours_total_duration = int(delta_total_duration.total_seconds() // 3600)
-        minutes_total_duration = int((delta_total_duration.total_seconds() % 3600) // 60)
-        total_duration = f"{hours_total_duration}h {minutes_total_duration}m" if minutes_total_duration else f"{hours_total_duration}h"
-
-        # Construct the row for the itinerary list
-        row = [itinerary_number] + flight1 + flight2 + flight3 + [first_transit_time, total_duration]
-        self.itin_list.append(row)
-    
-    def add_itinerary(self, i, j, ss_arrival_total_minutes):
-        itinerary_number = len(self.itin_list) + 1
-        flight1 = self.ss_flights.loc[i, ['Flight_Number_1', 'Origin_1', 'Departure_1', 'Destination_1', 'Arrival_1']].tolist()
-        flight2 = self.ss_flights.loc[i, ['Flight_Number_2', 'Origin_2', 'Departure_2', 'Destination_2', 'Arrival_2']].tolist()
-        flight3 = self.flights.iloc[j, [self.flight_number_index, self.origin_column_no, self.departure_index, self.destination_column_no, self.arrival_index]].tolist()
-        
-        # Convert departure and arrival times from string to datetime objects
-        arrival_time_1 = datetime.strptime(flight1[-1], '%H:%M:%S')  # Arrival_1
-        departure_time_2 = datetime.strptime(flight2[2], '%H:%M:%S')  # Departure_2
-        arrival_time_2 = datetime.strptime(flight2[-1], '%H:%M:%S')   # Arrival_2
-        departure_time_3 = datetime.strptime(flight3[2], '%H:%M:%S')  # Departure_3
-
-        # Adjust for crossing midnight if necessary
-        if departure_time_2 < arrival_time_1:
-            departure_time_2 += timedelta(days=1)
-        if departure_time_3 < arrival_time_2:
-            departure_time_3 += timedelta(days=1)
-
-        # Calculate the first transit time difference between Arrival_1 and Departure_2
-        delta_transit_1 = departure_time_2 - arrival_time_1
-        hours_transit_1 = int(delta_transit_1.total_seconds() // 3600)
-        minutes_transit_1 = int((delta_transit_1.total_seconds() % 3600) // 60)
-        first_transit_time = f"{hours_transit_1}h {minutes_transit_1}m" if minutes_transit_1 else f"{hours_transit_1}h"
-
-        # Calculate the second transit time difference between Arrival_2 and Departure_3
-        delta_transit_2 = departure_time_3 - arrival_time_2
-        hours_transit_2 = int(delta_transit_2.total_seconds() // 3600)
-        minutes_transit_2 = int((delta_transit_2.total_seconds() % 3600) // 60)
-        second_transit_time = f"{hours_transit_2}h {minutes_transit_2}m" if minutes_transit_2 else f"{hours_transit_2}h"
-
-        # For total duration from Departure_1 to Arrival_3
-        first_departure_time = datetime.strptime(flight1[2], '%H:%M:%S')  # Departure_1
-        last_arrival_time = datetime.strptime(flight3[-1], '%H:%M:%S')  # Arrival_3
-        if last_arrival_time < first_departure_time:
-            last_arrival_time += timedelta(days=1)
-
-        delta_total_duration = last_arrival_time - first_departure_time
-        hours_total_duration = int(delta_total_duration.total_seconds() // 3600)
-        minutes_total_duration = int((delta_total_duration.total_seconds() % 3600) // 60)
-        total_duration = f"{hours_total_duration}h {minutes_total_duration}m" if minutes_total_duration else f"{hours_total_duration}h"
-
-        # Construct the row for the itinerary list
-        row = [itinerary_number] + flight1 + flight2 + flight3 + [first_transit_time, second_transit_time, total_duration]
-        self.itin_list.append(row)
+    def get_ss_itin(self):
+        """Returns the single stop itineraries as a DataFrame."""
+        return self.itineraries[1]
 
     def get_ds_itin(self):
         """Returns the double stop itineraries as a DataFrame."""
-        return self.ds_itin_df
+        return self.itineraries[2]
+
+##############################################################################################################
+
+def req_format_columns(legs_number=3):
+    """Returns the req_format columns with the Flight<n> columns of legs_number legs (never fewer than 3)."""
+    columns = ['Airline', 'Itinerary_Number', 'Flights', 'Itinerary_Origin', 'Itinerary_Departure_Time', 'Itinerary_Destination', 'Itinerary_Arrival_Time', 'Itinerary_Duration',
+               'Itinerary_Distance', 'Itinerary_Type']
+    for leg in range(1, max(legs_number, 3) + 1):
+        columns += [f'Flight{leg}_Origin', f'Flight{leg}_Departure_Time', f'Flight{leg}_Destination', f'Flight{leg}_Arrival_Time', f'Flight{leg}_Duration']
+    return columns + ['Itinerary_Price']
+
+
+REQ_FORMAT_COLUMNS = req_format_columns()
+
+
+class ReqFormatBuilder:
+    """Builds the req_format itinerary export (non stop rows, then the rows of every number of stops) column by column."""
+
+    ITINERARY_TYPES = {1: 'Non Stop', 2: 'Single Stop', 3: 'Double Stop', 4: 'Triple Stop', 5: 'Quadruple Stop', 6: 'Quintuple Stop'}
+
+    def __init__(self, flights_df, itin_dfs, flight_number_index, origin_column_no, departure_index, destination_column_no, arrival_index):
+        """
+        Parameters:
+        - flights_df: DataFrame of the flights with their 'Distance' column.
+        - itin_dfs: list of the itineraries with 1, 2, ... stops, as ItinGraphBuilder.get_all_itineraries() returns them.
+        - flight_number_index, origin_column_no, departure_index, destination_column_no, arrival_index: column positions in flights_df.
+        """
+        non_stop = pd.DataFrame({
+            'Flight_Number_1': flights_df.iloc[:, int(flight_number_index)].to_numpy(),
+            'Origin_1': flights_df.iloc[:, int(origin_column_no)].to_numpy(),
+            'Departure_1': flights_df.iloc[:, int(departure_index)].to_numpy(),
+            'Destination_1': flights_df.iloc[:, int(destination_column_no)].to_numpy(),
+            'Arrival_1': flights_df.iloc[:, int(arrival_index)].to_numpy(),
+            'Distance': flights_df['Distance'].to_numpy(),
+        })
+        blocks = [self.build_block(itin_df, legs_number) for legs_number, itin_df in enumerate([non_stop, *itin_dfs], start=1) if len(itin_df)]
+
+        self.req_format = pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame()
+        self.req_format = self.req_format.reindex(columns=req_format_columns(len(itin_dfs) + 1))
+        self.req_format['Itinerary_Number'] = np.arange(1, len(self.req_format) + 1)
+        self.req_format = self.req_format.astype(object)
+        self.req_format = self.req_format.where(self.req_format.notna(), None)
+
+    def build_block(self, itin_df, legs_number):
+        """Req format rows for itineraries with legs_number legs, as column arrays."""
+        block = {}
+        for leg in range(1, legs_number + 1):
+            departure_seconds = self.clock_to_seconds(itin_df[f'Departure_{leg}'])
+            arrival_seconds = self.clock_to_seconds(itin_df[f'Arrival_{leg}'])
+            block[f'Flight{leg}_Origin'] = itin_df[f'Origin_{leg}'].to_numpy()
+            block[f'Flight{leg}_Departure_Time'] = itin_df[f'Departure_{leg}'].to_numpy()
+            block[f'Flight{leg}_Destination'] = itin_df[f'Destination_{leg}'].to_numpy()
+            block[f'Flight{leg}_Arrival_Time'] = itin_df[f'Arrival_{leg}'].to_numpy()
+            block[f'Flight{leg}_Duration'] = self.format_durations(arrival_seconds - departure_seconds)
+            if leg == 1:
+                first_departure_seconds = departure_seconds
+
+        flights = itin_df['Flight_Number_1'].astype(str)
+        for leg in range(2, legs_number + 1):
+            flights = flights + ', ' + itin_df[f'Flight_Number_{leg}'].astype(str)
+
+        block.update({
+            'Flights': flights.to_numpy(),
+            'Itinerary_Origin': itin_df['Origin_1'].to_numpy(),
+            'Itinerary_Departure_Time': itin_df['Departure_1'].to_numpy(),
+            'Itinerary_Destination': itin_df[f'Destination_{legs_number}'].to_numpy(),
+            'Itinerary_Arrival_Time': itin_df[f'Arrival_{legs_number}'].to_numpy(),
+            # Legs plus transits add up to last arrival - first departure, on the clock
+            'Itinerary_Duration': self.format_durations(arrival_seconds - first_departure_seconds),
+            'Itinerary_Type': self.ITINERARY_TYPES[legs_number],
+            'Itinerary_Distance': itin_df['Distance'].to_numpy(),
+        })
+        return pd.DataFrame(block, index=range(len(itin_df)))
 
     @staticmethod
-    def parse_time(time_str):
-        """Parses time in 'HH:MM' or 'HH:MM:SS' format."""
-        try:
-            return datetime.strptime(time_str, '%H:%M:%S')
-        except ValueError:
-            return datetime.strptime(time_str, '%H:%M')
+    def clock_to_seconds(times):
+        """'HH:MM:SS' strings to seconds since midnight."""
+        return pd.to_timedelta(pd.Series(times, dtype=str)).dt.total_seconds().to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def format_durations(seconds):
+        """Clock differences (wrapped over midnight) formatted as 'Xh Y', or 'Xh' on the hour."""
+        seconds = np.mod(seconds, 86400)
+        hours = (seconds // 3600).astype(str)
+        minutes = (seconds % 3600) // 60
+        return np.where(minutes > 0, np.char.add(np.char.add(hours, 'h '), minutes.astype(str)), np.char.add(hours, 'h')).astype(object)
+
+    def get_req_format(self):
+        """Returns the req_format export as a DataFrame."""
+        return self.req_format
+
+##############################################################################################################
 
+def build_itinerary_results(flights_df, airport_df, column_indexes, column_indexes_airport, turn_around_time, connection_time, distance_ratio, max_stops=2, max_elapsed_time=None, progress=None):
+    """
+    Runs the whole itinerary build: airport distances, itineraries, flight distances/durations and req_format.
+
+    Parameters:
+    - flights_df, airport_df: uploaded flights and airport coordinates.
+    - column_indexes, column_indexes_airport: column positions found (or entered) for both uploads.
+    - turn_around_time, connection_time, distance_ratio: the connection window and circuity limit.
+    - max_stops: int, highest number of stops of an itinerary.
+    - max_elapsed_time: minutes from first departure to last arrival, None for no limit.
+    - progress: optional callable(step, current, total) called before each stage.
+
+    Returns:
+    - dict with the new_flights_df and req_format DataFrames, and itin_dfs, the list of the itineraries of every number of stops.
+    """
+    progress = progress or (lambda step, current, total: None)
+    flight_no_index = column_indexes.get('flight number')
+    departure_index = column_indexes.get('departure')
+    arrival_index = column_indexes.get('arrival')
+    origin_index = column_indexes.get('origin')
+    destination_index = column_indexes.get('destination')
+
+    progress('Computing airport distances', 0, 4)
+    airports_distances_df = create_distance_dataframe(airport_df, column_indexes_airport.get('airport'), column_indexes_airport.get('latitude'), column_indexes_airport.get('longitude'))
+
+    progress('Generating itineraries', 1, 4)
+    dep_arriv = ClockToMinutes(flights_df, departure_index, arrival_index)
+    itineraries = ItinGraphBuilder(flights_df, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes(), flight_no_index, origin_index, departure_index, destination_index, arrival_index, turn_around_time, connection_time, airports_distances_df, distance_ratio, max_stops=max_stops, max_elapsed_time=max_elapsed_time)
+    itineraries.generate_itineraries()
+    itin_dfs = itineraries.get_all_itineraries()
+
+    progress('Computing flight distances and durations', 2, 4)
+    new_flights_df = Flights_Distance_Duration(flights_df, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes(), flight_no_index, origin_index, departure_index, destination_index, arrival_index, turn_around_time, connection_time, airports_distances_df, distance_ratio).get_flights_distance_duration()
+
+    progress('Formatting itineraries', 3, 4)
+    req_format = ReqFormatBuilder(new_flights_df, itin_dfs, flight_no_index, origin_index, departure_index, destination_index, arrival_index).get_req_format()
+
+    return {
+        'new_flights_df': new_flights_df,
+        'itin_dfs': itin_dfs,
+        'req_format': req_format,
+    }
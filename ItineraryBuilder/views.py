@@ -1,18 +1,22 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
-from .forms import ExcelUploadForm, create_column_index_form, TurnAroundTimeForm, ConnectionTimeForm, DistanceConstraintForm
-from .utils import ColumnIndex, SyncReadExcel, ClockToMinutes, UniqueStations, ItinSSBuilder, ItinDSBuilder, ColumnIndex_Airport, create_distance_dataframe, Flights_Distance_Duration
+from .forms import ExcelUploadForm, create_column_index_form, TurnAroundTimeForm, ConnectionTimeForm, DistanceConstraintForm, ItineraryStopsForm
+from .utils import ColumnIndex, SyncReadExcel, ClockToMinutes, UniqueStations, ColumnIndex_Airport, ReqFormatBuilder
 import pandas as pd
 import json
-from io import StringIO
 import logging
-from datetime import datetime,timedelta
 from django.conf import settings
 import traceback
 import os
 from django.http import FileResponse, HttpResponseNotFound, HttpResponse, HttpResponseServerError
 from django.http import JsonResponse
+from django.contrib import messages
+from django.urls import reverse
+from celery.result import AsyncResult
+from kombu.exceptions import OperationalError
+from .tasks import build_itineraries, run_itinerary_build, save_build_results, load_build_results
+from SkyLinker.artifacts import save_session_frame, load_session_frame, normalize_frame, redirect_when_expired, save_session_handles
 
 logger = logging.getLogger(__name__)
 
@@ -34,13 +38,8 @@ def upload_excel_Itin(request):
                 return render(request, 'pages/itinerarybuilder.html', {'excel_form': form, 'error_message': str(e)})
 
             
-            # Convert DataFrame to JSON for session storage
-            flights_df_json = read_excel.get_dataframe().to_json(orient='split')
-            flights_list = read_excel.get_data_list()
-
-             # Store in session
-            request.session['flights_df'] = flights_df_json
-            request.session['flights_list'] = flights_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'flights_df', normalize_frame(read_excel.get_dataframe()))
             
 
             return redirect('process_columns_Itin')
@@ -48,14 +47,14 @@ def upload_excel_Itin(request):
         form = ExcelUploadForm()
     return render(request, 'pages/itinerarybuilder.html', {'excel_form': form}) ############################# CARE
 
+@redirect_when_expired('upload_excel_Itin')
 def process_columns_Itin(request):
     if 'flights_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_excel_Itin')
 
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
     # Initialize ColumnIndex with DataFrame
     column_index = ColumnIndex(flights_df)
@@ -125,13 +124,8 @@ def upload_airport_coordinates(request):
                 return render(request, 'pages/itinerarybuilder.html', {'airport_excel_form': form, 'error_message': str(e)})
 
             
-            # Convert DataFrame to JSON for session storage
-            airport_df_json = read_excel.get_dataframe().to_json(orient='split')
-            airport_list = read_excel.get_data_list()
-
-             # Store in session
-            request.session['airport_df'] = airport_df_json
-            request.session['airport_list'] = airport_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'airport_df', normalize_frame(read_excel.get_dataframe()))
             
 
             return redirect('process_columns_airport')
@@ -139,14 +133,14 @@ def upload_airport_coordinates(request):
         form = ExcelUploadForm()
     return render(request, 'pages/itinerarybuilder.html', {'airport_excel_form': form}) ############################# CARE
 
+@redirect_when_expired('upload_excel_Itin')
 def process_columns_airport(request):
     if 'airport_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_airport_coordinates')
 
     # Load DataFrame from session
-    airport_df_json = request.session.get('airport_df')
-    airport_df = pd.read_json(StringIO(airport_df_json), orient='split')
+    airport_df = load_session_frame(request, 'airport_df')
     
     # Initialize ColumnIndex with DataFrame
     column_index = ColumnIndex_Airport(airport_df)
@@ -200,8 +194,7 @@ def process_columns_airport(request):
             return redirect('turn_around_and_connection_Itin')
 
 def process_time_and_stations_Itin(request):
-    flights_df_json = request.session.get('flights_df', '{}')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     column_indexes = json.loads(request.session.get('column_indexes', '{}'))
     
     #print("\n\n column_indexes: %s", column_indexes)
@@ -221,426 +214,94 @@ def process_time_and_stations_Itin(request):
     request.session['arrival_minutes'] = json.dumps(arrival_minutes)
     request.session['unique_stations'] = json.dumps(unique_stations)        
 
+@redirect_when_expired('upload_excel_Itin')
 def turn_around_and_connection_Itin(request):
     if request.method == 'POST':
         turn_around_form = TurnAroundTimeForm(request.POST)
         connection_time_form = ConnectionTimeForm(request.POST)
         distance_ratio_form = DistanceConstraintForm(request.POST)
-        if turn_around_form.is_valid() and connection_time_form.is_valid() and distance_ratio_form.is_valid():
+        stops_form = ItineraryStopsForm(request.POST)
+        if turn_around_form.is_valid() and connection_time_form.is_valid() and distance_ratio_form.is_valid() and stops_form.is_valid():
             turn_around_time = turn_around_form.cleaned_data['turn_around_time']
             connection_time = connection_time_form.cleaned_data['connection_time']
             distance_ratio = distance_ratio_form.cleaned_data['distance_ratio']
+            max_stops = stops_form.cleaned_data['max_stops']
+            max_elapsed_time = stops_form.cleaned_data['max_elapsed_time']
 
             request.session['turn_around_time'] = turn_around_time
             request.session['connection_time'] = connection_time
             request.session['distance_ratio'] = distance_ratio
+            request.session['max_stops'] = max_stops
+            request.session['max_elapsed_time'] = max_elapsed_time
+
+            build_args = (
+                request.session.get('flights_df'),
+                request.session.get('airport_df'),
+                json.loads(request.session.get('column_indexes', '{}')),
+                json.loads(request.session.get('column_indexes_airport', '{}')),
+                turn_around_time, connection_time, distance_ratio,
+                max_stops, max_elapsed_time,
+            )
+
+            # ****** Submit the build to the Celery worker, the page polls its progress ****** #
+            try:
+                task = build_itineraries.delay(*build_args)
+            except (OperationalError, RuntimeError):
+                # Broker or Redis result store unreachable (RuntimeError comes from the result consumer)
+                logger.warning("Celery broker unavailable, building itineraries within the request")
+                save_session_handles(request, 'itinerary_build_results', save_build_results(run_itinerary_build(*build_args)))
+                return redirect('results_Itin')
 
-            flights_df_json = request.session.get('flights_df')
-            flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
-            
-            column_indexes = json.loads(request.session.get('column_indexes', '{}'))
-            flight_no_index = column_indexes.get('flight number')
-            departure_index = column_indexes.get('departure')
-            arrival_index = column_indexes.get('arrival')
-            origin_index = column_indexes.get('origin')
-            destination_index = column_indexes.get('destination')
-            
-            column_indexes_airport = json.loads(request.session.get('column_indexes_airport', '{}'))
-            airport_index = column_indexes_airport.get('airport')
-            longitude_index = column_indexes_airport.get('longitude')
-            latitude_index = column_indexes_airport.get('latitude')
-            
-            airport_df_json = request.session.get('airport_df', '{}')
-            airport_df = pd.read_json(StringIO(airport_df_json), orient='split')
-            
-            airports_distances_df = create_distance_dataframe(airport_df, airport_index, latitude_index, longitude_index)
-
-            dep_arriv = ClockToMinutes(flights_df, departure_index, arrival_index)
-            singlestop = ItinSSBuilder(flights_df, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes(), flight_no_index, origin_index, departure_index, destination_index, arrival_index, turn_around_time, connection_time, airports_distances_df, distance_ratio)
-            
-            singlestop.generate_itineraries()
-            ss_itin_df = singlestop.get_ss_itin()
-            
-            doublestop = ItinDSBuilder(flights_df, ss_itin_df, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes(), flight_no_index, origin_index, departure_index, destination_index, arrival_index, turn_around_time, connection_time, airports_distances_df, distance_ratio)
-            
-            doublestop.generate_itineraries()
-            ds_itin_df = doublestop.get_ds_itin()
-            
-            new_flights_df_instance = Flights_Distance_Duration(flights_df, dep_arriv.get_departure_minutes(), dep_arriv.get_arrival_minutes(), flight_no_index, origin_index, departure_index, destination_index, arrival_index, turn_around_time, connection_time, airports_distances_df, distance_ratio)
-            
-            new_flights_df = new_flights_df_instance.get_flights_distance_duration()
-            # print(f'\n\n ds_itin_df: {ds_itin_df}\n\n')
-            
-            req_format_columns = [
-                'Airline', 'Itinerary_Number', 'Flights', 'Itinerary_Origin', 'Itinerary_Departure_Time', 'Itinerary_Destination', 'Itinerary_Arrival_Time', 'Itinerary_Duration',
-                'Itinerary_Distance', 'Itinerary_Type', 'Flight1_Origin', 'Flight1_Departure_Time', 'Flight1_Destination', 'Flight1_Arrival_Time',  'Flight1_Duration', 
-                'Flight2_Origin', 'Flight2_Departure_Time', 'Flight2_Destination', 'Flight2_Arrival_Time',  'Flight2_Duration',
-                'Flight3_Origin', 'Flight3_Departure_Time', 'Flight3_Destination', 'Flight3_Arrival_Time',  'Flight3_Duration','Itinerary_Price'
-            ]
-            req_format = pd.DataFrame(columns=req_format_columns)
-            
-            counter = 1
-            df_index = 0
-            
-            # print(flights_df)
-
-            # Use iterrows to iterate over flights_df
-            
-            for idx, flight in flights_df.iterrows():
-                # Set values for the new row using loc to correctly reference and create the row if it does not exist
-        
-                # departure_time_1 = datetime.strptime(flight.iloc[departure_index], '%H:%M:%S')
-                # arrival_time_1 = datetime.strptime(flight.iloc[arrival_index], '%H:%M:%S')
-
-                # # Calculate the transit time difference
-                # if departure_time_1 < arrival_time_1:
-                #     delta_1 = departure_time_1 - arrival_time_1
-                #     hours_1 = delta_1.seconds // 3600
-                #     minutes_1 = (delta_1.seconds % 3600) // 60
-                #     if minutes_1 > 0:
-                #         duration_1 = f"{hours_1}h {minutes_1}"
-                #     else:
-                #         duration_1 = f"{hours_1}h"
-                # else:
-                #     duration_1 = "0h"  # If departure is not after arrival, set transit time to "0h"   
-                
-                departure_time = datetime.strptime(flight.iloc[departure_index], '%H:%M:%S')
-                arrival_time = datetime.strptime(flight.iloc[arrival_index], '%H:%M:%S')
-
-                if arrival_time < departure_time:
-                    arrival_time += timedelta(days=1)
-
-                duration = arrival_time - departure_time
-                hours = duration.seconds // 3600
-                minutes = (duration.seconds % 3600) // 60
-                duration_str = f"{hours}h {minutes}" if minutes > 0 else f"{hours}h"
-
-                
-                
-                req_format.loc[df_index, 'Airline'] = None
-                req_format.loc[df_index, 'Itinerary_Number'] = counter
-                req_format.loc[df_index, 'Flights'] = f'{flight.iloc[flight_no_index]}'
-                req_format.loc[df_index, 'Itinerary_Origin'] = flight.iloc[origin_index]
-                req_format.loc[df_index, 'Itinerary_Departure_Time'] = flight.iloc[departure_index]
-                req_format.loc[df_index, 'Itinerary_Destination'] = flight.iloc[destination_index]
-                req_format.loc[df_index, 'Itinerary_Arrival_Time'] = flight.iloc[arrival_index]
-                req_format.loc[df_index, 'Itinerary_Duration'] = duration_str  # Assuming duration is calculated or added later
-                req_format.loc[df_index, 'Itinerary_Type'] = 'Non Stop'
-                req_format.loc[df_index, 'Itinerary_Price'] = None
-                req_format.loc[df_index, 'Itinerary_Distance'] = flight['Distance']
-                
-                req_format.loc[df_index, 'Flight1_Origin'] = flight.iloc[origin_index]
-                req_format.loc[df_index, 'Flight1_Departure_Time'] = flight.iloc[departure_index]
-                req_format.loc[df_index, 'Flight1_Destination'] = flight.iloc[destination_index]
-                req_format.loc[df_index, 'Flight1_Arrival_Time'] = flight.iloc[arrival_index]
-                req_format.loc[df_index, 'Flight1_Duration'] = duration_str
-                
-                req_format.loc[df_index, 'Flight2_Origin'] = None
-                req_format.loc[df_index, 'Flight2_Departure_Time'] = None
-                req_format.loc[df_index, 'Flight2_Destination'] = None
-                req_format.loc[df_index, 'Flight2_Arrival_Time'] = None
-                req_format.loc[df_index, 'Flight2_Duration'] = None
-                
-                req_format.loc[df_index, 'Flight3_Origin'] = None
-                req_format.loc[df_index, 'Flight3_Departure_Time'] = None
-                req_format.loc[df_index, 'Flight3_Destination'] = None
-                req_format.loc[df_index, 'Flight3_Arrival_Time'] = None
-                req_format.loc[df_index, 'Flight3_Duration'] = None
-
-                # Increment counter after each row is added
-                counter += 1
-                df_index += 1
-                
-            for idx, flight in ss_itin_df.iterrows():
-                # # Set values for the new row using loc to correctly reference and create the row if it does not exist
-                
-    
-                
-                departure_time_1 = datetime.strptime(flight['Departure_1'], '%H:%M:%S')
-                
-                arrival_time_1 = datetime.strptime(flight['Arrival_1'], '%H:%M:%S')
-                if arrival_time_1 < departure_time_1:
-                    arrival_time_1 += timedelta(days=1)
-
-                departure_time_2 = datetime.strptime(flight['Departure_2'], '%H:%M:%S')
-                arrival_time_2 = datetime.strptime(flight['Arrival_2'], '%H:%M:%S')
-                if arrival_time_2 < departure_time_2:
-                    arrival_time_2 += timedelta(days=1)
-
-                duration_1 = arrival_time_1 - departure_time_1
-                hours_1 = duration_1.seconds // 3600
-                minutes_1 = (duration_1.seconds % 3600) // 60
-                duration_1_str = f"{hours_1}h {minutes_1}" if minutes_1 > 0 else f"{hours_1}h"
-
-                duration_2 = arrival_time_2 - departure_time_2
-                hours_2 = duration_2.seconds // 3600
-                minutes_2 = (duration_2.seconds % 3600) // 60
-                duration_2_str = f"{hours_2}h {minutes_2}" if minutes_2 > 0 else f"{hours_2}h"
-                
-                Transit_1 = departure_time_2 - arrival_time_1
-                
-                total_duration = duration_1 + duration_2 + Transit_1
-                hours_t = total_duration.seconds // 3600
-                minutes_t = (total_duration.seconds % 3600) // 60
-                total_duration_str = f"{hours_t}h {minutes_t}" if minutes_t > 0 else f"{hours_t}h"
-
-                
-            
-                req_format.loc[df_index, 'Airline'] = None
-                req_format.loc[df_index, 'Itinerary_Number'] = counter
-                req_format.loc[df_index, 'Flights'] = f'{flight['Flight_Number_1']}, {flight['Flight_Number_2']}'
-                req_format.loc[df_index, 'Itinerary_Origin'] = flight['Origin_1']
-                req_format.loc[df_index, 'Itinerary_Departure_Time'] = flight['Departure_1']
-                req_format.loc[df_index, 'Itinerary_Destination'] = flight['Destination_2']
-                req_format.loc[df_index, 'Itinerary_Arrival_Time'] = flight['Arrival_2']
-                req_format.loc[df_index, 'Itinerary_Duration'] = total_duration_str
-                req_format.loc[df_index, 'Itinerary_Type'] = 'Single Stop'
-                req_format.loc[df_index, 'Itinerary_Price'] = None
-                req_format.loc[df_index, 'Itinerary_Distance'] = flight['Distance']
-                
-                req_format.loc[df_index, 'Flight1_Origin'] = flight['Origin_1']
-                req_format.loc[df_index, 'Flight1_Departure_Time'] = flight['Departure_1']
-                req_format.loc[df_index, 'Flight1_Destination'] = flight['Destination_1']
-                req_format.loc[df_index, 'Flight1_Arrival_Time'] = flight['Arrival_1']
-                req_format.loc[df_index, 'Flight1_Duration'] = duration_1_str
-                
-                req_format.loc[df_index, 'Flight2_Origin'] = flight['Origin_2']
-                req_format.loc[df_index, 'Flight2_Departure_Time'] = flight['Departure_2']
-                req_format.loc[df_index, 'Flight2_Destination'] = flight['Destination_2']
-                req_format.loc[df_index, 'Flight2_Arrival_Time'] = flight['Arrival_2']
-                req_format.loc[df_index, 'Flight2_Duration'] = duration_2_str
-                
-                req_format.loc[df_index, 'Flight3_Origin'] = None
-                req_format.loc[df_index, 'Flight3_Departure_Time'] = None
-                req_format.loc[df_index, 'Flight3_Destination'] = None
-                req_format.loc[df_index, 'Flight3_Arrival_Time'] = None
-                req_format.loc[df_index, 'Flight3_Duration'] = None
-
-                # Increment counter after each row is added
-                counter += 1
-                df_index += 1
-                             
-            for idx, flight in ds_itin_df.iterrows():
-                # # Set values for the new row using loc to correctly reference and create the row if it does not exist
-                
-                
-                departure_time_1 = datetime.strptime(flight['Departure_1'], '%H:%M:%S')
-                arrival_time_1 = datetime.strptime(flight['Arrival_1'], '%H:%M:%S')
-                
-                if arrival_time_1 < departure_time_1:
-                    arrival_time_1 += timedelta(days=1)
-
-                departure_time_2 = datetime.strptime(flight['Departure_2'], '%H:%M:%S')
-                arrival_time_2 = datetime.strptime(flight['Arrival_2'], '%H:%M:%S')
-                
-                if arrival_time_2 < departure_time_2:
-                    arrival_time_2 += timedelta(days=1)
-
-                departure_time_3 = datetime.strptime(flight['Departure_3'], '%H:%M:%S')
-                arrival_time_3 = datetime.strptime(flight['Arrival_3'], '%H:%M:%S')
-                
-                if arrival_time_3 < departure_time_3:
-                    arrival_time_3 += timedelta(days=1)
-
-                duration_1 = arrival_time_1 - departure_time_1
-                hours_1 = duration_1.seconds // 3600
-                minutes_1 = (duration_1.seconds % 3600) // 60
-                duration_1_str = f"{hours_1}h {minutes_1}" if minutes_1 > 0 else f"{hours_1}h"
-
-                duration_2 = arrival_time_2 - departure_time_2
-                hours_2 = duration_2.seconds // 3600
-                minutes_2 = (duration_2.seconds % 3600) // 60
-                duration_2_str = f"{hours_2}h {minutes_2}" if minutes_2 > 0 else f"{hours_2}h"
-
-                duration_3 = arrival_time_3 - departure_time_3
-                hours_3 = duration_3.seconds // 3600
-                minutes_3 = (duration_3.seconds % 3600) // 60
-                duration_3_str = f"{hours_3}h {minutes_3}" if minutes_3 > 0 else f"{hours_3}h"
-
-                Transit_1 = departure_time_2 - arrival_time_1
-                
-                Transit_2 = departure_time_3 - arrival_time_2
-                
-                total_duration = duration_1 + duration_2 + duration_3 + Transit_1 + Transit_2
-                hours_t = total_duration.seconds // 3600
-                minutes_t = (total_duration.seconds % 3600) // 60
-                total_duration_str = f"{hours_t}h {minutes_t}" if minutes_t > 0 else f"{hours_t}h"
-                
-                
-
-                req_format.loc[df_index, 'Itinerary_Duration'] = total_duration_str
-            
-                req_format.loc[df_index, 'Airline'] = None
-                req_format.loc[df_index, 'Itinerary_Number'] = counter
-                req_format.loc[df_index, 'Flights'] = f'{flight['Flight_Number_1']}, {flight['Flight_Number_2']}, {flight['Flight_Number_3']}'
-                req_format.loc[df_index, 'Itinerary_Origin'] = flight['Origin_1']
-                req_format.loc[df_index, 'Itinerary_Departure_Time'] = flight['Departure_1']
-                req_format.loc[df_index, 'Itinerary_Destination'] = flight['Destination_3']
-                req_format.loc[df_index, 'Itinerary_Arrival_Time'] = flight['Arrival_3']
-                req_format.loc[df_index, 'Itinerary_Duration'] = total_duration_str
-                req_format.loc[df_index, 'Itinerary_Type'] = 'Double Stop'
-                req_format.loc[df_index, 'Itinerary_Price'] = None
-                req_format.loc[df_index, 'Itinerary_Distance'] = flight['Distance']
-                
-                req_format.loc[df_index, 'Flight1_Origin'] = flight['Origin_1']
-                req_format.loc[df_index, 'Flight1_Departure_Time'] = flight['Departure_1']
-                req_format.loc[df_index, 'Flight1_Destination'] = flight['Destination_1']
-                req_format.loc[df_index, 'Flight1_Arrival_Time'] = flight['Arrival_1']
-                req_format.loc[df_index, 'Flight1_Duration'] = duration_1_str
-                
-                req_format.loc[df_index, 'Flight2_Origin'] = flight['Origin_2']
-                req_format.loc[df_index, 'Flight2_Departure_Time'] = flight['Departure_2']
-                req_format.loc[df_index, 'Flight2_Destination'] = flight['Destination_2']
-                req_format.loc[df_index, 'Flight2_Arrival_Time'] = flight['Arrival_2']
-                req_format.loc[df_index, 'Flight2_Duration'] = duration_2_str
-                
-                req_format.loc[df_index, 'Flight3_Origin'] = flight['Origin_3']
-                req_format.loc[df_index, 'Flight3_Departure_Time'] = flight['Departure_3']
-                req_format.loc[df_index, 'Flight3_Destination'] = flight['Destination_3']
-                req_format.loc[df_index, 'Flight3_Arrival_Time'] = flight['Arrival_3']
-                req_format.loc[df_index, 'Flight3_Duration'] = duration_3_str
-                
-                logger.debug(f"req_format.loc[df_index, 'Itinerary_Departure_Time'] Type: {type(req_format.loc[df_index, 'Itinerary_Departure_Time'])}")
-                
-                # Increment counter after each row is added
-                counter += 1
-                df_index += 1
-            
-            # Iterate through the DataFrame for non-stop flights
-            
-            # for idx, flight in flights_df.iterrows():
-            #     departure_time = datetime.strptime(flight.iloc[departure_index], '%H:%M:%S')
-            #     arrival_time = datetime.strptime(flight.iloc[arrival_index], '%H:%M:%S')
-
-            #     if arrival_time < departure_time:
-            #         arrival_time += timedelta(days=1)
-
-            #     duration = arrival_time - departure_time
-            #     hours = duration.seconds // 3600
-            #     minutes = (duration.seconds % 3600) // 60
-            #     duration_str = f"{hours}h {minutes}m" if minutes > 0 else f"{hours}h"
-
-            #     req_format.loc[df_index, 'Itinerary_Duration'] = duration_str
-            #     # Increment counter and df_index for each row added
-            #     counter += 1
-            #     df_index += 1
-
-            # # Iterate through the DataFrame for single-stop flights
-            # for idx, flight in ss_itin_df.iterrows():
-            #     departure_time_1 = datetime.strptime(flight['Departure_1'], '%H:%M:%S')
-            #     arrival_time_1 = datetime.strptime(flight['Arrival_1'], '%H:%M:%S')
-            #     if arrival_time_1 < departure_time_1:
-            #         arrival_time_1 += timedelta(days=1)
-
-            #     departure_time_2 = datetime.strptime(flight['Departure_2'], '%H:%M:%S')
-            #     arrival_time_2 = datetime.strptime(flight['Arrival_2'], '%H:%M:%S')
-            #     if arrival_time_2 < departure_time_2:
-            #         arrival_time_2 += timedelta(days=1)
-
-            #     duration_1 = arrival_time_1 - departure_time_1
-            #     hours_1 = duration_1.seconds // 3600
-            #     minutes_1 = (duration_1.seconds % 3600) // 60
-            #     duration_1_str = f"{hours_1}h {minutes_1}m" if minutes_1 > 0 else f"{hours_1}h"
-
-            #     duration_2 = arrival_time_2 - departure_time_2
-            #     hours_2 = duration_2.seconds // 3600
-            #     minutes_2 = (duration_2.seconds % 3600) // 60
-            #     duration_2_str = f"{hours_2}h {minutes_2}m" if minutes_2 > 0 else f"{hours_2}h"
-
-            #     total_duration = duration_1 + duration_2
-            #     hours_t = total_duration.seconds // 3600
-            #     minutes_t = (total_duration.seconds % 3600) // 60
-            #     total_duration_str = f"{hours_t}h {minutes_t}m" if minutes_t > 0 else f"{hours_t}h"
-
-            #     req_format.loc[df_index, 'Itinerary_Duration'] = total_duration_str
-            #     # Increment counter and df_index for each row added
-            #     counter += 1
-            #     df_index += 1
-
-            # # Iterate through the DataFrame for double-stop flights
-            # for idx, flight in ds_itin_df.iterrows():
-            #     departure_time_1 = datetime.strptime(flight['Departure_1'], '%H:%M:%S')
-            #     arrival_time_1 = datetime.strptime(flight['Arrival_1'], '%H:%M:%S')
-            #     if arrival_time_1 < departure_time_1:
-            #         arrival_time_1 += timedelta(days=1)
-
-            #     departure_time_2 = datetime.strptime(flight['Departure_2'], '%H:%M:%S')
-            #     arrival_time_2 = datetime.strptime(flight['Arrival_2'], '%H:%M:%S')
-            #     if arrival_time_2 < departure_time_2:
-            #         arrival_time_2 += timedelta(days=1)
-
-            #     departure_time_3 = datetime.strptime(flight['Departure_3'], '%H:%M:%S')
-            #     arrival_time_3 = datetime.strptime(flight['Arrival_3'], '%H:%M:%S')
-            #     if arrival_time_3 < departure_time_3:
-            #         arrival_time_3 += timedelta(days=1)
-
-            #     duration_1 = arrival_time_1 - departure_time_1
-            #     hours_1 = duration_1.seconds // 3600
-            #     minutes_1 = (duration_1.seconds % 3600) // 60
-            #     duration_1_str = f"{hours_1}h {minutes_1}m" if minutes_1 > 0 else f"{hours_1}h"
-
-            #     duration_2 = arrival_time_2 - departure_time_2
-            #     hours_2 = duration_2.seconds // 3600
-            #     minutes_2 = (duration_2.seconds % 3600) // 60
-            #     duration_2_str = f"{hours_2}h {minutes_2}m" if minutes_2 > 0 else f"{hours_2}h"
-
-            #     duration_3 = arrival_time_3 - departure_time_3
-            #     hours_3 = duration_3.seconds // 3600
-            #     minutes_3 = (duration_3.seconds % 3600) // 60
-            #     duration_3_str = f"{hours_3}h {minutes_3}m" if minutes_3 > 0 else f"{hours_3}h"
-
-            #     total_duration = duration_1 + duration_2 + duration_3
-            #     hours_t = total_duration.seconds // 3600
-            #     minutes_t = (total_duration.seconds % 3600) // 60
-            #     total_duration_str = f"{hours_t}h {minutes_t}m" if minutes_t > 0 else f"{hours_t}h"
-
-            #     req_format.loc[df_index, 'Itinerary_Duration'] = total_duration_str
-            #     # Increment counter and df_index for each row added
-            #     counter += 1
-            #     df_index += 1
-           
-                
-                
-            # logger.debug(f"req_format['Itinerary_Departure_Time']: {req_format['Itinerary_Departure_Time']}")
-            # logger.debug(f"req_format['Itinerary_Departure_Time'] Type: {type(req_format['Itinerary_Departure_Time'])}")
-                
-            # req_format['Itinerary_Departure_Time'] = req_format['Itinerary_Departure_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            # req_format['Itinerary_Arrival_Time'] = req_format['Itinerary_Arrival_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            
-            # req_format['Flight1_Departure_Time'] = req_format['Flight1_Departure_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            # req_format['Flight2_Departure_Time'] = req_format['Flight2_Departure_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            # req_format['Flight3_Departure_Time'] = req_format['Flight3_Departure_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            
-            # req_format['Flight1_Arrival_Time'] = req_format['Flight1_Arrival_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            # req_format['Flight2_Arrival_Time'] = req_format['Flight2_Arrival_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-            # req_format['Flight3_Arrival_Time'] = req_format['Flight3_Arrival_Time'].apply(lambda x: x.strftime('%H:%M:%S') if pd.notnull(x) else None)
-                    
-            # Print the DataFrame
-            request.session['new_flights_df'] = new_flights_df.to_json(orient='split')
-            request.session['ss_itin_df'] = ss_itin_df.to_json(orient='split')
-            request.session['ds_itin_df'] = ds_itin_df.to_json(orient='split')
-            request.session['req_format'] = req_format.to_json(orient='split')
-
-            return redirect('results_Itin')
+            request.session['itinerary_build_task'] = task.id
+            return render(request, 'pages/itinerarybuilder.html', {'build_task_id': task.id})
 
     else:
         turn_around_form = TurnAroundTimeForm()
         connection_time_form = ConnectionTimeForm()
         distance_ratio_form = DistanceConstraintForm()
+        stops_form = ItineraryStopsForm(initial={'max_stops': request.session.get('max_stops', 2),
+                                                 'max_elapsed_time': request.session.get('max_elapsed_time')})
 
     return render(request, 'pages/itinerarybuilder.html', {
         'turn_around_form': turn_around_form,
         'connection_time_form': connection_time_form,
         'distance_ratio_form' : distance_ratio_form,
+        'stops_form': stops_form,
     })
 
 
+def itinerary_build_status(request, task_id):
+    """Polled by the itinerary build page, returns the Celery job state and progress."""
+    if task_id != request.session.get('itinerary_build_task'):
+        return JsonResponse({'state': 'UNKNOWN', 'error': 'No such itinerary build.'}, status=404)
+
+    result = AsyncResult(task_id, app=build_itineraries.app)
+    response = {'state': result.state}
+    if result.state == 'PROGRESS':
+        response.update(result.info)
+    elif result.state == 'SUCCESS':
+        save_session_handles(request, 'itinerary_build_results', result.result)
+        response['redirect'] = reverse('results_Itin')
+    elif result.state == 'FAILURE':
+        logger.error(f"Itinerary build {task_id} failed: {result.info}")
+        response['error'] = 'Building the itineraries failed, please check the uploaded data and try again.'
+    return JsonResponse(response)
+
+
 def results_Itin(request):
-    new_flights_df = pd.read_json(request.session.get('new_flights_df', pd.DataFrame().to_json(orient='split')), orient='split') if 'new_flights_df' in request.session else None
-    
-    ss_itin_df = pd.read_json(request.session.get('ss_itin_df', pd.DataFrame().to_json(orient='split')), orient='split') if 'ss_itin_df' in request.session else None
-    ds_itin_df = pd.read_json(request.session.get('ds_itin_df', pd.DataFrame().to_json(orient='split')), orient='split') if 'ds_itin_df' in request.session else None
-    req_format = pd.read_json(request.session.get('req_format', pd.DataFrame().to_json(orient='split')), orient='split') if 'req_format' in request.session else None
+    results = load_build_results(request.session.get('itinerary_build_results'))
+    if results is None:
+        messages.error(request, "No itinerary results found, please build the itineraries again.")
+        return redirect('turn_around_and_connection_Itin')
+
+    new_flights_df = results['new_flights_df']
+    itin_dfs = results['itin_dfs']
+    ss_itin_df = itin_dfs[0]
+    ds_itin_df = itin_dfs[1] if len(itin_dfs) > 1 else pd.DataFrame()
+    req_format = results['req_format']
+    # Itineraries with three stops or more, shown after the double stop ones
+    more_stops = [{'title': f"{ReqFormatBuilder.ITINERARY_TYPES[stops + 1]} Results", 'table': itin_df.to_html(classes=["table", "table-striped"], index=False)}
+                  for stops, itin_df in enumerate(itin_dfs[2:], start=3) if not itin_df.empty]
     
     show_flights = new_flights_df is not None and not new_flights_df.empty
     show_ss_results = ss_itin_df is not None and not ss_itin_df.empty
@@ -649,7 +310,7 @@ def results_Itin(request):
 
     
     # After preparing all dataframes
-    excel_filename_1 = save_IB_dataframes_to_excel(new_flights_df, ss_itin_df, ds_itin_df)
+    excel_filename_1 = save_IB_dataframes_to_excel(new_flights_df, itin_dfs)
     excel_filename_2 = save_req_format_dataframe_to_excel(req_format)
 
     return render(request, 'pages/itinerarybuilder.html', {
@@ -659,6 +320,7 @@ def results_Itin(request):
         'show_flights': show_flights,
         'show_ss_results': show_ss_results,
         'show_ds_results': show_ds_results,
+        'more_stops': more_stops,
         'excel_file_url_1': excel_filename_1,
         'excel_file_url_2': excel_filename_2
     })
@@ -725,7 +387,7 @@ def download_airports_sample_excel(request):
     return response
 
 
-def save_IB_dataframes_to_excel(flights_df, ss_itin_df, ds_itin_df):
+def save_IB_dataframes_to_excel(flights_df, itin_dfs):
     filename = 'ItineraryBuilder All Results.xlsx'
     filepath = os.path.join(settings.MEDIA_ROOT, filename)
     
@@ -736,8 +398,8 @@ def save_IB_dataframes_to_excel(flights_df, ss_itin_df, ds_itin_df):
 
     with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
         flights_df.to_excel(writer, sheet_name='Non Stop Itineraries', index=False)
-        ss_itin_df.to_excel(writer, sheet_name='Single Stop Itineraries', index=False)
-        ds_itin_df.to_excel(writer, sheet_name='Double Stop Itineraries', index=False)
+        for stops, itin_df in enumerate(itin_dfs, start=1):
+            itin_df.to_excel(writer, sheet_name=f"{ReqFormatBuilder.ITINERARY_TYPES[stops + 1]} Itineraries", index=False)
     return filename
 
 def download_IB_results_excel(request):
@@ -774,7 +436,7 @@ def save_req_format_dataframe_to_excel(req_format):
        
         # change time columns 
         # Convert relevant columns to datetime and extract time part
-        time_columns = ['Itinerary_Departure_Time', 'Itinerary_Arrival_Time','Flight1_Departure_Time','Flight1_Arrival_Time','Flight2_Departure_Time','Flight2_Arrival_Time','Flight3_Departure_Time','Flight3_Arrival_Time']  # Add all relevant column names here
+        time_columns = [column for column in req_format.columns if column.endswith(('_Departure_Time', '_Arrival_Time'))]
         print('ki0',req_format['Itinerary_Departure_Time'])
         
         for column in time_columns:
@@ -792,9 +454,9 @@ def save_req_format_dataframe_to_excel(req_format):
         text_format = workbook.add_format({'num_format': '@', 'align': 'left'})
 
         # Apply the text format to the time columns
-        time_columns = ['E:E', 'G:G', 'L:L', 'N:N', 'Q:Q', 'S:S', 'V:V', 'X:X']
-        for col in time_columns:
-            worksheet.set_column(col, None, text_format)  # Apply text format to each specified column
+        for column in time_columns:
+            position = req_format.columns.get_loc(column)
+            worksheet.set_column(position, position, None, text_format)  # Apply text format to each time column
 
     
     return filename
@@ -6,7 +6,6 @@ from .utils import SyncReadExcel, Itin_ColumnIndex, DataEditing, ItineraryAnalyz
 import pandas as pd
 import json
 import pandas as pd
-from io import StringIO
 import pandas as pd
 from pyomo.util.infeasible import log_infeasible_constraints
 import pyomo.environ as pyo 
@@ -23,6 +22,7 @@ import traceback
 import os
 from django.http import FileResponse, HttpResponseNotFound, HttpResponse, HttpResponseServerError
 from django.http import JsonResponse
+from SkyLinker.artifacts import save_session_frame, load_session_frame, normalize_frame, redirect_when_expired
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
@@ -65,9 +65,7 @@ def use_historical_data(request):
                 historical_market_betas = My_Egyptian_market_betas_df
                 print(f'historical_market_betas: {historical_market_betas}')
                 
-                historical_market_betas_df_json = historical_market_betas.to_json(orient='split')
-                
-                request.session['historical_market_betas_df'] = historical_market_betas_df_json
+                save_session_frame(request, 'historical_market_betas_df', historical_market_betas)
                 return HttpResponseRedirect(reverse('upload_Itinerary_excel'))
 
         else:
@@ -93,13 +91,8 @@ def upload_historical_data_excel(request):
                 # Handle the error (e.g., display an error message to the user)
                 return render(request, 'pages/marketshare.html', {'hs_excel_form': form, 'hs_error_message': str(e)})
 
-            # Convert DataFrame to JSON for session storage
-            historical_Itineraries_df_json = read_excel.get_dataframe().to_json(orient='split')
-            historical_Itineraries_list = read_excel.get_data_list()
-
-            # Store in session
-            request.session['historical_Itineraries_df'] = historical_Itineraries_df_json
-            request.session['historical_Itineraries_list'] = historical_Itineraries_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'historical_Itineraries_df', normalize_frame(read_excel.get_dataframe()))
 
             return redirect('process_historical_data_columns')
     else:
@@ -107,14 +100,14 @@ def upload_historical_data_excel(request):
 
     return render(request, 'pages/marketshare.html', {'hs_excel_form': form})
 
+@redirect_when_expired('use_historical_data')
 def process_historical_data_columns(request):
     if 'historical_Itineraries_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_historical_data_excel')
 
     # Load DataFrame from session
-    historical_Itineraries_df_json = request.session.get('historical_Itineraries_df')
-    historical_Itineraries_df = pd.read_json(StringIO(historical_Itineraries_df_json), orient='split')
+    historical_Itineraries_df = load_session_frame(request, 'historical_Itineraries_df')
     
     # Initialize ColumnIndex with DataFrame
     column_index = Itin_ColumnIndex(historical_Itineraries_df)
@@ -169,8 +162,7 @@ def process_historical_data_columns(request):
         
 def calculate_betas(request):
     
-    historical_Itineraries_df_json = request.session.get('historical_Itineraries_df')
-    historical_Itineraries_df = pd.read_json(StringIO(historical_Itineraries_df_json), orient='split')
+    historical_Itineraries_df = load_session_frame(request, 'historical_Itineraries_df')
     # ****************** Find Itineraries columns **************** #
     
     column_indexes = json.loads(request.session.get('column_indexes', '{}'))
@@ -276,9 +268,7 @@ def calculate_betas(request):
     
     print(f'historical_market_betas: {historical_market_betas}')
     
-    historical_market_betas_df_json = historical_market_betas.to_json(orient='split')
-    
-    request.session['historical_market_betas_df'] = historical_market_betas_df_json 
+    save_session_frame(request, 'historical_market_betas_df', historical_market_betas)
         
 def upload_Itinerary_excel(request):
     if request.method == 'POST':
@@ -296,13 +286,8 @@ def upload_Itinerary_excel(request):
                 # Handle the error (e.g., display an error message to the user)
                 return render(request, 'pages/marketshare.html', {'i_excel_form': form, 'i_error_message': str(e)})
 
-            # Convert DataFrame to JSON for session storage
-            Itineraries_df_json = read_excel.get_dataframe().to_json(orient='split')
-            Itineraries_list = read_excel.get_data_list()
-
-            # Store in session
-            request.session['Itineraries_df'] = Itineraries_df_json
-            request.session['Itineraries_list'] = Itineraries_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'Itineraries_df', normalize_frame(read_excel.get_dataframe()))
 
             return redirect('process_Itinerary_columns')
     else:
@@ -310,14 +295,14 @@ def upload_Itinerary_excel(request):
 
     return render(request, 'pages/marketshare.html', {'i_excel_form': form})
 
+@redirect_when_expired('use_historical_data')
 def process_Itinerary_columns(request):
     if 'Itineraries_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_Itinerary_excel')
 
     # Load DataFrame from session
-    Itineraries_df_json = request.session.get('Itineraries_df')
-    Itineraries_df = pd.read_json(StringIO(Itineraries_df_json), orient='split')
+    Itineraries_df = load_session_frame(request, 'Itineraries_df')
     
     # Initialize ColumnIndex with DataFrame
     i_column_index = Itin_ColumnIndex(Itineraries_df)
@@ -370,10 +355,10 @@ def process_Itinerary_columns(request):
             # Proceed to turn-around and hub selection
             return redirect('calculate_probability')
        
+@redirect_when_expired('use_historical_data')
 def calculate_probability(request):
     
-    Itineraries_df_json = request.session.get('Itineraries_df')
-    Itineraries_df = pd.read_json(StringIO(Itineraries_df_json), orient='split')
+    Itineraries_df = load_session_frame(request, 'Itineraries_df')
     # ****************** Find Itineraries columns **************** #
     
     i_column_indexes = json.loads(request.session.get('i_column_indexes', '{}'))
@@ -493,8 +478,7 @@ def calculate_probability(request):
         'Long Distance':-0.137618 }
     My_Egyptian_market_betas_df = pd.DataFrame(My_Egyptian_market_betas, index=[0])
     
-    historical_market_betas_df_json = request.session.get('historical_market_betas_df')
-    historical_market_betas_df = pd.read_json(StringIO(historical_market_betas_df_json), orient='split')
+    historical_market_betas_df = load_session_frame(request, 'historical_market_betas_df')
     historical_market_betas = historical_market_betas_df.to_dict
 
     itineraries_df_for_demand_calc=propabilities_and_demand(Itineraries_df__edited,historical_market_betas,airline_name_col,origin_col,departure_col,arrival_col,destination_col)
@@ -504,15 +488,14 @@ def calculate_probability(request):
     QSI_df, HHI = itineraries_df_for_demand_calc.calculate_qsi_hhi()
     empty_unconstrained_demand = itineraries_df_for_demand_calc.empty_unconstrained_demand()
     
-    empty_unconstrained_demand_df_json = empty_unconstrained_demand.to_json(orient='split')
-    request.session['empty_unconstrained_demand_df'] = empty_unconstrained_demand_df_json
+    save_session_frame(request, 'empty_unconstrained_demand_df', empty_unconstrained_demand)
     
-    Itineraries_df__edited_json = Itineraries_df__edited.to_json(orient='split')
-    request.session['Itineraries_df__edited'] = Itineraries_df__edited_json 
+    save_session_frame(request, 'Itineraries_df__edited', Itineraries_df__edited)
     
     
     return redirect('upload_unconstrained_demand_excel')
 
+@redirect_when_expired('use_historical_data')
 def upload_unconstrained_demand_excel(request):
     if request.method == 'POST':
         form = ExcelUploadForm(request.POST, request.FILES)
@@ -529,13 +512,8 @@ def upload_unconstrained_demand_excel(request):
                 # Handle the error (e.g., display an error message to the user)
                 return render(request, 'pages/marketshare.html', {'d_excel_form': form, 'd_error_message': str(e)})
 
-            # Convert DataFrame to JSON for session storage
-            unconstrained_demand_df_json = read_excel.get_dataframe().to_json(orient='split')
-            unconstrained_demand_list = read_excel.get_data_list()
-
-            # Store in session
-            request.session['unconstrained_demand_df'] = unconstrained_demand_df_json
-            request.session['unconstrained_demand_list'] = unconstrained_demand_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'unconstrained_demand_df', normalize_frame(read_excel.get_dataframe()))
 
             return redirect('market_share_results')
     else:
@@ -544,9 +522,9 @@ def upload_unconstrained_demand_excel(request):
     return render(request, 'pages/marketshare.html', {'d_excel_form': form})
 
 
+@redirect_when_expired('use_historical_data')
 def market_share_results(request):
-    unconstrained_demand_df_json = request.session.get('unconstrained_demand_df')
-    unconstrained_demand_df = pd.read_json(StringIO(unconstrained_demand_df_json), orient='split')
+    unconstrained_demand_df = load_session_frame(request, 'unconstrained_demand_df')
     
     i_column_indexes = json.loads(request.session.get('i_column_indexes', '{}'))
     airline_name_col = i_column_indexes.get('Airline')
@@ -555,11 +533,9 @@ def market_share_results(request):
     destination_col = i_column_indexes.get('destination')
     arrival_col = i_column_indexes.get('arrival')
     
-    Itineraries_df__edited_json = request.session.get('Itineraries_df__edited')
-    Itineraries_df__edited = pd.read_json(StringIO(Itineraries_df__edited_json), orient='split')
+    Itineraries_df__edited = load_session_frame(request, 'Itineraries_df__edited')
     
-    historical_market_betas_df_json = request.session.get('historical_market_betas_df')
-    historical_market_betas_df = pd.read_json(StringIO(historical_market_betas_df_json), orient='split')
+    historical_market_betas_df = load_session_frame(request, 'historical_market_betas_df')
     
     
     historical_market_betas = historical_market_betas_df.to_dict
@@ -573,11 +549,9 @@ def market_share_results(request):
     QSI_df, HHI = itineraries_df_for_demand_calc.calculate_qsi_hhi()
     itineraries_df_for_demand_calc.demand_calculation(unconstrained_demand_df)
     
-    QSI_df_json = QSI_df.to_json(orient='split')
-    request.session['QSI_df'] = QSI_df_json
+    save_session_frame(request, 'QSI_df', QSI_df)
     
-    HHI_json = HHI.to_json(orient='split')
-    request.session['HHI'] = HHI_json
+    save_session_frame(request, 'HHI', HHI)
     
     Itineraries_Demand_DF = itineraries_df_for_demand_calc.get_demand_dataframe()
     
@@ -594,8 +568,7 @@ def market_share_results(request):
     transposed_historical_market_betas_df = historical_market_betas_df.T.reset_index()
     transposed_historical_market_betas_df.columns = ['Regression Coefficient (Beta)', 'Value']
     
-    Itineraries_df_json = request.session.get('Itineraries_df')
-    Itineraries_df = pd.read_json(StringIO(Itineraries_df_json), orient='split')
+    Itineraries_df = load_session_frame(request, 'Itineraries_df')
     
     i_column_indexes = json.loads(request.session.get('i_column_indexes', '{}'))
     airline_name_col = i_column_indexes.get('Airline')
@@ -670,11 +643,11 @@ def market_share_results(request):
 
 
 
+@redirect_when_expired('use_historical_data')
 def recommendations(request):
     
        
-    Itineraries_df_json = request.session.get('Itineraries_df')
-    Itineraries_df = pd.read_json(StringIO(Itineraries_df_json), orient='split')
+    Itineraries_df = load_session_frame(request, 'Itineraries_df')
     # ****************** Find Itineraries columns **************** #
     i_column_indexes = json.loads(request.session.get('i_column_indexes', '{}'))
     airline_name_col = i_column_indexes.get('Airline')
@@ -755,8 +728,8 @@ def recommendations(request):
     itinerary_types_count = itineraries_df_edited.groupby([itineraries_df_edited['Market'], itineraries_df_edited.columns[type_col]]).size().unstack(fill_value=0)
 
     # Load QSI and HHI data from session
-    QSI_df = pd.read_json(StringIO(request.session.get('QSI_df')), orient='split')
-    HHI_df = pd.read_json(StringIO(request.session.get('HHI')), orient='split')
+    QSI_df = load_session_frame(request, 'QSI_df')
+    HHI_df = load_session_frame(request, 'HHI')
 
     # Prepare data for Google Charts
     google_chart_data = prepare_chart_data(market_time_slot_counts, QSI_df, HHI_df, itinerary_types_count, itineraries_df_edited)
@@ -860,17 +833,17 @@ def analyze_market(HHI_df, market, time_slot_data, total_count, itinerary_type_d
     
     
 
+@redirect_when_expired('use_historical_data')
 def preview_unconstrained_demand(request):
     """View to handle AJAX request for previewing the flights sample on a webpage."""
-    empty_unconstrained_demand_df_json = request.session.get('empty_unconstrained_demand_df')
-    empty_unconstrained_demand_df = pd.read_json(StringIO(empty_unconstrained_demand_df_json), orient='split')
+    empty_unconstrained_demand_df = load_session_frame(request, 'empty_unconstrained_demand_df')
     html_table = empty_unconstrained_demand_df.to_html(classes=["table", "table-striped"], index=False)
     return JsonResponse({'html_table': html_table})
     
+@redirect_when_expired('use_historical_data')
 def download_unconstrained_demand_excel(request):
     # Define a DataFrame with the necessary columns
-    empty_unconstrained_demand_df_json = request.session.get('empty_unconstrained_demand_df')
-    empty_unconstrained_demand_df = pd.read_json(StringIO(empty_unconstrained_demand_df_json), orient='split')
+    empty_unconstrained_demand_df = load_session_frame(request, 'empty_unconstrained_demand_df')
     
     # Define the Excel response
     response = HttpResponse(
@@ -1,5 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from SkyLinker.solvers import SOLVER_CHOICES, SolverConfig
 
 
 class ExcelUploadForm(forms.Form):
@@ -65,4 +66,36 @@ class FpdForm(forms.Form):
     
 class CycleAndAircraftForm(forms.Form):
     days_in_cycle = forms.IntegerField(label='Number of Days in Cycle', min_value=1)
-    number_of_aircrafts = forms.IntegerField(label='Number of Available Aircrafts in Your Fleet', min_value=1)
\ No newline at end of file
+    number_of_aircrafts = forms.IntegerField(label='Number of Available Aircrafts in Your Fleet', min_value=1)
+
+
+class RoutingSolverForm(forms.Form):
+    """MIP solver settings of the routing model, kept apart from the fleet assignment ones."""
+    mip_solver = forms.ChoiceField(choices=SOLVER_CHOICES, initial='glpk', label='MIP Solver')
+    threads = forms.IntegerField(label='Threads', help_text='Leave empty to let the solver decide.', min_value=1, required=False)
+    time_limit = forms.FloatField(label='Time Limit (seconds)', help_text='Leave empty to solve without a wall-clock limit.', min_value=1, required=False)
+    mip_gap = forms.FloatField(
+        label='Relative MIP Gap Percentage',
+        help_text='Stop once the best solution is within this percentage of the optimum. Leave empty for the solver default.',
+        min_value=0,
+        max_value=100,
+        required=False,
+        widget=forms.NumberInput(attrs={'step': '0.01'})
+    )
+    return_incumbent = forms.BooleanField(label='Return the best solution found when the time limit is reached', initial=True, required=False)
+
+    def clean_mip_solver(self):
+        mip_solver = self.cleaned_data['mip_solver']
+        if not SolverConfig.is_available(mip_solver):
+            raise ValidationError(f"{dict(SOLVER_CHOICES)[mip_solver]} is not installed on this server.")
+        return mip_solver
+
+    def get_solver_config(self):
+        mip_gap = self.cleaned_data['mip_gap']
+        return SolverConfig(
+            solver=self.cleaned_data['mip_solver'],
+            threads=self.cleaned_data['threads'],
+            time_limit=self.cleaned_data['time_limit'],
+            mip_gap=mip_gap / 100 if mip_gap is not None else None,
+            return_incumbent=self.cleaned_data['return_incumbent'],
+        )
@@ -1,3 +1,99 @@
-from django.test import TestCase
+import itertools
+import random
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from .utils import CombinationsGenerator, FlightChains, ScheduleCache, process_combos
 
 # Create your tests here.
+
+TAT = 45
+ORIGIN_COLUMN = 1
+DESTINATION_COLUMN = 3
+
+
+def random_flight_table(flights_number, stations, seed):
+    """Rows [flight number, origin, departure, destination, arrival, duration] with their departure and arrival minutes."""
+    rng = random.Random(seed)
+    rows, departure, arrival = [], [], []
+    for k in range(flights_number):
+        origin, destination = rng.sample(stations, 2)
+        start = rng.randrange(300, 1320, 5)
+        duration = rng.randrange(45, 240, 5)
+        rows.append([100 + k, origin, f"{start // 60:02d}:{start % 60:02d}", destination,
+                     f"{(start + duration) // 60:02d}:{(start + duration) % 60:02d}", duration / 60])
+        departure.append(start)
+        arrival.append(start + duration)
+    return rows, departure, arrival
+
+
+def reference_routes(rows, departure, arrival, fpd, days_no, hubs):
+    """Every route of every flights-per-day combo, found by trying all chains of all days and keeping the closed ones."""
+    def chains(length):
+        for chain in itertools.permutations(range(len(rows)), length):
+            if all(rows[i][DESTINATION_COLUMN] == rows[j][ORIGIN_COLUMN] and departure[j] - arrival[i] >= TAT
+                   for i, j in zip(chain, chain[1:])):
+                yield chain
+
+    longest = max((length for length in range(1, fpd + 1) if next(chains(length), None)), default=1)
+    routes = []
+    for combo in itertools.product(range(1, longest + 1), repeat=days_no):
+        for day_chains in itertools.product(*[list(chains(fpd_of_day)) for fpd_of_day in combo]):
+            stations = [(rows[chain[0]][ORIGIN_COLUMN], rows[chain[-1]][DESTINATION_COLUMN]) for chain in day_chains]
+            if any(stations[d][1] != stations[(d + 1) % days_no][0] for d in range(days_no)):
+                continue
+            end_stations = [end for _, end in stations]
+            for hub in hubs:
+                if hub in end_stations:
+                    flights = tuple(tuple(rows[i]) for chain in day_chains for i in chain)
+                    routes.append((combo, flights, end_stations.count(hub)))
+    return routes
+
+
+class ProcessCombosTests(SimpleTestCase):
+
+    def run_process_combos(self, rows, departure, arrival, fpd, days_no, hubs):
+        schedule_cache = ScheduleCache(rows, departure, arrival, TAT, ORIGIN_COLUMN, DESTINATION_COLUMN)
+        combos = CombinationsGenerator(fpd, days_no, schedule_cache.get_flight_chains())
+        return process_combos(combos, rows, departure, arrival, TAT, ORIGIN_COLUMN, DESTINATION_COLUMN, hubs, days_no, fpd,
+                              schedule_cache=schedule_cache)
+
+    def test_routes_match_reference_enumeration(self):
+        for seed in range(12):
+            rows, departure, arrival = random_flight_table(7, ['AAA', 'BBB', 'CCC'], seed)
+            for fpd, days_no in ((2, 2), (3, 2), (2, 3)):
+                with self.subTest(seed=seed, fpd=fpd, days_no=days_no):
+                    valid_combos, all_options_lists, total, m, _ = self.run_process_combos(
+                        rows, departure, arrival, fpd, days_no, ['AAA', 'BBB'])
+                    routes = [(tuple(combo), tuple(tuple(row) for row in options), hub_days)
+                              for combo, options, hub_days in zip(valid_combos, all_options_lists, m)]
+
+                    self.assertEqual(total, len(routes))
+                    self.assertEqual(Counter(routes), Counter(reference_routes(rows, departure, arrival, fpd, days_no, ['AAA', 'BBB'])))
+
+    def test_coverage_matches_routes(self):
+        for seed in range(12):
+            rows, departure, arrival = random_flight_table(8, ['AAA', 'BBB', 'CCC'], seed)
+            valid_combos, all_options_lists, total, _, coverage = self.run_process_combos(rows, departure, arrival, 3, 3, ['AAA'])
+
+            expected = {}
+            for route_id, (combo, options) in enumerate(zip(valid_combos, all_options_lists)):
+                self.assertEqual(sum(combo), len(options))
+                first = 0
+                for day, flights_number in enumerate(combo, start=1):
+                    for row in options[first:first + flights_number]:
+                        expected.setdefault((day, row[0]), []).append(route_id)
+                    first += flights_number
+            self.assertEqual(coverage.routes, expected)
+            self.assertEqual(len(coverage.get_rows()), len(expected))
+
+    def test_combos_stop_at_longest_chain(self):
+        rows, departure, arrival = random_flight_table(6, ['AAA', 'BBB', 'CCC', 'DDD'], 3)
+        flight_chains = FlightChains(rows, departure, arrival, TAT, ORIGIN_COLUMN, DESTINATION_COLUMN)
+        longest = flight_chains.get_longest_chain_length(5)
+
+        combos = CombinationsGenerator(5, 3, flight_chains).get_combos()
+        self.assertEqual(max(max(combo) for combo in combos), longest)
+        rotated = {tuple(rotation) for combo in combos for _, rotation in CombinationsGenerator.rotations(combo)}
+        self.assertEqual(rotated, set(itertools.product(range(1, longest + 1), repeat=3)))
@@ -1,14 +1,14 @@
 import pandas as pd
 import re
+import bisect
 from io import BytesIO
 import io
 from datetime import datetime, timedelta
 import pandas as pd
 from pyomo.util.infeasible import log_infeasible_constraints
-import itertools
 import pyomo.environ as pyo 
 from pyomo.environ import *
-from pyomo.opt import SolverFactory
+from SkyLinker.solvers import SolverConfig
 
 class SyncReadExcel:
     def __init__(self, file_content=None, dtype=str, file_name=None):
@@ -239,27 +239,59 @@ class MaxFpd:
     #################################################################################################
     
 class CombinationsGenerator:
-    def __init__(self, user_decided_fpd, days_in_cycle):
+    def __init__(self, user_decided_fpd, days_in_cycle, flight_chains=None):
+        """
+        Streams the flights-per-day patterns of a routing cycle.
+
+        A pattern and its cyclic rotations describe the same routes started on another day, so only the
+        lexicographically smallest rotation of each pattern is yielded, and process_combos rotates the routes
+        it finds back out. Patterns are generated one at a time (FKM necklace order) instead of as a list.
+
+        Parameters:
+        - user_decided_fpd: Integer, the most flights per day of a pattern.
+        - days_in_cycle: Integer, days of the routing cycle.
+        - flight_chains: FlightChains of the day, when given the patterns stop at the longest chain it has,
+          as a day can not fly more flights than that.
+        """
         self.user_decided_fpd = user_decided_fpd
         self.days_in_cycle = days_in_cycle
         self.max_fpd = self.user_decided_fpd
+        if flight_chains is not None:
+            self.max_fpd = flight_chains.get_longest_chain_length(self.max_fpd)
         self.digits = list(range(1, self.max_fpd + 1))
-        self.combos = self.generate_combinations()
-
-    def generate_combinations(self):
-        def generate_combinations_recursive(curr_combo, depth):
-            if depth == 0:
-                return [curr_combo.copy()]
-            combos = []
-            for digit in self.digits:
-                curr_combo.append(digit)
-                combos.extend(generate_combinations_recursive(curr_combo, depth - 1))
-                curr_combo.pop()
-            return combos
-        return generate_combinations_recursive([], self.days_in_cycle)
+
+    def __iter__(self):
+        n, k = self.days_in_cycle, len(self.digits)
+        if n < 1 or k < 1:
+            return
+        pattern = [0] * (n + 1)
+
+        def necklaces(t, p):
+            if t > n:
+                if n % p == 0:
+                    yield [self.digits[digit] for digit in pattern[1:]]
+                return
+            pattern[t] = pattern[t - p]
+            yield from necklaces(t + 1, p)
+            for digit in range(pattern[t - p] + 1, k):
+                pattern[t] = digit
+                yield from necklaces(t + 1, t)
+
+        yield from necklaces(1, 1)
 
     def get_combos(self):
-        return self.combos
+        return list(self)
+
+    @staticmethod
+    def rotations(combo):
+        """Returns the distinct rotations of combo as (shift, rotated combo) pairs, combo itself first."""
+        rotations = []
+        for shift in range(len(combo)):
+            rotated = list(combo[shift:]) + list(combo[:shift])
+            if rotated == list(combo) and shift:
+                break
+            rotations.append((shift, rotated))
+        return rotations
     
 ################################################################################
 
@@ -275,10 +307,79 @@ class FlightPerDay:
 ################################################################################
 
 
+class FlightChains:
+    def __init__(self, one_day_flights, departure, arrival, TAT, origin_col, destination_col):
+        """
+        Links every flight of the day to the flights that can follow it and enumerates chains of them.
+
+        The successors are found once per flight by a binary search over the departures of its
+        destination, sorted per station, so a chain of any length is only extended along real
+        links instead of pairing every flight with every other flight again.
+
+        Parameters:
+        - one_day_flights: List of flight details for one day.
+        - departure: List of departure times for each flight.
+        - arrival: List of arrival times for each flight.
+        - TAT: Integer, minimum turn-around time required between flights.
+        - origin_col: Integer, column index for the flight's origin.
+        - destination_col: Integer, column index for the flight's destination.
+        """
+        self.one_day_flights = one_day_flights
+        self.origins = [flight[origin_col] for flight in one_day_flights]
+        self.destinations = [flight[destination_col] for flight in one_day_flights]
+
+        departures_by_station = {}
+        for j, station in enumerate(self.origins):
+            departures_by_station.setdefault(station, []).append((departure[j], j))
+        for departures in departures_by_station.values():
+            departures.sort()
+
+        departure_times = {station: [time for time, _ in departures] for station, departures in departures_by_station.items()}
+
+        self.successors = []
+        for i, station in enumerate(self.destinations):
+            departures = departures_by_station.get(station, [])
+            first = bisect.bisect_left(departure_times.get(station, []), arrival[i] + TAT)
+            # Kept in flight order, the order the pairwise scan used to produce
+            self.successors.append(tuple(sorted(j for _, j in departures[first:])))
+
+        self.chains = {1: [(i,) for i in range(len(one_day_flights))]}
+
+    def get_successors(self):
+        return self.successors
+
+    def get_chains(self, length):
+        """
+        Returns the chains of length flights as tuples of flight indexes, extending the chains one
+        flight shorter (which are kept) by the successors of their last flight.
+        """
+        if length < 1:
+            return []
+        for n in range(max(self.chains) + 1, length + 1):
+            self.chains[n] = [chain + (j,) for chain in self.chains[n - 1] for j in self.successors[chain[-1]]]
+        return self.chains[length]
+
+    def get_longest_chain_length(self, fpd):
+        """Returns the largest number of flights up to fpd that at least one chain reaches (1 at least)."""
+        while fpd > 1 and not self.get_chains(fpd):
+            fpd -= 1
+        return fpd
+
+    def get_start_station(self, chain):
+        return self.origins[chain[0]]
+
+    def get_end_station(self, chain):
+        return self.destinations[chain[-1]]
+
+    def get_rows(self, chain):
+        return [self.one_day_flights[i] for i in chain]
+
+
 class FpdSchedule:
-    def __init__(self, one_day_flights, fpd, departure, arrival, TAT, origin_col, destination_col):
+    def __init__(self, one_day_flights, fpd, departure, arrival, TAT, origin_col, destination_col, flight_chains=None):
         """
         Initializes the FpdSchedule object with flight details and scheduling constraints.
+        When no chain of fpd flights exists the schedule falls back to the longest chain length that does.
         
         Parameters:
         - one_day_flights: List of flight details for one day.
@@ -288,139 +389,192 @@ class FpdSchedule:
         - TAT: Integer, minimum turn-around time required between flights.
         - origin_col: Integer, column index for the flight's origin.
         - destination_col: Integer, column index for the flight's destination.
+        - flight_chains: FlightChains of the same flights and TAT to reuse, built here when omitted.
         """
-        self.__One_Day_Flights = one_day_flights
-        self.__fpd = fpd
-        self.__departure = departure
-        self.__arrival = arrival
-        self.__TAT = TAT
-        self.__origin_col = origin_col
-        self.__destination_col = destination_col
-        self.__schedules = []
-        
-        while self.__schedules == []:
-            
-            if self.__fpd == 1:
-                self.__schedules = self.__One_Day_Flights
-                
-            elif self.__fpd > 1:
-                
-                for n in range(1, self.__fpd):
-                    current_schedule = [] 
-                    
-                    if self.__schedules == []:
-                        
-                        for i in range(len(self.__One_Day_Flights)):
-                            prev_flight = self.__One_Day_Flights[i]
-
-                            for j in range(len(self.__One_Day_Flights)):
-                                current_flight = self.__One_Day_Flights[j]
-
-                                if prev_flight[self.__destination_col] == current_flight[self.__origin_col]:
-                                    if self.__departure[j] - self.__arrival[i] >= self.__TAT:
-                                        current_schedule.append(prev_flight)
-                                        current_schedule.append(current_flight)
-                                        
-                        self.__schedules = current_schedule
-                    
-                    else:
-                        n_arriv = []
-                        for m in range(n-1, len(self.__schedules), n):
-                            prev_flight = self.__schedules[m]
-                            for i in range(len(self.__One_Day_Flights)):
-                                if self.__schedules[m] == self.__One_Day_Flights[i]:
-                                    n_arriv = self.__arrival[i]
-                                
-                            for j in range(len(self.__One_Day_Flights)):
-                                current_flight = self.__One_Day_Flights[j]
-
-                                if prev_flight[self.__destination_col] == current_flight[self.__origin_col]:
-                                    if self.__departure[j] - n_arriv >= self.__TAT:
-                                        current_schedule.extend(self.__schedules[m - n + 1 : m + 1])
-                                        current_schedule.append(current_flight)
-                        self.__schedules = current_schedule
-                    # Append the current schedule to self.__schedules
-                    
-                    if not self.__schedules:
-                        self.__fpd -= 1  # Decrease fpd by 1
-                        self.__is_empty = True
-                        break  # Break out of the loop as a non-empty schedule is obtained
-            
+        if flight_chains is None:
+            flight_chains = FlightChains(one_day_flights, departure, arrival, TAT, origin_col, destination_col)
+        self.__flight_chains = flight_chains
+        self.__fpd = flight_chains.get_longest_chain_length(fpd)
+        self.__chains = flight_chains.get_chains(self.__fpd)
 
-    def get_schedule(self):
-        return self.__schedules
-            
-    def get_schedule_rows(self):
-        return len(self.__schedules)
-    
-    def get_schedule_columns(self):
-        return len(self.__schedules[0])
-    
+    def get_chains(self):
+        """Returns the chains as tuples of indexes into one_day_flights."""
+        return self.__chains
+
+    def get_fpd(self):
+        """Returns the number of flights of every chain."""
+        return self.__fpd
+
+    def get_flight_chains(self):
+        return self.__flight_chains
+
+
+##################################################################
+
+class ScheduleCache:
+    """
+    Daily schedules of one routing run, keyed by flights per day.
+
+    A schedule only depends on the flights per day once the flight table and TAT are fixed, so every combo
+    of the run reuses the schedules, and the FlightChains under them, built the first time. The cache lives
+    as long as the run that creates it and is passed along, so nothing is kept between requests.
+    """
+
+    def __init__(self, one_day_flights, departure, arrival, TAT, origin_col, destination_col):
+        """
+        Parameters:
+        - one_day_flights: List of flight details for one day.
+        - departure: List of departure times for each flight.
+        - arrival: List of arrival times for each flight.
+        - TAT: Integer, minimum turn-around time required between flights.
+        - origin_col: Integer, column index for the flight's origin.
+        - destination_col: Integer, column index for the flight's destination.
+        """
+        self.one_day_flights = one_day_flights
+        self.departure = departure
+        self.arrival = arrival
+        self.TAT = TAT
+        self.origin_col = origin_col
+        self.destination_col = destination_col
+        self.flight_chains = FlightChains(one_day_flights, departure, arrival, TAT, origin_col, destination_col)
+        self.schedules = {}  # fpd -> FpdSchedule
+        self.builds = 0
+
+    def get_flight_chains(self):
+        return self.flight_chains
+
+    def get_schedule(self, fpd):
+        """Returns the FpdSchedule of fpd, built on the first call."""
+        if fpd not in self.schedules:
+            self.schedules[fpd] = FpdSchedule(self.one_day_flights, fpd, self.departure, self.arrival, self.TAT,
+                                              self.origin_col, self.destination_col, flight_chains=self.flight_chains)
+            self.builds += 1
+        return self.schedules[fpd]
 
 ##################################################################
 
-def process_combos(combos, one_day_flights, departure, arrival, TAT, origin_col, destination_col, hubs, days_no, fpd):
+def closed_chain_cycles(day_chains, flight_chains):
+    """
+    Yields the routes of a cycle as tuples of one chain index per day, in the order of the index tuples.
+
+    The days are layers of a graph whose edges link a chain to the chains of the next day starting where
+    it ends, and the last day links back to the station the route started from. For every start station
+    a backward pass over the layers marks the stations from which the cycle can still close on each day,
+    so the depth-first search only follows edges that end in a route.
+
+    Parameters:
+    - day_chains: list with the chains (tuples of flight indexes) of every day of the cycle.
+    - flight_chains: FlightChains the chains come from.
+    """
+    days_no = len(day_chains)
+    starting = []  # per day, start station -> indexes of the chains starting there, in order
+    ends = []  # per day, end station of every chain
+    for chains in day_chains:
+        by_station = {}
+        for index, chain in enumerate(chains):
+            by_station.setdefault(flight_chains.get_start_station(chain), []).append(index)
+        starting.append(by_station)
+        ends.append([flight_chains.get_end_station(chain) for chain in chains])
+
+    closing = {}
+
+    def closing_stations(start_station):
+        # reach[d]: end stations of day d - 1 from which the remaining days can still return to start_station
+        if start_station not in closing:
+            reach = [None] * (days_no + 1)
+            reach[days_no] = {start_station}
+            for d in range(days_no - 1, 0, -1):
+                reach[d] = {station for station, indexes in starting[d].items()
+                            if any(ends[d][index] in reach[d + 1] for index in indexes)}
+            closing[start_station] = reach
+        return closing[start_station]
+
+    def extend(route, reach):
+        d = len(route)
+        if d == days_no:
+            yield tuple(route)
+            return
+        for index in starting[d].get(ends[d - 1][route[-1]], []):
+            if ends[d][index] in reach[d + 1]:
+                route.append(index)
+                yield from extend(route, reach)
+                route.pop()
+
+    for first, chain in enumerate(day_chains[0] if days_no else []):
+        reach = closing_stations(flight_chains.get_start_station(chain))
+        if ends[0][first] in reach[1]:
+            yield from extend([first], reach)
+
+##################################################################
+
+class RouteCoverage:
+    """(day, flight number) -> ids of the routes flying that flight on that day, filled while the routes are generated."""
+
+    def __init__(self):
+        self.routes = {}
+
+    def add_route(self, route_id, days_flights):
+        """
+        Parameters:
+        - route_id: Integer, index of the route in all_options_lists.
+        - days_flights: list with the flight rows of every day of the route, the flight number first.
+        """
+        for day, flights in enumerate(days_flights, start=1):
+            for flight in flights:
+                self.routes.setdefault((day, flight[0]), []).append(route_id)
+
+    def get_rows(self):
+        """Returns the route ids of every (day, flight number), one coverage constraint each."""
+        return list(self.routes.values())
+
+    def __len__(self):
+        return len(self.routes)
+
+##################################################################
+
+def process_combos(combos, one_day_flights, departure, arrival, TAT, origin_col, destination_col, hubs, days_no, fpd, schedule_cache=None):
+    """
+    Finds the routes of every combo, combos being one rotation per pattern as CombinationsGenerator yields them;
+    the routes of the other rotations are added as rotated copies.
+
+    Parameters:
+    - schedule_cache: ScheduleCache of the same flights and TAT shared with the caller, built here when omitted.
+
+    Returns:
+    - valid_combos, all_options_lists, m: combo, flight rows and hub days of every route.
+    - total: Integer, number of routes.
+    - coverage: RouteCoverage of the routes, the rows of the coverage constraints.
+    """
     total = 0
     valid_combos = []
     all_options_lists = []
     m = []
+    coverage = RouteCoverage()
+    if schedule_cache is None:
+        schedule_cache = ScheduleCache(one_day_flights, departure, arrival, TAT, origin_col, destination_col)
 
     for combo in combos:
-        Schedule = []
-        schedule_columns = []
-        schedule_rows = []
-        rows_tot = 0
-        Routes = []
-
         # Generating Routes Starts here
-        for day in range(1, days_no + 1):
-            fpd_instance = FlightPerDay(combo[day - 1])
-            fpd = fpd_instance.get_fpd()
-            Schedule_instance = FpdSchedule(one_day_flights=one_day_flights, fpd=fpd, departure=departure, arrival=arrival, TAT=TAT, origin_col=origin_col, destination_col=destination_col)
-            Schedule.append(Schedule_instance.get_schedule())
-            schedule_columns.append(Schedule_instance.get_schedule_columns())
-            schedule_rows.append(Schedule_instance.get_schedule_rows())
-            rows_tot += Schedule_instance.get_schedule_rows()
-
-            #print(f"Day {day} Schedule: {Schedule[-1]}")
-
-        # Create a list to hold the indices of the loops for each day
-        loop_indices = [range(0 + combo[d] - 1, schedule_rows[d], combo[d]) for d in range(days_no)]
-        #print(f"Loop Indices for combo {combo}: {loop_indices}")
-
-        # Use itertools.product to create all combinations of loop indices
-        for indices in itertools.product(*loop_indices):
-            valid_combo = True
-            #print(f"Checking combination: {indices}")
-
-            for d in range(days_no):
-                next_day_indices = [(indices[i] - combo[i] + 1) % schedule_rows[i] for i in range(days_no)]
-                current_dest = Schedule[d][indices[d]][destination_col]
-                next_origin = Schedule[(d + 1) % days_no][next_day_indices[(d + 1) % days_no]][origin_col]
-                #print(f"Day {d+1} transition: current dest {current_dest} to next day origin {next_origin}")
-
-                if current_dest != next_origin:
-                    valid_combo = False
-                    #print(f"Invalid transition from day {d+1} to day {(d+2) % days_no}")
-                    break
-
-            if valid_combo:
-                #print(f"Valid combo found: {combo} with indices {indices}")
-                for hub in hubs:
-                    if any(Schedule[d][indices[d]][destination_col] == hub for d in range(days_no)):
-                        valid_combos.append(combo)
-                        for d in range(days_no):
-                            for idx in range(indices[d] - combo[d] + 1, indices[d] + 1):
-                                Routes.append(Schedule[d][idx])
-
-                        m.append(sum(1 for d in range(days_no) if Schedule[d][indices[d]][destination_col] == hub))
-
-        options_length = int(len(Routes) / sum(combo))
-        total += options_length
-
-        if options_length != 0:
-            sublists = [Routes[i:i + int(len(Routes) / options_length)] for i in range(0, len(Routes), int(len(Routes) / options_length))]
-            all_options_lists.extend(sublists)
+        day_schedules = [schedule_cache.get_schedule(FlightPerDay(combo[d]).get_fpd()) for d in range(days_no)]
+        day_chains = [schedule.get_chains() for schedule in day_schedules]
+        flight_chains = day_schedules[0].get_flight_chains()
+
+        for indices in closed_chain_cycles(day_chains, flight_chains):
+            chains = [day_chains[d][indices[d]] for d in range(days_no)]
+            end_stations = [flight_chains.get_end_station(chain) for chain in chains]
+
+            for hub in hubs:
+                if hub in end_stations:
+                    days_flights = [flight_chains.get_rows(chain) for chain in chains]
+                    hub_days = end_stations.count(hub)
+                    # The same route started on each later day of the cycle is the route of a rotated combo
+                    for shift, rotated_combo in CombinationsGenerator.rotations(combo):
+                        rotated_days_flights = days_flights[shift:] + days_flights[:shift]
+                        coverage.add_route(total, rotated_days_flights)
+                        valid_combos.append(rotated_combo)
+                        all_options_lists.append([row for flights in rotated_days_flights for row in flights])
+                        m.append(hub_days)
+                        total += 1
 
     # print(f"\n\n combos {combos} \n\n")
     # print(f"\n\n one_day_flights {one_day_flights} \n\n")
@@ -436,39 +590,8 @@ def process_combos(combos, one_day_flights, departure, arrival, TAT, origin_col,
     # print(f"\n\n Valid Combos {valid_combos} \n\n")
     # print(f"\n\n m {m} \n\n")
     # print(f"\n\n all_options_lists {all_options_lists} \n\n")
-            
-    data = []
-
-    for flight in one_day_flights:
-            for days in range(len(combo)):
-                b = 0
-                for option, combo in zip(all_options_lists, valid_combos):
-                    c = 0
-                    if days == 0:
-                        for a in range(0, combo[days]):
-                            if flight[0] == option[a][0]:
-                                data.append({
-                                    'Day': days + 1,
-                                    'Route': b,
-                                    'Flight Number': flight[0],
-                                    'X': b
-                                })
-                    else:
-                        c += sum(combo[0:days])
-                        for a in range(c, c + combo[days]):
-                            if flight[0] == option[a][0]:
-                                data.append({
-                                    'Day': days + 1,
-                                    'Route': b,
-                                    'Flight Number': flight[0],
-                                    'X': b
-                                })
-                    b += 1
-                        
-    # Create a DataFrame from the data
-    
-    
-    return valid_combos, all_options_lists, total, m, data
+
+    return valid_combos, all_options_lists, total, m, coverage
 
 
 ######################################################################################
@@ -534,7 +657,7 @@ def analyze_flight_schedule(flights_df, TAT_minutes, flight_number_index, origin
 
     return suggestions
 
-def optimization(flights_df, TAT_minutes, all_options_lists, m, data, valid_combos, number_of_aircrafts, flight_number_index, origin_index, departure_index, arrival_index, destination_index, flight_duration_index):
+def optimization(flights_df, TAT_minutes, all_options_lists, m, coverage, valid_combos, number_of_aircrafts, flight_number_index, origin_index, departure_index, arrival_index, destination_index, flight_duration_index, solver_config=None):
 
     # Integration of Part 3 starts here
     model = pyo.ConcreteModel()
@@ -546,32 +669,27 @@ def optimization(flights_df, TAT_minutes, all_options_lists, m, data, valid_comb
         # Assuming m is defined and accessible. If not, you need to define or calculate it before this point.
         model.obj = pyo.Objective(expr=sum(m[i] * x[i] for i in range(len(all_options_lists))), sense=maximize)
         
+        # Every flight is flown once a day, by one of the routes the coverage index lists for it
         model.C1 = pyo.ConstraintList()
-        x_values_by_key = {}
-        for item in data:
-            day_flight_key = (item['Day'], item['Flight Number'])
-            if day_flight_key in x_values_by_key:
-                x_values_by_key[day_flight_key].append(item['X'])
-            else:
-                x_values_by_key[day_flight_key] = [item['X']]
-
-        for key, x_values in x_values_by_key.items():
-            model.C1.add(expr=sum(x[index] for index in x_values) == 1)
+        for route_ids in coverage.get_rows():
+            model.C1.add(expr=sum(x[index] for index in route_ids) == 1)
         
         ac_availabe = number_of_aircrafts
         model.C2 = pyo.Constraint(expr=sum(x[i] for i in range(len(all_options_lists))) <= ac_availabe)
         
-        opt = SolverFactory('glpk')
-        results = opt.solve(model)
+        if solver_config is None:
+            solver_config = SolverConfig('glpk')
+        results = solver_config.solve(model)
         
         # Check if the solution is feasible
-        if results.solver.status == SolverStatus.ok and results.solver.termination_condition == TerminationCondition.optimal:
+        if solver_config.is_solved(results):
             # Initialize the list for optimized data
             optimized_data = []
+            x_values = x.extract_values()
 
             for i, (option, combo) in enumerate(zip(all_options_lists, valid_combos)):
                 current_index = 0
-                if pyo.value(x[i]) == 1:
+                if round(x_values[i]) == 1:
                     for day_index, day_value in enumerate(combo, start=1):
                         flights_data = []
                         for _ in range(day_value):
@@ -1,12 +1,11 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
-from .forms import FpdForm, ExcelUploadForm, create_column_index_form, TurnAroundTimeForm, create_hub_selection_form, FpdForm, CycleAndAircraftForm
-from .utils import MaxFpd, ColumnIndex, SyncReadExcel, ClockToMinutes, UniqueStations, CombinationsGenerator, FlightPerDay, FpdSchedule,  process_combos, optimization
+from .forms import FpdForm, ExcelUploadForm, create_column_index_form, TurnAroundTimeForm, create_hub_selection_form, FpdForm, CycleAndAircraftForm, RoutingSolverForm
+from .utils import MaxFpd, ColumnIndex, SyncReadExcel, ClockToMinutes, UniqueStations, CombinationsGenerator, FlightPerDay, FpdSchedule, ScheduleCache, RouteCoverage, process_combos, optimization
 import pandas as pd
 import json
 import pandas as pd
-from io import StringIO
 import pandas as pd
 from pyomo.util.infeasible import log_infeasible_constraints
 import pyomo.environ as pyo 
@@ -17,6 +16,8 @@ import traceback
 import os
 from django.http import FileResponse, HttpResponseNotFound, HttpResponse, HttpResponseServerError
 from django.http import JsonResponse
+from SkyLinker.artifacts import save_session_frame, load_session_frame, normalize_frame, save_session_artifact, load_session_artifact, redirect_when_expired
+from SkyLinker.solvers import SolverConfig
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,13 +39,8 @@ def upload_excel(request):
                 # Handle the error (e.g., display an error message to the user)
                 return render(request, 'pages/routing.html', {'excel_form': form, 'error_message': str(e)})
 
-            # Convert DataFrame to JSON for session storage
-            flights_df_json = read_excel.get_dataframe().to_json(orient='split')
-            flights_list = read_excel.get_data_list()
-
-            # Store in session
-            request.session['flights_df'] = flights_df_json
-            request.session['flights_list'] = flights_list
+            # Store the DataFrame server-side, the session keeps its handle
+            save_session_frame(request, 'flights_df', normalize_frame(read_excel.get_dataframe()))
 
             return redirect('process_columns')
     else:
@@ -52,14 +48,14 @@ def upload_excel(request):
 
     return render(request, 'pages/routing.html', {'excel_form': form})
 
+@redirect_when_expired('upload_excel')
 def process_columns(request):
     if 'flights_df' not in request.session:
         # Redirect to upload page if session does not contain flight data
         return redirect('upload_excel')
 
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
     # Initialize ColumnIndex with DataFrame
     column_index = ColumnIndex(flights_df)
@@ -113,8 +109,7 @@ def process_columns(request):
             return redirect('turn_around_and_hub_selection')
 
 def process_time_and_stations(request):
-    flights_df_json = request.session.get('flights_df', '{}')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     column_indexes = json.loads(request.session.get('column_indexes', '{}'))
     
     # Debugging log
@@ -179,6 +174,7 @@ def turn_around_and_hub_selection(request):
     })
     
     
+@redirect_when_expired('upload_excel')
 def fpd_decision(request):
     if 'unique_stations' not in request.session:
         return redirect('turn_around_and_hub_selection')
@@ -187,8 +183,7 @@ def fpd_decision(request):
     turn_around_form = TurnAroundTimeForm()
     hub_selection_form = create_hub_selection_form(unique_stations)()
 
-    flights_df_json = request.session['flights_df']
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     departure_minutes = json.loads(request.session['departure_minutes'])
     arrival_minutes = json.loads(request.session['arrival_minutes'])
     TAT = request.session.get('tat', 45)  # Assuming TAT is stored in session
@@ -214,33 +209,30 @@ def fpd_decision(request):
         'max_fpd': max_fpd  # Passing max_fpd to template for informational purposes
     })
     
+@redirect_when_expired('upload_excel')
 def cycle_and_aircraft_input(request):
     if request.method == 'POST':
         form = CycleAndAircraftForm(request.POST)
-        if form.is_valid():
+        solver_form = RoutingSolverForm(request.POST, prefix='solver')
+        if form.is_valid() and solver_form.is_valid():
             days_in_cycle = form.cleaned_data['days_in_cycle']
             number_of_aircrafts = form.cleaned_data['number_of_aircrafts']
 
             request.session['days_in_cycle'] = days_in_cycle
             request.session['number_of_aircrafts'] = number_of_aircrafts
-
-            user_decided_fpd = request.session.get('fpd')
-            combinations_generator = CombinationsGenerator(user_decided_fpd, days_in_cycle)
-            combos = combinations_generator.get_combos()
-
-            request.session['combos'] = json.dumps(combos)
+            request.session['routing_solver_config'] = solver_form.get_solver_config().to_dict()
 
             find_combos(request)
             optimization_step(request)
             return redirect('optimization_step')  # Redirect as needed
     else:
         form = CycleAndAircraftForm()
+        solver_form = RoutingSolverForm(prefix='solver')
 
-    return render(request, 'pages/routing.html', {'cycle_and_aircraft_form': form})
+    return render(request, 'pages/routing.html', {'cycle_and_aircraft_form': form, 'solver_form': solver_form})
 
 def find_combos(request):
-    flights_df_json = request.session['flights_df']
-    flights_df_list = pd.read_json(StringIO(flights_df_json), orient='split').values.tolist()
+    flights_df_list = load_session_frame(request, 'flights_df').values.tolist()
     departure_minutes = json.loads(request.session['departure_minutes'])
     arrival_minutes = json.loads(request.session['arrival_minutes'])
     TAT = request.session.get('turn_around_time', 45)
@@ -253,9 +245,10 @@ def find_combos(request):
     origin_col_index = column_indexes['origin']
     destination_col_index = column_indexes['destination']
     
-    combos = json.loads(request.session['combos'])
+    # The patterns are streamed into process_combos, skipping the flights per day no chain reaches
+    schedule_cache = ScheduleCache(flights_df_list, departure_minutes, arrival_minutes, TAT, origin_col_index, destination_col_index)
+    combos = CombinationsGenerator(fpd, days_in_cycle, schedule_cache.get_flight_chains())
     
-    logger.debug(f"flights_df_json: {flights_df_json}")
     logger.debug(f"flights_df_list: {flights_df_list}")
     logger.debug(f"departure_minutes: {departure_minutes}")
     logger.debug(f"arrival_minutes: {arrival_minutes}")
@@ -266,12 +259,12 @@ def find_combos(request):
     logger.debug(f"fpd: {fpd}")
     logger.debug(f"origin_col_index: {origin_col_index}")
     logger.debug(f"destination_col_index : {destination_col_index }")
-    logger.debug(f"combos: {combos}")
+    logger.debug(f"max fpd of the combos: {combos.max_fpd}")
     
 
-    valid_combos, all_options_lists, total, m, data = process_combos(
+    valid_combos, all_options_lists, total, m, coverage = process_combos(
         combos, flights_df_list, departure_minutes, arrival_minutes, TAT, 
-        origin_col_index, destination_col_index, hubs, days_in_cycle, fpd
+        origin_col_index, destination_col_index, hubs, days_in_cycle, fpd, schedule_cache
     )
     
     # Debugging log
@@ -284,10 +277,11 @@ def find_combos(request):
     request.session['all_options_lists'] = all_options_lists
     request.session['total'] = total
     request.session['m'] = m
-    request.session['data'] = json.dumps(data)
+    save_session_artifact(request, 'route_coverage', coverage)
     
     
     
+@redirect_when_expired('upload_excel')
 def optimization_step(request):
     # Directly access the session data without assuming it's a JSON string.
     # The session data should be directly usable if it was stored as a Python list or dict.
@@ -295,11 +289,10 @@ def optimization_step(request):
     m = request.session.get('m', [])
     
     # Load DataFrame from session
-    flights_df_json = request.session.get('flights_df')
-    flights_df = pd.read_json(StringIO(flights_df_json), orient='split')
+    flights_df = load_session_frame(request, 'flights_df')
     
     TAT_minutes = request.session.get('turn_around_time', [])
-    data = json.loads(request.session.get('data', '[]'))
+    coverage = load_session_artifact(request, 'route_coverage') or RouteCoverage()
     valid_combos = request.session.get('valid_combos', [])
     number_of_aircrafts = int(request.session.get('number_of_aircrafts'))
     
@@ -321,7 +314,9 @@ def optimization_step(request):
     # Debugging log
     #logger.debug(f"data: {data}")
     
-    objective_value, Output_df, routing_result, is_optimized, message = optimization(flights_df, TAT_minutes, all_options_lists, m, data, valid_combos, number_of_aircrafts, flight_number_index, origin_index, departure_index, arrival_index, destination_index, flight_duration_index)
+    # The routing step saves its own solver settings; GLPK when none were chosen
+    solver_config = SolverConfig.from_session(request.session, default_solver='glpk', key='routing_solver_config')
+    objective_value, Output_df, routing_result, is_optimized, message = optimization(flights_df, TAT_minutes, all_options_lists, m, coverage, valid_combos, number_of_aircrafts, flight_number_index, origin_index, departure_index, arrival_index, destination_index, flight_duration_index, solver_config)
     
     if not is_optimized:
         request.session['infeasibility_result'] = routing_result
@@ -0,0 +1,241 @@
+import logging
+import os
+import pickle
+import re
+import time
+import uuid
+from functools import wraps
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib import messages
+from django.shortcuts import redirect
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactExpired(Exception):
+    """Raised when a handle points to an artifact the store no longer has (expired, purged or on another host)."""
+
+
+class ArtifactStore:
+    """Keeps pickled objects (mostly DataFrames) on local disk or in Redis, addressed by a random handle."""
+
+    def __init__(self, backend='disk', location=None, redis_url=None, ttl=60 * 60 * 24 * 14):
+        """
+        Parameters:
+        - backend: str, 'disk' or 'redis'.
+        - location: directory of the disk backend.
+        - redis_url: server of the redis backend.
+        - ttl: int, seconds an artifact is kept after it was written.
+        """
+        if backend not in ('disk', 'redis'):
+            raise ValueError(f"Unknown artifact store backend: {backend}")
+        self.backend = backend
+        self.location = str(location) if location else None
+        self.ttl = int(ttl)
+        self.redis = None
+        if backend == 'redis':
+            import redis
+            self.redis = redis.Redis.from_url(redis_url)
+
+    @staticmethod
+    def is_handle(handle):
+        return isinstance(handle, str) and re.fullmatch(r'[0-9a-f]{32}', handle) is not None
+
+    def path(self, handle):
+        return os.path.join(self.location, f'{handle}.pkl')
+
+    def put(self, obj):
+        """Stores obj and returns its handle."""
+        handle = uuid.uuid4().hex
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.backend == 'redis':
+            self.redis.setex(f'artifact:{handle}', self.ttl, data)
+        else:
+            os.makedirs(self.location, exist_ok=True)
+            with open(self.path(handle), 'wb') as file:
+                file.write(data)
+        return handle
+
+    def get(self, handle):
+        """Returns the stored object, None when the handle is unknown or expired."""
+        if not self.is_handle(handle):
+            return None
+        if self.backend == 'redis':
+            data = self.redis.get(f'artifact:{handle}')
+            return pickle.loads(data) if data is not None else None
+
+        path = self.path(handle)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+
+    def get_required(self, handle):
+        """Returns the stored object, raises ArtifactExpired when the handle is unknown or expired."""
+        obj = self.get(handle)
+        if obj is None:
+            if self.backend == 'disk':
+                raise ArtifactExpired(f"Artifact {handle} is not in {self.location}: it expired, or this process does not share "
+                                      f"the directory with the web server (a Celery worker on another host needs the redis backend).")
+            raise ArtifactExpired(f"Artifact {handle} is not in the redis store, it expired.")
+        return obj
+
+    def delete(self, handle):
+        if not self.is_handle(handle):
+            return
+        if self.backend == 'redis':
+            self.redis.delete(f'artifact:{handle}')
+        else:
+            try:
+                os.remove(self.path(handle))
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self):
+        """
+        Removes the disk artifacts older than the TTL (Redis expires its keys itself).
+        Run hourly by the purge_expired_artifacts beat task, expired artifacts are also dropped when read.
+        """
+        if self.backend == 'redis' or not os.path.isdir(self.location):
+            return
+        expiry = time.time() - self.ttl
+        for entry in os.scandir(self.location):
+            try:
+                if entry.name.endswith('.pkl') and entry.stat().st_mtime < expiry:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+_store = None
+
+
+def get_artifact_store():
+    """Returns the store configured by settings.ARTIFACT_STORE."""
+    global _store
+    if _store is None:
+        config = getattr(settings, 'ARTIFACT_STORE', {})
+        _store = ArtifactStore(
+            backend=config.get('BACKEND', 'disk'),
+            location=config.get('LOCATION', os.path.join(settings.BASE_DIR, 'artifacts')),
+            redis_url=config.get('REDIS_URL'),
+            ttl=config.get('TTL', settings.SESSION_COOKIE_AGE),
+        )
+    return _store
+
+
+def is_date_like(column):
+    """The column names whose values read_json turns into datetimes."""
+    name = str(column).lower()
+    return name.endswith(('_at', '_time')) or name.startswith('timestamp') or name in ('modified', 'date', 'datetime')
+
+
+def normalize_frame(df):
+    """
+    Returns df with the dtypes the planning steps expect of an upload, the ones the split JSON round trip
+    through the session used to give: numeric text columns become int64 (float64 with blanks or decimals),
+    and text (or empty) columns with a date-like name become datetimes when every value parses.
+
+    Called once on every uploaded sheet (read as text), the frames are stored as they are afterwards.
+    """
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object:
+            continue
+        try:
+            numbers = pd.to_numeric(values, errors='raise')
+        except (ValueError, TypeError):
+            if is_date_like(column):
+                try:
+                    df[column] = pd.to_datetime(values, errors='raise')
+                except (ValueError, TypeError, OverflowError):
+                    pass
+            continue
+        if numbers.isna().all() and is_date_like(column):
+            df[column] = pd.to_datetime(numbers)
+        elif numbers.notna().all() and (numbers == np.floor(numbers)).all():
+            df[column] = numbers.astype(np.int64)
+        else:
+            df[column] = numbers.astype(np.float64)
+    return df
+
+
+def put_frame(df):
+    """Stores df and returns its handle."""
+    return get_artifact_store().put(df)
+
+
+def session_handles(value):
+    """Yields the handles of a session value, a handle or a dict / list of them."""
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from session_handles(item)
+    elif ArtifactStore.is_handle(value):
+        yield value
+
+
+def save_session_handles(request, key, value):
+    """Keeps value (a handle, or a dict / list of them) in request.session[key] and deletes the artifacts it replaces."""
+    previous = request.session.get(key)
+    request.session[key] = value
+    kept = set(session_handles(value))
+    for handle in session_handles(previous):
+        if handle not in kept:
+            get_artifact_store().delete(handle)
+
+
+def save_session_frame(request, key, df):
+    """Stores df server-side and keeps only its handle in request.session[key]."""
+    save_session_handles(request, key, put_frame(df))
+
+
+def load_session_frame(request, key):
+    """
+    Returns the DataFrame whose handle is in request.session[key], None if there is none.
+    Raises ArtifactExpired when the session still has the handle but the store dropped the frame.
+    """
+    handle = request.session.get(key)
+    return get_artifact_store().get_required(handle) if handle else None
+
+
+def save_session_artifact(request, key, obj):
+    """Stores any picklable obj server-side and keeps only its handle in request.session[key]."""
+    save_session_handles(request, key, get_artifact_store().put(obj))
+
+
+def load_session_artifact(request, key, missing_ok=False):
+    """
+    Returns the object whose handle is in request.session[key], None if there is none.
+    Raises ArtifactExpired when the store dropped the object, unless missing_ok (for artifacts a step can do without).
+    """
+    handle = request.session.get(key)
+    if not handle:
+        return None
+    return get_artifact_store().get(handle) if missing_ok else get_artifact_store().get_required(handle)
+
+
+def redirect_when_expired(upload_view):
+    """
+    Decorates a planning step view so that data which expired from the artifact store sends the user
+    back to upload_view with a message, instead of failing on the missing DataFrame.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except ArtifactExpired as error:
+                logger.info("Redirecting %s to %s: %s", request.path, upload_view, error)
+                messages.warning(request, "The uploaded data has expired, please upload it again.")
+                return redirect(upload_view)
+        return wrapper
+    return decorator
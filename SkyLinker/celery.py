@@ -24,10 +24,22 @@ app.conf.beat_schedule = {
     'add-every-hour' : {
         'task' : 'send_upcoming_tasks_monthly_email',
         'schedule' : crontab(minute=0)  #crontab(hour=0, minute=0, day_of_month='1') This sets the task to run at 00:00 (midnight) on the first day of each month. Adjust the hour and minute values as needed for your specific scheduling requirements.
-    }
+    },
+    'purge-expired-artifacts-every-hour': {
+        'task': 'purge_expired_artifacts',
+        'schedule': crontab(minute=30),
+    },
 }
 
 
+@app.task(name='purge_expired_artifacts', ignore_result=True)
+def purge_expired_artifacts():
+    """Deletes the artifact store files older than its TTL."""
+    from .artifacts import get_artifact_store
+
+    get_artifact_store().purge_expired()
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
@@ -35,6 +35,7 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = 7000 #new
 LOGIN_URL = '/maintenance' #new
 # LOGIN_REDIRECT_URL = 'maintenance_dashboard' #new
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True  #new
+SESSION_COOKIE_AGE = 60 * 60 * 24 * 14  # Django's default, the artifact store keeps the session DataFrames as long
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'              #new
 EMAIL_HOST = 'smtp.gmail.com'                                              #new
@@ -51,6 +52,16 @@ CELERY_TASK_SERIALIZER = 'json'                                            #new
 CELERY_TIMEZONE = "UTC"                                                    #new
 broker_connection_retry_on_startup = True                                  #new
 
+# Server-side store for the DataFrames passed between planning steps, sessions only keep their handles.
+# The Celery workers read the same store: the 'disk' backend only works when they run on this host (or share
+# LOCATION with it), workers on other hosts need ARTIFACT_STORE_BACKEND=redis.
+ARTIFACT_STORE = {
+    'BACKEND': os.environ.get('ARTIFACT_STORE_BACKEND', 'disk'),             # 'disk' or 'redis'
+    'LOCATION': BASE_DIR / 'artifacts',                                     # disk backend directory
+    'REDIS_URL': CELERY_BROKER_URL,                                         # redis backend server
+    'TTL': SESSION_COOKIE_AGE,                                              # seconds before an artifact expires
+}
+
 # Application definition
 
 INSTALLED_APPS = [
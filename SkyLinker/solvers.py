@@ -0,0 +1,182 @@
+import logging
+
+import numpy as np
+import pyomo.environ as pyo  # also registers the solver plugins with SolverFactory
+from pyomo.opt import Solution, SolverFactory, SolverResults, TerminationCondition
+
+logger = logging.getLogger(__name__)
+
+
+# Pyomo factory name, in-memory APPSI interface and option names of each MIP solver (None when the solver has no such interface or option).
+# CBC has no in-memory interface: APPSI's Cbc still exchanges LP and solution files, so it goes through SolverFactory like GLPK.
+SOLVER_BACKENDS = {
+    'highs': {'label': 'HiGHS', 'factory': 'appsi_highs', 'persistent': 'Highs', 'threads': 'threads', 'time_limit': 'time_limit', 'mip_gap': 'mip_rel_gap'},
+    'cbc': {'label': 'CBC', 'factory': 'cbc', 'persistent': None, 'threads': 'threads', 'time_limit': 'sec', 'mip_gap': 'ratioGap'},
+    'glpk': {'label': 'GLPK', 'factory': 'glpk', 'persistent': None, 'threads': None, 'time_limit': 'tmlim', 'mip_gap': 'mipgap'},
+    'gurobi': {'label': 'Gurobi', 'factory': 'gurobi', 'persistent': 'Gurobi', 'threads': 'Threads', 'time_limit': 'TimeLimit', 'mip_gap': 'MIPGap'},
+}
+
+SOLVER_CHOICES = [(name, backend['label']) for name, backend in SOLVER_BACKENDS.items()]
+
+# Stops that may still leave an incumbent worth returning
+INCUMBENT_CONDITIONS = (
+    TerminationCondition.maxTimeLimit,
+    TerminationCondition.maxIterations,
+    TerminationCondition.maxEvaluations,
+    TerminationCondition.feasible,
+)
+
+
+class SolverConfig:
+    """Which MIP solver a run uses and its threads, wall-clock limit and relative gap."""
+
+    def __init__(self, solver='gurobi', threads=None, time_limit=None, mip_gap=None, return_incumbent=True, persistent=False):
+        """
+        Parameters:
+        - solver: str, one of SOLVER_BACKENDS.
+        - threads: int, threads the solver may use, None for the solver default.
+        - time_limit: float, wall-clock limit in seconds, None for no limit.
+        - mip_gap: float, relative MIP gap (0.01 is 1%), None for the solver default.
+        - return_incumbent: bool, load the best solution found when the solver stops on a limit.
+        - persistent: bool, solve in memory through the solver's APPSI interface and keep it alive for
+          the following solves of this configuration (solvers without one fall back to the file round trip).
+        """
+        if solver not in SOLVER_BACKENDS:
+            raise ValueError(f"Unknown solver: {solver}")
+        self.solver = solver
+        self.threads = int(threads) if threads else None
+        self.time_limit = float(time_limit) if time_limit else None
+        self.mip_gap = float(mip_gap) if mip_gap is not None else None
+        self.return_incumbent = bool(return_incumbent)
+        self.persistent = bool(persistent)
+        self._persistent_solver = None
+        self._persistent_model = None
+
+    @classmethod
+    def from_session(cls, session, default_solver='gurobi', key='solver_config'):
+        """Returns the configuration saved under key by a solver selection step, or the default solver alone."""
+        return cls(**session.get(key, {'solver': default_solver}))
+
+    def to_dict(self):
+        return {'solver': self.solver, 'threads': self.threads, 'time_limit': self.time_limit,
+                'mip_gap': self.mip_gap, 'return_incumbent': self.return_incumbent, 'persistent': self.persistent}
+
+    @staticmethod
+    def is_available(solver):
+        """Whether Pyomo can run the solver on this server."""
+        try:
+            return bool(SolverFactory(SOLVER_BACKENDS[solver]['factory']).available(exception_flag=False))
+        except Exception:
+            return False
+
+    def is_runnable(self):
+        """Whether the interface this configuration solves with, the APPSI one in persistent mode, is installed."""
+        if not self.uses_persistent():
+            return self.is_available(self.solver)
+        try:
+            from pyomo.contrib.appsi import solvers
+            return bool(getattr(solvers, SOLVER_BACKENDS[self.solver]['persistent'])().available())
+        except Exception:
+            return False
+
+    def options(self):
+        """Returns the configured settings under the option names of the selected solver."""
+        backend = SOLVER_BACKENDS[self.solver]
+        options = {}
+        if self.threads and backend['threads']:
+            options[backend['threads']] = self.threads
+        if self.time_limit and backend['time_limit']:
+            options[backend['time_limit']] = int(self.time_limit) if self.solver == 'glpk' else self.time_limit
+        if self.mip_gap is not None and backend['mip_gap']:
+            options[backend['mip_gap']] = self.mip_gap
+        return options
+
+    def uses_persistent(self):
+        return self.persistent and SOLVER_BACKENDS[self.solver]['persistent'] is not None
+
+    def get_persistent_solver(self):
+        """Returns the APPSI solver of this configuration, created on first use and reused afterwards."""
+        if self._persistent_solver is None:
+            from pyomo.contrib.appsi import solvers
+            self._persistent_solver = getattr(solvers, SOLVER_BACKENDS[self.solver]['persistent'])()
+        return self._persistent_solver
+
+    def solve(self, model, warm_start=False):
+        """
+        Solves model and loads its solution when is_solved() accepts the results.
+
+        With warm_start the current values of the model variables are passed as a (partial) MIP start
+        to the solvers that accept one, which are HiGHS and Gurobi in memory and CBC and Gurobi through files.
+
+        In persistent mode the model stays inside the solver, so solving the same model again
+        only sends the changed variables, constraints and objective, and the solution is loaded
+        in one bulk call instead of being parsed back from a solution file.
+
+        Returns:
+        - The Pyomo results object.
+        """
+        if self.uses_persistent():
+            results = self.solve_persistent(model, warm_start)
+        else:
+            opt = SolverFactory(SOLVER_BACKENDS[self.solver]['factory'])
+            kwargs = {'warmstart': True} if warm_start and getattr(opt, 'warm_start_capable', lambda: False)() else {}
+            results = opt.solve(model, load_solutions=False, options=self.options(), **kwargs)
+            if self.is_solved(results):
+                model.solutions.load_from(results)
+        logger.info(f"{SOLVER_BACKENDS[self.solver]['label']} finished: {results.solver.termination_condition}")
+        return results
+
+    def solve_persistent(self, model, warm_start=False):
+        """Solves model with the APPSI solver and returns legacy style results (without the variable values)."""
+        from pyomo.contrib.appsi.base import legacy_solver_status_map, legacy_termination_condition_map
+
+        opt = self.get_persistent_solver()
+        opt.config.load_solution = False
+        setattr(opt, f'{self.solver}_options', self.options())
+        if warm_start:
+            self.set_warm_start(opt, model)
+        appsi_results = opt.solve(model)
+        self._persistent_model = model
+
+        results = SolverResults()
+        results.solver.status = legacy_solver_status_map[appsi_results.termination_condition]
+        results.solver.termination_condition = legacy_termination_condition_map[appsi_results.termination_condition]
+        results.solver.termination_message = str(appsi_results.termination_condition)
+        if appsi_results.best_feasible_objective is not None:
+            results.solution.insert(Solution())  # Marks that the solver holds a feasible solution
+        if self.is_solved(results):
+            appsi_results.solution_loader.load_vars()
+        return results
+
+    def set_warm_start(self, opt, model):
+        """Brings the persistent solver up to date with model and hands it the variable values as a MIP start."""
+        if model is self._persistent_model:
+            opt.update()
+        else:
+            opt.set_instance(model)
+            self._persistent_model = model
+
+        start = [(var, var.value) for var in model.component_data_objects(pyo.Var, active=True)
+                 if var.value is not None and not var.fixed]
+        try:
+            if self.solver == 'gurobi':
+                for var, value in start:
+                    opt.set_var_attr(var, 'Start', value)
+            elif self.solver == 'highs':
+                # APPSI has no warm start for HiGHS, so the start goes straight to the highspy model through
+                # APPSI internals; HiGHS completes a partial start itself
+                columns = opt._pyomo_var_to_solver_var_map
+                start = [(columns[id(var)], value) for var, value in start if id(var) in columns]
+                if start:
+                    indexes, values = zip(*start)
+                    opt._solver_model.setSolution(len(start), np.asarray(indexes, dtype=np.int32), np.asarray(values, dtype=float))
+        except (AttributeError, KeyError, TypeError, ValueError, RuntimeError) as error:
+            # A Pyomo or highspy release that changed these interfaces only costs the warm start
+            logger.warning(f"{SOLVER_BACKENDS[self.solver]['label']} warm start skipped, solving from scratch: {error!r}")
+
+    def is_solved(self, results):
+        """True for an optimal solution, or for an incumbent after a limit when return_incumbent is set."""
+        termination = results.solver.termination_condition
+        if termination == TerminationCondition.optimal:
+            return True
+        return self.return_incumbent and termination in INCUMBENT_CONDITIONS and len(results.solution) > 0